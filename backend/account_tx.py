@@ -0,0 +1,98 @@
+"""
+Winback AccountTx Streaming
+===========================
+Marker-following pagination over an account's transaction history.
+
+`AccountTxStream` walks every page of `AccountTx` for an account within an
+optional ledger range, prefetching the next page while the caller is still
+processing the current one. At most two pages are held in memory, so even
+very long histories stream in constant space.
+
+Usage:
+    async for item in AccountTxStream(client, address, forward=True):
+        ...
+
+    stream = AccountTxStream(client, address, ledger_index_min=last + 1)
+    async for page in stream.pages():
+        ...
+    stream.ledger_index_max  # validated upper bound the server searched
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from xrpl.models.requests import AccountTx
+
+PAGE_SIZE = 200
+
+
+class AccountTxStream:
+    """Async iterator over all AccountTx entries for one account."""
+
+    def __init__(self, client, account: str,
+                 ledger_index_min: int = -1, ledger_index_max: int = -1,
+                 forward: bool = False, page_size: int = PAGE_SIZE,
+                 limit: Optional[int] = None):
+        self.client = client
+        self.account = account
+        self.ledger_index_min = ledger_index_min
+        self.ledger_index_max = ledger_index_max
+        self.forward = forward
+        self.page_size = page_size
+        self.limit = limit
+        self.pages_fetched = 0
+
+    async def _fetch(self, marker: Any, remaining: Optional[int]) -> Dict[str, Any]:
+        """Fetch one page. Returns an empty page if the range has no ledgers yet."""
+        request = AccountTx(
+            account=self.account,
+            ledger_index_min=self.ledger_index_min,
+            ledger_index_max=self.ledger_index_max,
+            forward=self.forward,
+            limit=min(self.page_size, remaining) if remaining else self.page_size,
+            marker=marker
+        )
+        response = await self.client.request(request)
+        self.pages_fetched += 1
+
+        if not response.is_successful():
+            # Requested range starts beyond the latest validated ledger
+            if response.result.get("error") == "lgrIdxsInvalid":
+                return {"transactions": []}
+            raise Exception(f"AccountTx failed: {response.result}")
+        return response.result
+
+    async def pages(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield pages of transactions, prefetching the next page in the background."""
+        yielded = 0
+        pending = asyncio.ensure_future(self._fetch(None, self.limit))
+
+        try:
+            while pending is not None:
+                result = await pending
+                pending = None
+
+                # Pin the upper bound so later pages see the same ledger range
+                if self.ledger_index_max == -1 and result.get("ledger_index_max"):
+                    self.ledger_index_max = result["ledger_index_max"]
+
+                transactions = result.get("transactions", [])
+                if self.limit is not None:
+                    transactions = transactions[:self.limit - yielded]
+
+                marker = result.get("marker")
+                yielded += len(transactions)
+                remaining = None if self.limit is None else self.limit - yielded
+                if marker and (remaining is None or remaining > 0):
+                    pending = asyncio.ensure_future(self._fetch(marker, remaining))
+
+                if transactions:
+                    yield transactions
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        async for page in self.pages():
+            for item in page:
+                yield item
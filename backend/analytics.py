@@ -0,0 +1,129 @@
+"""
+Winback Analytics Aggregator
+============================
+Materialized platform totals maintained incrementally from the ledger index.
+
+Every event inserted into the index is applied to the running totals exactly
+once, inside the same SQLite transaction as the insert. The aggregator keeps
+its own checkpoint (last applied event row and ledger index) so restarts pick
+up where they left off instead of rescanning the chain or the event table.
+"""
+
+import sqlite3
+from typing import Any, Dict
+
+from memos import memo_decoder
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics_totals (
+    account TEXT PRIMARY KEY,
+    total_purchases INTEGER NOT NULL DEFAULT 0,
+    total_predictions INTEGER NOT NULL DEFAULT 0,
+    total_settlements INTEGER NOT NULL DEFAULT 0,
+    total_wins INTEGER NOT NULL DEFAULT 0,
+    total_losses INTEGER NOT NULL DEFAULT 0,
+    total_cashback_paid REAL NOT NULL DEFAULT 0,
+    total_charges REAL NOT NULL DEFAULT 0,
+    unique_users INTEGER NOT NULL DEFAULT 0,
+    last_event_rowid INTEGER NOT NULL DEFAULT 0,
+    checkpoint_ledger INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_users (
+    account TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (account, user_id)
+);
+"""
+
+COUNTERS = (
+    "total_purchases",
+    "total_predictions",
+    "total_settlements",
+    "total_wins",
+    "total_losses",
+    "total_cashback_paid",
+    "total_charges",
+    "unique_users",
+)
+
+
+class AnalyticsAggregator:
+    """Incrementally maintained `/analytics` totals, one row per account."""
+
+    def __init__(self, index):
+        self.index = index
+        # Catches up with events indexed before the aggregator existed
+        index.add_listener(self, SCHEMA)
+
+    def apply(self, conn: sqlite3.Connection, account: str) -> int:
+        """
+        Fold events newer than the checkpoint into the totals.
+        Must run inside the caller's transaction. Returns events applied.
+        """
+        conn.execute(
+            "INSERT OR IGNORE INTO analytics_totals (account) VALUES (?)", (account,)
+        )
+        state = conn.execute(
+            "SELECT * FROM analytics_totals WHERE account = ?", (account,)
+        ).fetchone()
+        totals = {k: state[k] for k in COUNTERS}
+        last_rowid = state["last_event_rowid"]
+        checkpoint = state["checkpoint_ledger"]
+
+        rows = self.index.events_since(account, last_rowid)
+        if not rows:
+            return 0
+
+        for row in rows:
+            memo_json = memo_decoder.payload(
+                row["tx_hash"], row["memo_index"], row["payload"], caller="analytics"
+            )
+            tx_type = row["type"]
+            user_id = memo_json.get("user_id")
+
+            if user_id:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO analytics_users (account, user_id) VALUES (?, ?)",
+                    (account, str(user_id))
+                )
+                totals["unique_users"] += cur.rowcount
+
+            if tx_type == "PURCHASE":
+                totals["total_purchases"] += 1
+
+            elif tx_type == "PREDICTION_CONFIG":
+                totals["total_predictions"] += 1
+
+            elif tx_type == "SETTLEMENT":
+                totals["total_settlements"] += 1
+
+                if memo_json.get("outcome") == "win":
+                    totals["total_wins"] += 1
+                    totals["total_cashback_paid"] += memo_json.get("cashback_amount", 0)
+                elif memo_json.get("outcome") == "loss":
+                    totals["total_losses"] += 1
+                    totals["total_charges"] += abs(memo_json.get("cashback_amount", 0))
+
+            last_rowid = row["rowid"]
+            checkpoint = max(checkpoint, row["ledger_index"])
+
+        conn.execute(
+            f"""UPDATE analytics_totals SET
+                {", ".join(f"{k} = ?" for k in COUNTERS)},
+                last_event_rowid = ?, checkpoint_ledger = ?
+                WHERE account = ?""",
+            (*(totals[k] for k in COUNTERS), last_rowid, checkpoint, account)
+        )
+        return len(rows)
+
+    def snapshot(self, account: str) -> Dict[str, Any]:
+        """Current totals for an account (single-row lookup)."""
+        row = self.index.account_row("analytics_totals", account)
+        if row is None:
+            stats = {k: 0 for k in COUNTERS}
+            stats["checkpoint_ledger"] = 0
+            return stats
+        stats = {k: row[k] for k in COUNTERS}
+        stats["checkpoint_ledger"] = row["checkpoint_ledger"]
+        return stats
@@ -0,0 +1,145 @@
+"""
+Winback Balance Cache
+=====================
+Cached, concurrency-bounded XRP balance lookups.
+
+Wallet endpoints used to call `AccountInfo` once per wallet, one after the
+other, on every request. Balances are now cached per address together with
+the validated ledger they were read at. An entry is dropped when a
+transaction touching the account is seen (pushed by the ledger subscription
+or returned by our own submissions). Only accounts the live subscription
+watches get every such transaction pushed, so only their entries are kept
+until then; all others also expire after a short TTL of roughly one
+ledger close.
+
+Lookups for many addresses run concurrently behind a semaphore, and
+concurrent lookups of the same address share one request.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from xrpl.models.requests import AccountInfo
+
+LOOKUP_CONCURRENCY = 8
+BALANCE_TTL_SECONDS = 4.0
+
+
+class Balance:
+    """An account's XRP balance as of a validated ledger."""
+
+    def __init__(self, address: str, drops: Optional[int], ledger_index: Optional[int]):
+        self.address = address
+        self.drops = drops              # None if the account does not exist
+        self.ledger_index = ledger_index
+        self.fetched_at = time.monotonic()
+
+    @property
+    def xrp(self) -> float:
+        return (self.drops or 0) / 1_000_000
+
+
+class BalanceCache:
+    """Per-address balance cache with bounded-concurrency fan-out."""
+
+    def __init__(self, client, concurrency: int = LOOKUP_CONCURRENCY,
+                 ttl_seconds: float = BALANCE_TTL_SECONDS,
+                 watched: Callable[[str], bool] = lambda address: False):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        # Addresses for which watched() is true get every invalidation pushed,
+        # so their entries don't expire
+        self.watched = watched
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._entries: Dict[str, Balance] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._touched: Dict[str, int] = {}  # last ledger that changed each address
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _fresh(self, entry: Balance) -> bool:
+        if (entry.ledger_index or 0) < self._touched.get(entry.address, 0):
+            return False
+        return self.watched(entry.address) or time.monotonic() - entry.fetched_at < self.ttl_seconds
+
+    async def _fetch(self, address: str) -> Balance:
+        async with self._semaphore:
+            response = await self.client.request(AccountInfo(
+                account=address,
+                ledger_index="validated"
+            ))
+        result = response.result
+        if not response.is_successful():
+            if result.get("error") == "actNotFound":
+                return Balance(address, None, result.get("ledger_index"))
+            raise Exception(f"AccountInfo failed for {address}: {result}")
+        return Balance(address, int(result["account_data"]["Balance"]), result.get("ledger_index"))
+
+    async def get(self, address: str) -> Balance:
+        """Cached balance for one address (one shared request on a miss)."""
+        entry = self._entries.get(address)
+        if entry is not None and self._fresh(entry):
+            self.hits += 1
+            return entry
+
+        if address in self._in_flight:
+            self.hits += 1
+            return await asyncio.shield(self._in_flight[address])
+
+        self.misses += 1
+        future = asyncio.ensure_future(self._fetch(address))
+        self._in_flight[address] = future
+        try:
+            entry = await asyncio.shield(future)
+        finally:
+            self._in_flight.pop(address, None)
+        self._entries[address] = entry
+        return entry
+
+    async def get_many(self, addresses: Iterable[str]) -> List[Any]:
+        """Balances for many addresses concurrently. Failed lookups come back as exceptions."""
+        return await asyncio.gather(*(self.get(a) for a in addresses), return_exceptions=True)
+
+    def cached(self, address: str) -> Optional[Balance]:
+        """Last known balance without any network call (may be stale)."""
+        return self._entries.get(address)
+
+    def invalidate(self, address: str, ledger_index: Optional[int] = None):
+        """Mark an address's balance as changed in `ledger_index` (or just now)."""
+        if ledger_index is not None:
+            # Also rejects a lookup in flight that read an older ledger
+            self._touched[address] = max(ledger_index, self._touched.get(address, 0))
+        entry = self._entries.get(address)
+        if entry is not None and (ledger_index is None or not self._fresh(entry)):
+            del self._entries[address]
+            self.invalidations += 1
+
+    def invalidate_touched(self, meta: Dict[str, Any], ledger_index: Optional[int] = None):
+        """Invalidate every account whose AccountRoot a transaction modified."""
+        for address in affected_accounts(meta):
+            self.invalidate(address, ledger_index)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "in_flight": len(self._in_flight),
+        }
+
+
+def affected_accounts(meta: Dict[str, Any]) -> List[str]:
+    """Addresses whose AccountRoot was created, modified or deleted per a tx's metadata."""
+    accounts = []
+    for node in meta.get("AffectedNodes", []):
+        entry = next(iter(node.values()))
+        if entry.get("LedgerEntryType") != "AccountRoot":
+            continue
+        fields = entry.get("FinalFields") or entry.get("NewFields") or {}
+        if fields.get("Account"):
+            accounts.append(fields["Account"])
+    return accounts
@@ -0,0 +1,141 @@
+"""
+Winback Memo Batching
+=====================
+Packs many Winback memos into as few ledger transactions as possible.
+
+The XRP Ledger caps a transaction's `Memos` field at 1 KB in binary form, so
+memos are packed greedily into groups that fit under that limit and each
+group goes out as one transaction.
+
+`MemoBatcher` also coalesces single memos that arrive within a short window
+(e.g. concurrent checkouts) into shared transactions. Every caller still gets
+back the validated response for its transaction and the index of its memo.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+from xrpl.core.binarycodec import encode
+from xrpl.models.transactions import Memo
+
+MAX_MEMOS_BYTES = 1024
+
+SubmitGroup = Callable[[List[Memo]], Awaitable[Any]]
+
+
+def memos_size(memos: List[Memo]) -> int:
+    """Serialized size in bytes of a Memos field holding `memos`."""
+    return len(encode({"Memos": [{"Memo": _memo_json(m)} for m in memos]})) // 2
+
+
+def _memo_json(memo: Memo) -> dict:
+    fields = {
+        "MemoData": memo.memo_data,
+        "MemoType": memo.memo_type,
+        "MemoFormat": memo.memo_format,
+    }
+    return {k: v for k, v in fields.items() if v is not None}
+
+
+def pack_memos(memos: List[Memo], max_bytes: int = MAX_MEMOS_BYTES) -> List[List[int]]:
+    """Greedily group memo positions so each group's Memos field fits in `max_bytes`."""
+    groups: List[List[int]] = []
+    current: List[int] = []
+    for i, memo in enumerate(memos):
+        if memos_size([memo]) > max_bytes:
+            raise ValueError(f"Memo {i} alone exceeds {max_bytes} bytes")
+        candidate = current + [i]
+        if current and memos_size([memos[j] for j in candidate]) > max_bytes:
+            groups.append(current)
+            current = [i]
+        else:
+            current = candidate
+    if current:
+        groups.append(current)
+    return groups
+
+
+class MemoBatcher:
+    """Coalesces memos into shared transactions submitted via `submit_group`."""
+
+    def __init__(self, submit_group: SubmitGroup, window_seconds: float = 0.05,
+                 max_bytes: int = MAX_MEMOS_BYTES):
+        self.submit_group = submit_group
+        self.window_seconds = window_seconds
+        self.max_bytes = max_bytes
+        self._pending: List[Tuple[Memo, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks, so hold them until they finish
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.memos_submitted = 0
+        self.transactions_submitted = 0
+
+    async def add(self, memo: Memo) -> Tuple[Any, int]:
+        """Queue one memo. Returns (validated response, memo index in that tx)."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((memo, future))
+
+        if self.window_seconds <= 0 or memos_size([m for m, _ in self._pending]) >= self.max_bytes:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window_seconds, self._flush)
+        return await future
+
+    async def add_many(self, memos: List[Memo]) -> List[Any]:
+        """Queue many memos and flush at once. Returns a result or exception per memo."""
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in memos]
+        self._pending.extend(zip(memos, futures))
+        self._flush()
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._submit(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Submit anything still waiting for its window and wait for in-flight groups."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _submit(self, batch: List[Tuple[Memo, asyncio.Future]]):
+        memos = [m for m, _ in batch]
+        try:
+            groups = pack_memos(memos, self.max_bytes)
+        except ValueError:
+            # Fall back to one memo per transaction so only the oversized one fails
+            groups = [[i] for i in range(len(memos))]
+
+        async def send(group: List[int]):
+            try:
+                if memos_size([memos[i] for i in group]) > self.max_bytes:
+                    raise ValueError(f"Memos exceed {self.max_bytes} bytes")
+                response = await self.submit_group([memos[i] for i in group])
+                self.transactions_submitted += 1
+                self.memos_submitted += len(group)
+                for memo_index, i in enumerate(group):
+                    if not batch[i][1].done():
+                        batch[i][1].set_result((response, memo_index))
+            except Exception as e:
+                for i in group:
+                    if not batch[i][1].done():
+                        batch[i][1].set_exception(e)
+
+        await asyncio.gather(*(send(g) for g in groups))
+
+    def stats(self):
+        return {
+            "window_seconds": self.window_seconds,
+            "pending": len(self._pending),
+            "in_flight": len(self._tasks),
+            "memos_submitted": self.memos_submitted,
+            "transactions_submitted": self.transactions_submitted,
+        }
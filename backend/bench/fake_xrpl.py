@@ -0,0 +1,509 @@
+"""
+In-process rippled stand-in
+===========================
+A fake XRPL node for load tests, so benchmarks don't depend on the public
+testnet or its faucet.
+
+`FakeRippled` answers the JSON-RPC methods this service uses (`account_tx`,
+`account_info`, `account_objects`, `server_info`, `fee`, `ledger`, `submit`,
+`tx`) from in-memory account state:
+
+- ledgers close every `close_seconds`; submitted transactions are checked
+  against the account's Sequence / Tickets right away and validate at the
+  next close (or expire once their LastLedgerSequence has passed)
+- `seed_history` fills an account with any number of Winback memo events
+- `latency` / `jitter` delay every RPC, and `error_rate` fails that share of
+  them with `error` (a rippled error code such as `tooBusy`, or `"http"` for
+  an HTTP 503)
+
+Plug it in with `client.transport = rippled.transport()` on a
+`PooledJsonRpcClient` (so pooling, hedging and coalescing stay in the loop)
+and `rippled.faucet` in place of `generate_faucet_wallet`.
+Signatures are not checked.
+"""
+
+import asyncio
+import binascii
+import bisect
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from xrpl.core.addresscodec import encode_classic_address
+from xrpl.core.binarycodec import decode as decode_blob
+from xrpl.wallet import Wallet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import memo_codec  # noqa: E402
+
+RIPPLE_EPOCH = 946684800
+FIRST_LEDGER = 1_000_000
+FAUCET_DROPS = 1_000 * 1_000_000
+BASE_FEE = "10"
+DEFAULT_PAGE = 200
+MAX_PAGE = 400
+SEED_TX_PER_LEDGER = 4
+
+MARKETS = ["KXFEDDECISION-26MAR-H0", "KXCPI-26FEB-T3.0", "KXBTC-26DEC31-T150000",
+           "KXNBAFINALS-26-BOS", "KXRAIN-NYC-26MAR"]
+ITEMS = [("Wireless Headphones", "🎧"), ("Running Shoes", "👟"), ("Coffee Grinder", "☕"),
+         ("Desk Lamp", "💡"), ("Backpack", "🎒")]
+
+
+class _Account:
+    __slots__ = ("address", "balance", "sequence", "tickets", "history", "keys")
+
+    def __init__(self, address: str, balance: int, sequence: int):
+        self.address = address
+        self.balance = balance          # validated balance, drops
+        self.sequence = sequence        # next Sequence in the open ledger
+        self.tickets: set = set()
+        self.history: List[Dict[str, Any]] = []         # account_tx entries, oldest first
+        self.keys: List[Tuple[int, int]] = []           # (ledger_index, tx_index) of each
+
+
+def _failure(code: str, **fields: Any) -> Dict[str, Any]:
+    return dict(fields, error=code)
+
+
+def tx_hash(blob: str) -> str:
+    """Transaction ID: SHA-512Half of the `TXN\\0` prefix + signed blob."""
+    return hashlib.sha512(b"TXN\x00" + binascii.unhexlify(blob)).hexdigest()[:64].upper()
+
+
+def winback_memo(payload: Dict[str, Any], memo_format: str = "v2") -> Dict[str, Any]:
+    """A Memos entry the way main.create_memo writes it."""
+    data = memo_codec.encode(payload) if memo_format == "v2" else None
+    if data is not None:
+        memo_type, memo_data, fmt = memo_codec.MEMO_TYPE_V2, data, memo_codec.MEMO_FORMAT_V2
+    else:
+        memo_type, memo_data, fmt = memo_codec.MEMO_TYPE_V1, json.dumps(payload).encode(), "json"
+    return {"Memo": {
+        "MemoType": memo_type.encode().hex().upper(),
+        "MemoData": memo_data.hex().upper(),
+        "MemoFormat": fmt.encode().hex().upper(),
+    }}
+
+
+class FakeRippled:
+    """In-memory XRPL node answering JSON-RPC requests."""
+
+    def __init__(self, close_seconds: float = 1.0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error: str = "tooBusy", faucet_latency: float = 0.0,
+                 network_id: int = 1, seed: Optional[int] = None):
+        self.close_seconds = close_seconds
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error = error
+        self.faucet_latency = faucet_latency
+        self.network_id = network_id
+        self.random = random.Random(seed)
+
+        self.accounts: Dict[str, _Account] = {}
+        self.ledger_index = FIRST_LEDGER
+        self._started = time.monotonic()
+        self._closed_ledgers = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._txs: Dict[str, Dict[str, Any]] = {}
+        self._ledger_txs: Dict[int, List[str]] = {}
+        self._seed_ledger = FIRST_LEDGER // 2
+        self._seed_count = 0
+        self._seed_txs = 0
+
+        self.calls: Counter = Counter()
+        self.errors_injected = 0
+        self.faucet_calls = 0
+        self.validated = 0
+        self.expired = 0
+
+    # --- Ledger clock ---
+    def _close_time(self, ledger_index: int) -> int:
+        """Ripple-epoch close time; ledgers are spread `close_seconds` apart up to now."""
+        now = int(time.time()) - RIPPLE_EPOCH
+        return now - int((self.ledger_index - ledger_index) * max(self.close_seconds, 1.0))
+
+    def advance(self):
+        """Close every ledger that is due since the last request."""
+        if self.close_seconds <= 0:
+            due = self._closed_ledgers + (1 if self._pending else 0)
+        else:
+            due = int((time.monotonic() - self._started) / self.close_seconds)
+        while self._closed_ledgers < due:
+            self._closed_ledgers += 1
+            self._close()
+
+    def close_ledger(self):
+        """Close one ledger now (for close_seconds=0 or tests)."""
+        self._closed_ledgers += 1
+        self._started -= self.close_seconds
+        self._close()
+
+    def _close(self):
+        self.ledger_index += 1
+        ledger = self.ledger_index
+        date = int(time.time()) - RIPPLE_EPOCH
+        pending, self._pending = self._pending, []
+        hashes = []
+        for tx in pending:
+            if tx.get("LastLedgerSequence", ledger) < ledger:
+                self.expired += 1
+                continue
+            entry = self._apply(tx, ledger, len(hashes), date)
+            self._txs[entry["hash"]] = entry
+            hashes.append(entry["hash"])
+        self._ledger_txs[ledger] = hashes
+        self.validated += len(hashes)
+
+    def _apply(self, tx: Dict[str, Any], ledger: int, index: int, date: int) -> Dict[str, Any]:
+        sender = self.accounts[tx["Account"]]
+        sender.balance -= int(tx.get("Fee", BASE_FEE))
+        touched = [sender]
+        result = "tesSUCCESS"
+        if tx["TransactionType"] == "Payment" and isinstance(tx.get("Amount"), str):
+            amount = int(tx["Amount"])
+            if amount > sender.balance:
+                result = "tecUNFUNDED_PAYMENT"
+            else:
+                dest = self._account(tx["Destination"], create=True)
+                sender.balance -= amount
+                dest.balance += amount
+                touched.append(dest)
+        tx = dict(tx, date=date)
+        entry = {
+            "hash": tx.pop("hash"),
+            "ledger_index": ledger,
+            "validated": True,
+            "tx_json": tx,
+            "meta": {
+                "TransactionIndex": index,
+                "TransactionResult": result,
+                "AffectedNodes": [{"ModifiedNode": {
+                    "LedgerEntryType": "AccountRoot",
+                    "FinalFields": {"Account": a.address, "Balance": str(a.balance)},
+                }} for a in touched],
+            },
+        }
+        for account in dict.fromkeys(touched):
+            account.history.append(entry)
+            account.keys.append((ledger, index))
+        return entry
+
+    def _account(self, address: str, create: bool = False) -> Optional[_Account]:
+        account = self.accounts.get(address)
+        if account is None and create:
+            account = self.accounts[address] = _Account(address, 0, self.ledger_index)
+        return account
+
+    # --- Setup helpers ---
+    def fund(self, address: str, drops: int = FAUCET_DROPS):
+        self._account(address, create=True).balance += drops
+
+    async def faucet(self, client=None, wallet: Optional[Wallet] = None, **kwargs) -> Wallet:
+        """Stand-in for xrpl-py's generate_faucet_wallet."""
+        self.faucet_calls += 1
+        if self.faucet_latency:
+            await asyncio.sleep(self.faucet_latency)
+        wallet = wallet or Wallet.create()
+        self.fund(wallet.address)
+        return wallet
+
+    def seed_history(self, account: str, count: int, users: int = 20,
+                     memo_format: str = "v2") -> Dict[str, List[str]]:
+        """
+        Append `count` validated Winback events to `account`'s history: purchases,
+        their predictions, and settlements + cashback payments for about half of them.
+        Returns the user, purchase, position and market IDs used.
+        """
+        owner = self._account(account, create=True)
+        destinations = [encode_classic_address(hashlib.sha256(f"user{u}".encode()).digest()[:20])
+                        for u in range(users)]
+        made = {"users": [str(u) for u in range(users)], "purchases": [], "positions": [],
+                "markets": list(MARKETS), "hashes": []}
+        written = 0
+        while written < count:
+            n = self._seed_count
+            self._seed_count += 1
+            user = n % users
+            purchase_id, position_id = f"pur_{n:07d}", f"pos_{n:07d}"
+            market = MARKETS[n % len(MARKETS)]
+            item, icon = ITEMS[n % len(ITEMS)]
+            amount = round(5 + (n * 7919 % 50000) / 100, 2)
+            entry = self.random.choice([40.0, 55.0, 62.0, 71.0])
+            final = self.random.choice([20.0, 48.0, 65.0, 90.0])
+            pnl = round(amount * max(-5.0, min(20.0, final - entry)) / 100, 2)
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(RIPPLE_EPOCH + self._close_time(self._seed_ledger)))
+            events = [
+                ("AccountSet", None, {
+                    "type": "PURCHASE", "user_id": user, "purchase_id": purchase_id, "item": item,
+                    "icon": icon, "amount": amount, "timestamp": stamp, "status": "unconfigured"}),
+                ("AccountSet", None, {
+                    "type": "PREDICTION_CONFIG", "user_id": user, "position_id": position_id,
+                    "purchase_id": purchase_id, "market_ticker": market,
+                    "market_title": f"{market} resolves YES", "direction": "YES" if n % 3 else "NO",
+                    "entry_price": entry, "max_reward_pct": 20.0, "max_loss_pct": 5.0,
+                    "time_limit_days": 30, "timestamp": stamp}),
+            ]
+            if n % 2:
+                events.append(("AccountSet", None, {
+                    "type": "SETTLEMENT", "user_id": user, "position_id": position_id,
+                    "market_ticker": market, "outcome": "win" if pnl > 0 else "loss",
+                    "entry_price": entry, "final_price": final, "settlement_reason": "time_limit",
+                    "cashback_amount": pnl, "roi": round(pnl / amount * 100, 2), "timestamp": stamp}))
+                if pnl > 0:
+                    events.append(("Payment", destinations[user], {
+                        "type": "CASHBACK_PAYMENT", "position_id": position_id,
+                        "amount_usd": pnl, "amount_xrp": round(pnl * 0.01, 6),
+                        "roi": round(pnl / amount * 100, 2)}))
+
+            for tx_type, destination, payload in events[:count - written]:
+                self._seed_event(owner, tx_type, destination, payload, memo_format, made)
+                written += 1
+            made["purchases"].append(purchase_id)
+            made["positions"].append(position_id)
+
+        order = sorted(range(len(owner.keys)), key=owner.keys.__getitem__)
+        owner.history = [owner.history[i] for i in order]
+        owner.keys = [owner.keys[i] for i in order]
+        return made
+
+    def _seed_event(self, owner: _Account, tx_type: str, destination: Optional[str],
+                    payload: Dict[str, Any], memo_format: str, made: Dict[str, List[str]]):
+        ledger, index = self._seed_ledger, self._seed_txs % SEED_TX_PER_LEDGER
+        self._seed_txs += 1
+        if index == SEED_TX_PER_LEDGER - 1:
+            self._seed_ledger += 1
+            if self._seed_ledger >= self.ledger_index:
+                self.ledger_index = self._seed_ledger + 1
+        digest = hashlib.sha512(f"{owner.address}:{ledger}:{index}:{json.dumps(payload)}".encode())
+        tx = {
+            "Account": owner.address, "TransactionType": tx_type, "Fee": BASE_FEE,
+            "Sequence": owner.sequence, "Flags": 0, "date": self._close_time(ledger),
+            "Memos": [winback_memo(payload, memo_format)],
+        }
+        owner.sequence += 1
+        if destination:
+            tx["Destination"] = destination
+            tx["Amount"] = str(int(payload["amount_xrp"] * 1_000_000))
+        entry = {
+            "hash": digest.hexdigest()[:64].upper(),
+            "ledger_index": ledger,
+            "validated": True,
+            "tx_json": tx,
+            "meta": {"TransactionIndex": index, "TransactionResult": "tesSUCCESS", "AffectedNodes": []},
+        }
+        owner.history.append(entry)
+        owner.keys.append((ledger, index))
+        self._txs[entry["hash"]] = entry
+        made["hashes"].append(entry["hash"])
+
+    # --- JSON-RPC ---
+    def transport(self) -> httpx.AsyncBaseTransport:
+        return _Transport(self)
+
+    async def handle(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Answer one JSON-RPC request body. Returns (HTTP status, response JSON)."""
+        method = body.get("method")
+        params = (body.get("params") or [{}])[0]
+        self.calls[method] += 1
+
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors_injected += 1
+            if self.error == "http":
+                return 503, {}
+            return 200, {"result": _failure(self.error, status="error")}
+
+        self.advance()
+        handler = getattr(self, f"_rpc_{method}", None)
+        result = handler(params) if handler is not None else _failure("unknownCmd")
+        return 200, {"result": dict(result, status="error" if "error" in result else "success")}
+
+
+    def _rpc_server_info(self, params):
+        return {"info": {
+            "build_version": "2.3.0",
+            "network_id": self.network_id,
+            "server_state": "full",
+            "complete_ledgers": f"{FIRST_LEDGER // 2}-{self.ledger_index}",
+            "validated_ledger": {
+                "seq": self.ledger_index,
+                "age": 1,
+                "base_fee_xrp": 0.00001,
+                "reserve_base_xrp": 1,
+                "reserve_inc_xrp": 0.2,
+            },
+        }}
+
+    def _rpc_fee(self, params):
+        return {
+            "current_ledger_size": str(len(self._pending)),
+            "current_queue_size": "0",
+            "drops": {"base_fee": BASE_FEE, "median_fee": "5000", "minimum_fee": BASE_FEE,
+                      "open_ledger_fee": BASE_FEE},
+            "expected_ledger_size": "1000",
+            "ledger_current_index": self.ledger_index + 1,
+            "max_queue_size": "2000",
+        }
+
+    def _rpc_ledger(self, params):
+        ledger = params.get("ledger_index", "validated")
+        if ledger in ("current", "closed", "validated"):
+            ledger = self.ledger_index + (1 if ledger == "current" else 0)
+        result = {
+            "ledger_index": int(ledger),
+            "ledger_hash": hashlib.sha256(str(ledger).encode()).hexdigest().upper(),
+            "validated": int(ledger) <= self.ledger_index,
+            "ledger": {"ledger_index": str(ledger), "closed": int(ledger) <= self.ledger_index,
+                       "close_time": self._close_time(int(ledger))},
+        }
+        if params.get("transactions"):
+            hashes = self._ledger_txs.get(int(ledger), [])
+            result["ledger"]["transactions"] = (
+                [self._txs[h] for h in hashes] if params.get("expand") else list(hashes)
+            )
+        return result
+
+    def _rpc_account_info(self, params):
+        account = self.accounts.get(params.get("account"))
+        if account is None:
+            return _failure("actNotFound", account=params.get("account"))
+        current = params.get("ledger_index") == "current"
+        result = {"account_data": {
+            "Account": account.address,
+            "Balance": str(account.balance),
+            "Sequence": account.sequence,
+            "OwnerCount": len(account.tickets),
+            "TicketCount": len(account.tickets),
+        }}
+        if current:
+            result["ledger_current_index"] = self.ledger_index + 1
+        else:
+            result["ledger_index"] = self.ledger_index
+            result["validated"] = True
+        return result
+
+    def _rpc_account_objects(self, params):
+        account = self.accounts.get(params.get("account"))
+        if account is None:
+            return _failure("actNotFound")
+        tickets = sorted(account.tickets) if params.get("type") in (None, "ticket") else []
+        return {"account": account.address, "ledger_index": self.ledger_index, "validated": True,
+                "account_objects": [{"LedgerEntryType": "Ticket", "Account": account.address,
+                                     "TicketSequence": t} for t in tickets]}
+
+    def _rpc_account_tx(self, params):
+        account = self.accounts.get(params.get("account"))
+        if account is None:
+            return _failure("actNotFound")
+        low = params.get("ledger_index_min", -1)
+        high = params.get("ledger_index_max", -1)
+        low = FIRST_LEDGER // 2 if low in (-1, None) else low
+        high = self.ledger_index if high in (-1, None) else min(high, self.ledger_index)
+        limit = min(params.get("limit") or DEFAULT_PAGE, MAX_PAGE)
+        forward = bool(params.get("forward"))
+        marker = params.get("marker")
+
+        start = bisect.bisect_left(account.keys, (low, -1))
+        end = bisect.bisect_right(account.keys, (high, 1 << 31))
+        if marker:
+            key = (marker["ledger"], marker["seq"])
+            if forward:
+                start = max(start, bisect.bisect_left(account.keys, key))
+            else:
+                end = min(end, bisect.bisect_right(account.keys, key))
+
+        if forward:
+            page = account.history[start:start + limit]
+            more = start + limit < end
+            next_key = account.keys[start + limit] if more else None
+        else:
+            page = account.history[max(start, end - limit):end][::-1]
+            more = end - limit > start
+            next_key = account.keys[end - limit - 1] if more else None
+
+        result = {"account": account.address, "ledger_index_min": low, "ledger_index_max": high,
+                  "limit": limit, "validated": True, "transactions": page}
+        if next_key:
+            result["marker"] = {"ledger": next_key[0], "seq": next_key[1]}
+        return result
+
+    def _rpc_tx(self, params):
+        tx_id = params.get("transaction")
+        entry = self._txs.get(tx_id)
+        if entry is not None:
+            return entry
+        for tx in self._pending:
+            if tx["hash"] == tx_id:
+                return {"hash": tx_id, "validated": False,
+                        "tx_json": {k: v for k, v in tx.items() if k != "hash"}}
+        return _failure("txnNotFound")
+
+    def _rpc_submit(self, params):
+        blob = params.get("tx_blob")
+        try:
+            tx = decode_blob(blob)
+        except Exception as e:
+            return _failure("invalidTransaction", error_exception=str(e))
+        tx["hash"] = tx_hash(blob)
+        account = self.accounts.get(tx["Account"])
+
+        def answer(code: str, message: str = ""):
+            return {"engine_result": code, "engine_result_message": message, "tx_blob": blob,
+                    "tx_json": tx, "accepted": code == "tesSUCCESS"}
+
+        if account is None:
+            return answer("terNO_ACCOUNT", "Source account does not exist.")
+        if tx.get("LastLedgerSequence", self.ledger_index + 1) <= self.ledger_index:
+            return answer("tefMAX_LEDGER", "Ledger sequence too high.")
+        ticket = tx.get("TicketSequence")
+        if ticket is not None:
+            if ticket not in account.tickets:
+                return answer("tefNO_TICKET", "Ticket is not in ledger.")
+            account.tickets.discard(ticket)
+        elif tx["Sequence"] < account.sequence:
+            return answer("tefPAST_SEQ", "This sequence number has already passed.")
+        elif tx["Sequence"] > account.sequence:
+            return answer("terPRE_SEQ", "Missing/inapplicable prior transaction.")
+        else:
+            account.sequence += 1
+        if tx["TransactionType"] == "TicketCreate":
+            first = tx["Sequence"] + 1 if ticket is None else account.sequence
+            account.tickets.update(range(first, first + tx["TicketCount"]))
+            account.sequence = max(account.sequence, first + tx["TicketCount"])
+
+        self._pending.append(tx)
+        return answer("tesSUCCESS", "The transaction was applied. Only final in a validated ledger.")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ledger_index": self.ledger_index,
+            "accounts": len(self.accounts),
+            "pending": len(self._pending),
+            "validated": self.validated,
+            "expired": self.expired,
+            "faucet_calls": self.faucet_calls,
+            "errors_injected": self.errors_injected,
+            "calls": dict(self.calls),
+        }
+
+
+class _Transport(httpx.AsyncBaseTransport):
+    """httpx transport that hands JSON-RPC bodies to a FakeRippled."""
+
+    def __init__(self, rippled: FakeRippled):
+        self.rippled = rippled
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(await request.aread())
+        status, payload = await self.rippled.handle(body)
+        return httpx.Response(status, json=payload)
@@ -0,0 +1,334 @@
+"""
+Load benchmark
+==============
+Drives every HTTP route of the API in-process against the rippled stand-in
+in bench/fake_xrpl.py (no testnet, no faucet) at a range of concurrency
+levels, and reports per route and level:
+
+- p50 / p99 / max latency and requests per second
+- XRPL RPC calls per request (all calls the fake node saw while the route
+  ran, so background work such as Ticket refills is included)
+- status codes, so error paths are visible rather than averaged away
+
+`POST /market/{ticker}/settle` starts a background run, so it is measured
+once per level on a fresh market: time to accept, time until the run
+finishes, and positions settled per second. `GET /blockchain/stream` and
+`WS /blockchain/ws` are long-lived and not benchmarked.
+
+    python bench/load.py [--concurrency 1,8,32] [--requests 100] [--history 5000]
+                         [--close-ms 1000] [--latency-ms 20] [--error-rate 0] [--nodes 1]
+                         [--routes history,export] [--baseline old.json] [--out results.json]
+
+Results are written as JSON (default `bench/results/load-<timestamp>.json`).
+With `--baseline`, p50/p99 are compared against an earlier results file.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_xrpl import MARKETS, FakeRippled  # noqa: E402
+
+USERS = 20
+BATCH_SIZE = 10
+SETTLE_TIMEOUT_SECONDS = 300.0
+
+# name -> (HTTP method, request builder(ctx, n) -> (path, JSON body or None))
+Builder = Callable[[Dict[str, Any], int], Tuple[str, Optional[Any]]]
+
+
+def _purchase(ctx, n):
+    return {"user_id": n % USERS, "purchase_id": f"bench_{ctx['run']}_{n}", "item_name": "Bench item",
+            "item_icon": "🧪", "purchase_amount": 19.99 + n % 100}
+
+
+def _prediction(ctx, n):
+    return {"user_id": n % USERS, "position_id": f"bench_pos_{ctx['run']}_{n}",
+            "purchase_id": f"bench_{ctx['run']}_{n}", "market_ticker": "KXBENCH-26",
+            "market_title": "Benchmark market", "prediction_direction": "YES", "entry_price": 55.0,
+            "max_reward_percent": 20.0, "max_loss_percent": 5.0, "time_limit_days": 30}
+
+
+def _settlement(ctx, n):
+    return {"user_id": n % USERS, "position_id": f"bench_set_{ctx['run']}_{n}",
+            "market_ticker": "KXBENCH-26", "outcome": "win", "entry_price": 55.0, "final_price": 70.0,
+            "settlement_reason": "time_limit", "cashback_amount": 3.0, "roi": 15.0}
+
+
+def _pick(ctx, key, n):
+    values = ctx["seeded"][key]
+    return values[n % len(values)]
+
+
+ROUTES: Dict[str, Tuple[str, Builder]] = {
+    "root": ("GET", lambda ctx, n: ("/", None)),
+    "user_wallet": ("GET", lambda ctx, n: (f"/user/{n % USERS}/wallet", None)),
+    "user_history": ("GET", lambda ctx, n: (f"/user/{n % USERS}/history", None)),
+    "user_history_page": ("GET", lambda ctx, n: (f"/user/{n % USERS}/history?limit=50", None)),
+    "analytics": ("GET", lambda ctx, n: ("/analytics", None)),
+    "position": ("GET", lambda ctx, n: (f"/position/{_pick(ctx, 'positions', n)}", None)),
+    "purchase": ("GET", lambda ctx, n: (f"/purchase/{_pick(ctx, 'purchases', n)}", None)),
+    "market_positions": ("GET", lambda ctx, n: (f"/market/{MARKETS[n % len(MARKETS)]}/positions", None)),
+    "export": ("GET", lambda ctx, n: ("/export", None)),
+    "metrics": ("GET", lambda ctx, n: ("/metrics", None)),
+    "status": ("GET", lambda ctx, n: ("/blockchain/status", None)),
+    "wallets": ("GET", lambda ctx, n: ("/blockchain/wallets", None)),
+    "tickets": ("GET", lambda ctx, n: ("/blockchain/tickets", None)),
+    "wallet_pool": ("GET", lambda ctx, n: ("/blockchain/wallet-pool", None)),
+    "feed": ("GET", lambda ctx, n: ("/blockchain/feed", None)),
+    "verify": ("GET", lambda ctx, n: (f"/blockchain/verify/{_pick(ctx, 'hashes', n * 7919)}", None)),
+    "trail": ("GET", lambda ctx, n: (f"/blockchain/user/{n % USERS}/trail", None)),
+    "job": ("GET", lambda ctx, n: (f"/jobs/{ctx['job_id']}", None)),
+    "settlement_run": ("GET", lambda ctx, n: (f"/settlements/{ctx['run_id']}", None)),
+    "settlement_resume": ("POST", lambda ctx, n: (f"/settlements/{ctx['run_id']}/resume", None)),
+    "purchase_log": ("POST", lambda ctx, n: ("/purchase/log", _purchase(ctx, n))),
+    "purchase_log_async": ("POST", lambda ctx, n: ("/purchase/log?mode=async", _purchase(ctx, n))),
+    "purchase_batch": ("POST", lambda ctx, n: ("/purchase/log/batch", [
+        _purchase(ctx, n * BATCH_SIZE + i) for i in range(BATCH_SIZE)])),
+    "prediction_configure": ("POST", lambda ctx, n: ("/prediction/configure", _prediction(ctx, n))),
+    "position_settle": ("POST", lambda ctx, n: ("/position/settle", _settlement(ctx, n))),
+    "legacy_log": ("POST", lambda ctx, n: (f"/log?user_id={n % USERS}&amount=9.99&data=bench", None)),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def drive(http, rippled: FakeRippled, ctx: Dict[str, Any], name: str,
+                concurrency: int, requests: int) -> Dict[str, Any]:
+    """Send `requests` requests to one route with `concurrency` in flight at once."""
+    method, build = ROUTES[name]
+    numbers = itertools.count()
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async def worker():
+        while True:
+            n = next(numbers)
+            if n >= requests:
+                return
+            path, body = build(ctx, n)
+            started = time.perf_counter()
+            try:
+                response = await http.request(method, path, json=body)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    ctx["run"] += 1
+    calls_before = dict(rippled.calls)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    calls = {m: c - calls_before.get(m, 0) for m, c in rippled.calls.items() if c != calls_before.get(m, 0)}
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "route": name,
+        "method": method,
+        "path": build(ctx, 0)[0],
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "ok": ok,
+        "status_codes": statuses,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "rpc_calls_per_request": round(sum(calls.values()) / max(len(latencies), 1), 2),
+        "rpc_calls": calls,
+    }
+
+
+async def settle_market(http, rippled: FakeRippled, ticker: str, concurrency: int) -> Dict[str, Any]:
+    """One bulk settlement run: accept latency, run duration and positions per second."""
+    calls_before = sum(rippled.calls.values())
+    started = time.perf_counter()
+    response = await http.post(f"/market/{ticker}/settle", json={"final_price": 80.0, "result": "YES"})
+    accepted = time.perf_counter() - started
+    result = {"route": "market_settle", "ticker": ticker, "concurrency": concurrency,
+              "status": response.status_code, "accept_ms": round(accepted * 1000, 2)}
+    if response.status_code != 202:
+        return result
+
+    run_id = response.json()["run_id"]
+    while time.perf_counter() - started < SETTLE_TIMEOUT_SECONDS:
+        run = (await http.get(f"/settlements/{run_id}")).json()
+        if run.get("status") != "running":
+            break
+        await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    positions = response.json()["positions"]
+    result.update({
+        "run_id": run_id,
+        "run_status": run.get("status"),
+        "positions": positions,
+        "run_seconds": round(elapsed, 2),
+        "positions_per_second": round(positions / elapsed, 1),
+        "rpc_calls_per_position": round((sum(rippled.calls.values()) - calls_before) / max(positions, 1), 2),
+    })
+    return result
+
+
+async def wait_until(check: Callable[[], Any], timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not await check():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for {what}")
+        await asyncio.sleep(0.1)
+
+
+async def run(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="winback-bench-")
+    os.environ.update({
+        "WINBACK_INDEX_DB": os.path.join(workdir, "index.db"),
+        "WINBACK_KEYSTORE_DB": os.path.join(workdir, "keystore.db"),
+        "WINBACK_LEDGER_STREAM": "0",
+        "XRPL_URLS": ",".join(f"http://fake-rippled-{i}" for i in range(args.nodes)),
+    })
+    os.environ.pop("WINBACK_KEYSTORE_KEY", None)
+
+    import httpx
+    import main
+
+    rippled = FakeRippled(close_seconds=args.close_ms / 1000, latency=args.latency_ms / 1000,
+                          jitter=args.jitter_ms / 1000,
+                          faucet_latency=args.faucet_ms / 1000, seed=1)
+    main.client.transport = rippled.transport()
+    main.generate_faucet_wallet = rippled.faucet
+    main.wallet_pool.faucet = rippled.faucet
+
+    # Platform wallets exist before startup, so their history can be seeded first
+    main.COMPANY_WALLET = await rippled.faucet()
+    main.ESCROW_WALLET = await rippled.faucet()
+    seeded = rippled.seed_history(main.COMPANY_WALLET.address, args.history, users=USERS)
+    rippled.fund(main.COMPANY_WALLET.address, 10 ** 15)
+
+    selected = [r.strip() for r in args.routes.split(",")] if args.routes else [*ROUTES, "market_settle"]
+    unknown = [r for r in selected if r not in ROUTES and r != "market_settle"]
+    if unknown:
+        raise SystemExit(f"Unknown routes: {', '.join(unknown)} (choose from {', '.join(ROUTES)}, market_settle)")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    results: List[Dict[str, Any]] = []
+    settlements: List[Dict[str, Any]] = []
+    # Unhandled errors become 500s, as they would behind a real server
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with main.app.router.lifespan_context(main.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+
+        async def ready():
+            return (await http.get("/")).json()["wallets_ready"]
+        await wait_until(ready, 60, "platform wallets")
+
+        # Objects for the ID-based routes: an async job and one finished settlement run
+        ctx = {"seeded": seeded, "run": 0}
+        ctx["job_id"] = (await http.post("/purchase/log?mode=async", json=_purchase(ctx, -1))).json()["job_id"]
+        first = await settle_market(http, rippled, MARKETS[0], 1)
+        ctx["run_id"] = first.get("run_id", "missing")
+        fresh_markets = list(MARKETS[1:])
+        rippled.error_rate = args.error_rate  # setup above runs without injected errors
+
+        for level in levels:
+            for name in selected:
+                if name == "market_settle":
+                    if fresh_markets:
+                        settlements.append(await settle_market(http, rippled, fresh_markets.pop(0), level))
+                    continue
+                path, body = ROUTES[name][1](ctx, -2)
+                await http.request(ROUTES[name][0], path, json=body)  # warm-up, not measured
+                result = await drive(http, rippled, ctx, name, level, args.requests)
+                results.append(result)
+                print(f"{name:<22} c={level:<4} p50 {result['p50_ms']:>9.2f} ms  "
+                      f"p99 {result['p99_ms']:>9.2f} ms  {result['rps']:>8.1f} req/s  "
+                      f"{result['rpc_calls_per_request']:>6.2f} rpc/req  {result['status_codes']}")
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=BENCH_DIR).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": commit,
+        "config": {
+            "concurrency": levels,
+            "requests": args.requests,
+            "history": args.history,
+            "close_ms": args.close_ms,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "error_rate": args.error_rate,
+            "faucet_ms": args.faucet_ms,
+            "nodes": args.nodes,
+        },
+        "results": results,
+        "market_settlement": settlements,
+        "rippled": rippled.stats(),
+    }
+
+
+def compare(report: Dict[str, Any], baseline_path: str):
+    """Print p50/p99 changes against an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = {(r["route"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_path}:")
+    for result in report["results"]:
+        old = baseline.get((result["route"], result["concurrency"]))
+        if not old:
+            continue
+        changes = []
+        for key in ("p50_ms", "p99_ms"):
+            if old[key]:
+                changes.append(f"{key[:3]} {(result[key] - old[key]) / old[key] * 100:+.0f}%")
+        print(f"{result['route']:<22} c={result['concurrency']:<4} {'  '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per route and level")
+    parser.add_argument("--history", type=int, default=5000, help="events seeded on the company account")
+    parser.add_argument("--close-ms", type=float, default=1000, help="ledger close interval")
+    parser.add_argument("--latency-ms", type=float, default=20, help="latency added to every RPC")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="random extra RPC latency, up to")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of RPCs answered with tooBusy")
+    parser.add_argument("--faucet-ms", type=float, default=0, help="latency of a faucet call")
+    parser.add_argument("--nodes", type=int, default=1,
+                        help="endpoints in XRPL_URLS (all served by the same fake node)")
+    parser.add_argument("--routes", help=f"comma-separated subset of: {', '.join(ROUTES)}, market_settle")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--out", help="results file (default bench/results/load-<timestamp>.json)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    out = args.out or os.path.join(BENCH_DIR, "results", time.strftime("load-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+    if args.baseline:
+        compare(report, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
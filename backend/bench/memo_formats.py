@@ -0,0 +1,110 @@
+"""
+Memo format benchmark
+=====================
+Bytes per memo and decode throughput for Winback_v1 (JSON) and
+Winback_v2 (binary, with and without zlib), per TransactionType.
+With zlib allowed the encoder only compresses when that is smaller.
+
+    python bench/memo_formats.py [--iterations 20000] [--json]
+"""
+
+import argparse
+import binascii
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import memo_codec  # noqa: E402
+from memos import decode_memo  # noqa: E402
+
+TIMESTAMP = "2026-02-07T17:40:12.345678"
+
+SAMPLES = {
+    "PURCHASE": {
+        "type": "PURCHASE", "user_id": 101, "purchase_id": "pur_8f3a2c91",
+        "item": "Wireless Noise-Cancelling Headphones", "icon": "🎧",
+        "amount": 249.99, "timestamp": TIMESTAMP, "status": "unconfigured",
+    },
+    "PREDICTION_CONFIG": {
+        "type": "PREDICTION_CONFIG", "user_id": 101, "position_id": "pos_5d1e77b0",
+        "purchase_id": "pur_8f3a2c91", "market_ticker": "KXFEDDECISION-26MAR-H0",
+        "market_title": "Will the Fed hold rates at the March 2026 meeting?",
+        "direction": "YES", "entry_price": 62.0, "max_reward_pct": 25.0,
+        "max_loss_pct": 10.0, "time_limit_days": 30, "timestamp": TIMESTAMP,
+    },
+    "SETTLEMENT": {
+        "type": "SETTLEMENT", "user_id": 101, "position_id": "pos_5d1e77b0",
+        "market_ticker": "KXFEDDECISION-26MAR-H0", "outcome": "win",
+        "entry_price": 62.0, "final_price": 71.5, "settlement_reason": "time_limit",
+        "cashback_amount": 38.3, "roi": 15.32, "timestamp": TIMESTAMP,
+    },
+    "CASHBACK_PAYMENT": {
+        "type": "CASHBACK_PAYMENT", "position_id": "pos_5d1e77b0",
+        "amount_usd": 38.3, "amount_xrp": 0.383, "roi": 15.32,
+    },
+}
+
+
+def v1_memo(payload):
+    return {
+        "MemoData": json.dumps(payload).encode().hex().upper(),
+        "MemoType": memo_codec.MEMO_TYPE_V1.encode().hex().upper(),
+        "MemoFormat": "json".encode().hex().upper(),
+    }
+
+
+def v2_memo(payload, compress):
+    return {
+        "MemoData": memo_codec.encode(payload, compress=compress).hex().upper(),
+        "MemoType": memo_codec.MEMO_TYPE_V2.encode().hex().upper(),
+        "MemoFormat": memo_codec.MEMO_FORMAT_V2.encode().hex().upper(),
+    }
+
+
+def decode_rate(memo, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        decode_memo(memo)
+    return iterations / (time.perf_counter() - started)
+
+
+def run(iterations):
+    results = {}
+    for name, payload in SAMPLES.items():
+        formats = {
+            "v1_json": v1_memo(payload),
+            "v2": v2_memo(payload, compress=False),
+            "v2_zlib": v2_memo(payload, compress=True),
+        }
+        results[name] = {
+            fmt: {
+                "memo_data_bytes": len(binascii.unhexlify(memo["MemoData"])),
+                "decodes_per_second": round(decode_rate(memo, iterations)),
+            }
+            for fmt, memo in formats.items()
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'type':<20}{'format':<10}{'bytes':>8}{'decodes/s':>14}")
+    for name, formats in results.items():
+        for fmt, r in formats.items():
+            print(f"{name:<20}{fmt:<10}{r['memo_data_bytes']:>8}{r['decodes_per_second']:>14,}")
+
+
+if __name__ == "__main__":
+    main()
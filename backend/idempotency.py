@@ -0,0 +1,233 @@
+"""
+Winback Idempotency Store
+=========================
+Dedupe for ledger-writing endpoints.
+
+Clients retry slow writes (`/purchase/log`, `/position/settle`), and every
+retry used to submit another transaction. In the settlement case that
+could mean a second cashback Payment. Each write now runs under one or more
+keys: the client's `Idempotency-Key` header and/or a natural key such as
+`purchase:<purchase_id>` or `settlement:<position_id>`.
+
+- A key whose write already succeeded returns the stored response, with
+  no new submission.
+- A key whose write is still in flight is joined: the retry waits for the
+  original call and gets its result.
+- A key reused with a different request body is rejected.
+
+Keys and responses live in SQLite, so completed writes are remembered
+across restarts (for `ttl_seconds`). Failed writes are forgotten, so they
+can be retried. A write accepted as an async job completes with its 202
+response before the job runs; if the job then fails, its natural key is
+dropped with `forget` so the write can be retried.
+
+With `shared=True` several worker processes use one store. A key in flight
+in another worker is waited on by polling its row (joining only works
+within a process). Rows left in flight are no longer dropped on start,
+because they may belong to a live worker. Instead a row that has been in
+flight longer than `IN_FLIGHT_TIMEOUT_SECONDS` counts as abandoned.
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status TEXT NOT NULL,
+    status_code INTEGER,
+    response TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created_at);
+"""
+
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+
+TTL_SECONDS = 24 * 3600.0
+# Longer than any write can take (validation waits end at LastLedgerSequence)
+IN_FLIGHT_TIMEOUT_SECONDS = 300.0
+IN_FLIGHT_POLL_SECONDS = 0.1
+
+# call() -> (HTTP status code, JSON-serializable response body)
+Call = Callable[[], Awaitable[Tuple[int, Any]]]
+
+
+class IdempotencyConflict(Exception):
+    """A key was reused for a request with different content."""
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a request body."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """SQLite-backed idempotency keys with in-process joining of in-flight calls."""
+
+    def __init__(self, path: str, ttl_seconds: float = TTL_SECONDS, shared: bool = False):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        self.executed = 0
+        self.replayed = 0
+        self.joined = 0
+        self.conflicts = 0
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM idempotency_keys WHERE created_at < ?", (time.time() - ttl_seconds,)
+            )
+            # Writes cut off by a restart: the outcome is unknown here, so let a retry
+            # through (natural-key callers also check the ledger index before submitting)
+            stale = self._conn.execute(
+                "DELETE FROM idempotency_keys WHERE status = ? AND updated_at < ?",
+                (IN_FLIGHT, time.time() - IN_FLIGHT_TIMEOUT_SECONDS if shared else float("inf"))
+            ).rowcount
+        if stale:
+            print(f"⚠️ Dropped {stale} idempotency keys left in flight by the last run")
+
+    def _lookup(self, keys: List[str]) -> Optional[sqlite3.Row]:
+        placeholders = ", ".join("?" for _ in keys)
+        return self._conn.execute(
+            f"""SELECT * FROM idempotency_keys
+                WHERE key IN ({placeholders}) AND status = ? AND created_at >= ?
+                ORDER BY created_at LIMIT 1""",
+            (*keys, COMPLETED, time.time() - self.ttl_seconds)
+        ).fetchone()
+
+    def _claim(self, keys: List[str], request_fingerprint: str) -> Optional[sqlite3.Row]:
+        """
+        Mark `keys` in flight for this call. If another process got there first,
+        returns its row (completed, or still in flight) instead.
+        """
+        now = time.time()
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for row in self._conn.execute(
+                f"""SELECT * FROM idempotency_keys
+                    WHERE key IN ({placeholders}) AND created_at >= ? ORDER BY created_at""",
+                (*keys, now - self.ttl_seconds)
+            ).fetchall():
+                if row["status"] == COMPLETED or row["updated_at"] >= now - IN_FLIGHT_TIMEOUT_SECONDS:
+                    return row
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO idempotency_keys
+                   (key, fingerprint, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)""",
+                [(key, request_fingerprint, IN_FLIGHT, now, now) for key in keys]
+            )
+        return None
+
+    def _replay(self, row: sqlite3.Row, request_fingerprint: str) -> Tuple[int, Any, bool]:
+        if row["fingerprint"] != request_fingerprint:
+            self.conflicts += 1
+            raise IdempotencyConflict(f"Idempotency key {row['key']} was used for a different request")
+        self.replayed += 1
+        return row["status_code"], json.loads(row["response"]), True
+
+    async def run(self, keys: List[str], request_fingerprint: str, call: Call) -> Tuple[int, Any, bool]:
+        """
+        Run `call` once for `keys`. Returns (status code, body, replayed), where
+        `replayed` is True if the result came from an earlier or concurrent call.
+        """
+        keys = [k for k in dict.fromkeys(keys) if k]
+        if not keys:
+            self.executed += 1
+            status_code, body = await call()
+            return status_code, body, False
+
+        for key in keys:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.joined += 1
+                status_code, body, original = await asyncio.shield(future)
+                if original != request_fingerprint:
+                    self.conflicts += 1
+                    raise IdempotencyConflict(f"Idempotency key {key} is in use by a different request")
+                return status_code, body, True
+
+        row = self._lookup(keys)
+        if row is not None:
+            return self._replay(row, request_fingerprint)
+
+        waited = False
+        while True:
+            row = self._claim(keys, request_fingerprint)
+            if row is None:
+                break
+            if row["status"] == COMPLETED:
+                return self._replay(row, request_fingerprint)
+            # In flight in another worker: wait for its outcome
+            if row["fingerprint"] != request_fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict(f"Idempotency key {row['key']} is in use by a different request")
+            if not waited:
+                waited = True
+                self.joined += 1
+            await asyncio.sleep(IN_FLIGHT_POLL_SECONDS)
+
+        future = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._in_flight[key] = future
+
+        try:
+            self.executed += 1
+            status_code, body = await call()
+        except BaseException as e:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "DELETE FROM idempotency_keys WHERE key = ?", [(key,) for key in keys]
+                )
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # joiners re-raise it; don't warn when there are none
+            raise
+        else:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    """UPDATE idempotency_keys SET status = ?, status_code = ?, response = ?, updated_at = ?
+                       WHERE key = ?""",
+                    [(COMPLETED, status_code, json.dumps(body), time.time(), key) for key in keys]
+                )
+            future.set_result((status_code, body, request_fingerprint))
+            return status_code, body, False
+        finally:
+            for key in keys:
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+
+    def forget(self, keys: List[str]) -> int:
+        """Drop completed `keys` (e.g. of an async job that failed). Returns how many."""
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock, self._conn:
+            return self._conn.execute(
+                f"DELETE FROM idempotency_keys WHERE key IN ({placeholders}) AND status = ?",
+                (*keys, COMPLETED)
+            ).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "joined": self.joined,
+            "conflicts": self.conflicts,
+            "in_flight": len(set(map(id, self._in_flight.values()))),
+        }
@@ -0,0 +1,231 @@
+"""
+Winback Job Queue
+=================
+Durable queue for ledger writes accepted in asynchronous mode.
+
+Write endpoints called with `?mode=async` validate the request, store it
+here and return 202 with a job ID. Background workers submit the
+transaction and record the outcome (tx hash, validation result or error),
+which clients read from `GET /jobs/{id}`. If a `callback_url` was given the
+finished job is also POSTed there. Callback URLs must be http(s) and
+resolve to public addresses only (`check_callback_url`), both when the job
+is accepted and again right before each POST, so a job can't be used to
+reach loopback, private-network or link-local (cloud metadata) services.
+
+Jobs live in SQLite, so queued work survives a restart. Jobs that were
+running when the process stopped are re-queued on start (at-least-once).
+Several worker processes can drain one queue: claiming a job is a single
+write transaction. Since one worker restarting must not re-queue jobs that
+others are still running, multi-worker deployments re-queue only jobs
+that have been running for longer than a stale timeout (`requeue`).
+"""
+
+import asyncio
+import ipaddress
+import json
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    callback_url TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+"""
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+CALLBACK_ATTEMPTS = 3
+CALLBACK_TIMEOUT_SECONDS = 5.0
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class InvalidCallbackURL(Exception):
+    """A callback URL that isn't http(s) or points at a non-public address."""
+
+
+async def check_callback_url(url: str):
+    """Raise InvalidCallbackURL unless every address `url` resolves to is public."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise InvalidCallbackURL("callback_url must be an http(s) URL")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, port, type=socket.SOCK_STREAM
+        )
+    except (ValueError, OSError):
+        raise InvalidCallbackURL(f"callback_url host {parts.hostname} does not resolve")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise InvalidCallbackURL(f"callback_url host {parts.hostname} is not a public address")
+
+
+class JobQueue:
+    """SQLite-backed job queue with in-process async workers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.handlers: Dict[str, Handler] = {}
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+    # --- Queue operations ---
+    def enqueue(self, kind: str, payload: Dict[str, Any],
+                callback_url: Optional[str] = None) -> str:
+        """Persist a job and wake a worker. Returns the job ID."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO jobs (id, kind, payload, status, callback_url, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, kind, json.dumps(payload), QUEUED, callback_url, now, now)
+            )
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        with self._lock, self._conn:
+            # Take the write lock first, so two processes can't claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, time.time(), row["id"])
+            )
+            return row
+
+    def _finish(self, job_id: str, status: str,
+                result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None,
+                 error, time.time(), job_id)
+            )
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    # --- Workers ---
+    def requeue(self, older_than: float = 0.0) -> int:
+        """Re-queue running jobs claimed more than `older_than` seconds ago."""
+        with self._lock, self._conn:
+            count = self._conn.execute(
+                "UPDATE jobs SET status = ? WHERE status = ? AND updated_at <= ?",
+                (QUEUED, RUNNING, time.time() - older_than)
+            ).rowcount
+        if count:
+            print(f"🔁 Re-queued {count} interrupted jobs")
+        return count
+
+    def start(self, concurrency: int = 4, requeue: bool = True):
+        """Re-queue interrupted jobs (unless other processes share the queue) and start worker tasks."""
+        if requeue:
+            self.requeue()
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(concurrency)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self):
+        while True:
+            row = self._claim()
+            if row is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                result = await self.handlers[row["kind"]](json.loads(row["payload"]))
+                self._finish(row["id"], SUCCEEDED, result=result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Job {row['id']} ({row['kind']}) failed: {e}")
+                traceback.print_exc()
+                self._finish(row["id"], FAILED, error=str(e))
+
+            job = self.get(row["id"])
+            for listener in self.listeners:
+                listener(job)
+            if row["callback_url"]:
+                asyncio.create_task(self._notify(row["callback_url"], job))
+
+    async def _notify(self, url: str, job: Dict[str, Any]):
+        """POST the finished job to its callback URL (best effort)."""
+        for attempt in range(CALLBACK_ATTEMPTS):
+            try:
+                # Re-check in case the name now resolves somewhere else
+                await check_callback_url(url)
+                async with httpx.AsyncClient(timeout=CALLBACK_TIMEOUT_SECONDS) as http:
+                    response = await http.post(url, json=job)
+                if response.status_code < 500:
+                    return
+            except InvalidCallbackURL as e:
+                print(f"⚠️ Job callback to {url} refused: {e}")
+                return
+            except Exception as e:
+                print(f"⚠️ Job callback to {url} failed: {e}")
+            await asyncio.sleep(2 ** attempt)
@@ -0,0 +1,188 @@
+"""
+Winback Keystore
+================
+Encrypted local storage for platform and user wallet seeds.
+
+Without it every boot funded a brand-new company and escrow wallet from the
+faucet (tens of seconds, and the history ended up split across a new company
+account each time), and user wallets only lived in memory.
+
+Seeds are stored in SQLite, each encrypted with AES-256-GCM. The key is
+derived with scrypt from `WINBACK_KEYSTORE_KEY` and a random salt kept in the
+same file; the wallet's name and address are bound to the ciphertext as
+associated data, so records can't be swapped around. If no key is configured
+the keystore is disabled and wallets are only kept in memory, as before.
+
+Names:
+- `company`, `escrow`: platform wallets
+- `user:<id>`: a user's wallet
+- `pool:<address>`: a funded wallet waiting in the wallet pool
+
+Several worker processes can share one keystore file. Assigning a pool
+wallet to a user is a single atomic rename, so two workers can neither give
+one pool wallet to two users nor give one user two wallets.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from Crypto.Cipher import AES
+from Crypto.Protocol.KDF import scrypt
+from xrpl.wallet import Wallet
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keystore_meta (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS keystore_wallets (
+    name TEXT PRIMARY KEY,
+    address TEXT NOT NULL,
+    nonce BLOB NOT NULL,
+    ciphertext BLOB NOT NULL,
+    tag BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+SCRYPT_N = 2 ** 15
+SCRYPT_R = 8
+SCRYPT_P = 1
+CHECK_PLAINTEXT = b"winback-keystore"
+
+
+class KeystoreError(Exception):
+    pass
+
+
+class Keystore:
+    """AES-GCM encrypted wallet seeds in SQLite."""
+
+    def __init__(self, path: str, passphrase: Optional[str]):
+        self.path = path
+        self.enabled = bool(passphrase)
+        self._key: Optional[bytes] = None
+        if not self.enabled:
+            return
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._key = self._derive_key(passphrase)
+
+    def _derive_key(self, passphrase: str) -> bytes:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM keystore_meta WHERE key = 'salt'"
+            ).fetchone()
+            if row is None:
+                salt = os.urandom(16)
+                self._conn.execute(
+                    "INSERT INTO keystore_meta (key, value) VALUES ('salt', ?)", (salt,)
+                )
+            else:
+                salt = row["value"]
+        key = scrypt(passphrase.encode(), salt, 32, N=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+
+        # A known value encrypted with the key catches a wrong passphrase up front
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM keystore_meta WHERE key = 'check'"
+            ).fetchone()
+            if row is None:
+                nonce = os.urandom(12)
+                cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+                ciphertext, tag = cipher.encrypt_and_digest(CHECK_PLAINTEXT)
+                self._conn.execute(
+                    "INSERT INTO keystore_meta (key, value) VALUES ('check', ?)",
+                    (nonce + tag + ciphertext,)
+                )
+                return key
+
+        value = row["value"]
+        try:
+            cipher = AES.new(key, AES.MODE_GCM, nonce=value[:12])
+            cipher.decrypt_and_verify(value[28:], value[12:28])
+        except ValueError:
+            raise KeystoreError("Keystore passphrase does not match this keystore")
+        return key
+
+    # --- Records ---
+    def put(self, name: str, wallet: Wallet, replace: bool = True) -> bool:
+        """
+        Store a wallet under `name`. With `replace=False` an existing record
+        wins. Returns whether the wallet was stored.
+        """
+        if not self.enabled:
+            return False
+        with self._lock, self._conn:
+            return self._insert(name, wallet, replace)
+
+    def _insert(self, name: str, wallet: Wallet, replace: bool = True) -> bool:
+        nonce = os.urandom(12)
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(f"{name}|{wallet.address}".encode())
+        ciphertext, tag = cipher.encrypt_and_digest(wallet.seed.encode())
+        return self._conn.execute(
+            f"""INSERT OR {"REPLACE" if replace else "IGNORE"} INTO keystore_wallets
+                (name, address, nonce, ciphertext, tag, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+            (name, wallet.address, nonce, ciphertext, tag, time.time())
+        ).rowcount > 0
+
+    def rename(self, old: str, new: str) -> bool:
+        """
+        Move a wallet to a new name (e.g. a pool wallet assigned to a user).
+        Returns False if `old` is gone or `new` is taken, e.g. by another worker.
+        """
+        if not self.enabled:
+            return False
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT * FROM keystore_wallets WHERE name = ?", (old,)
+            ).fetchone()
+            if row is None:
+                return False
+            # The name is part of the associated data, so re-encrypt under the new one
+            if not self._insert(new, self._decrypt(row), replace=False):
+                return False
+            self._conn.execute("DELETE FROM keystore_wallets WHERE name = ?", (old,))
+        return True
+
+    def get(self, name: str) -> Optional[Wallet]:
+        if not self.enabled:
+            return None
+        row = self._conn.execute(
+            "SELECT * FROM keystore_wallets WHERE name = ?", (name,)
+        ).fetchone()
+        return self._decrypt(row) if row else None
+
+    def load(self, prefix: str = "") -> Dict[str, Wallet]:
+        """All wallets whose name starts with `prefix`, by name."""
+        if not self.enabled:
+            return {}
+        rows = self._conn.execute(
+            "SELECT * FROM keystore_wallets WHERE name LIKE ? ORDER BY created_at",
+            (prefix + "%",)
+        ).fetchall()
+        return {row["name"]: self._decrypt(row) for row in rows}
+
+    def _decrypt(self, row: sqlite3.Row) -> Wallet:
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=row["nonce"])
+        cipher.update(f"{row['name']}|{row['address']}".encode())
+        try:
+            seed = cipher.decrypt_and_verify(row["ciphertext"], row["tag"]).decode()
+        except ValueError:
+            raise KeystoreError(f"Keystore record {row['name']} failed authentication")
+        wallet = Wallet.from_seed(seed)
+        if wallet.address != row["address"]:
+            raise KeystoreError(f"Keystore record {row['name']} does not match its address")
+        return wallet
@@ -0,0 +1,445 @@
+"""
+Winback Ledger Index
+====================
+Embedded SQLite index of decoded Winback memo events.
+
+The company wallet's history is pulled from the XRP Ledger incrementally
+(starting after the last indexed ledger) and every Winback memo is
+stored as one event row. Read endpoints query this index instead of
+re-scanning `AccountTx` and re-decoding memos on every request.
+
+Listeners registered on the index (`add_listener`, see analytics.py) are
+applied inside the same transaction as each batch of new events.
+
+Reads that page (user events, recent transactions) use keyset cursors over
+(ledger_index, tx_index[, memo_index]) instead of offsets, so every page is
+one index range scan no matter how deep into the history it is.
+
+Tables:
+- transactions: one row per company-account transaction (keyed by tx hash)
+- events: one row per decoded memo (keyed by tx hash + memo index),
+  indexed by user_id, type and ledger index, and by the purchase_id /
+  position_id / market_ticker that link a position's lifecycle
+  (PURCHASE -> PREDICTION_CONFIG -> SETTLEMENT -> CASHBACK_PAYMENT)
+- checkpoints: last fully indexed ledger per account
+"""
+
+import base64
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from account_tx import AccountTxStream
+from memos import memo_decoder
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    tx_hash TEXT PRIMARY KEY,
+    account TEXT NOT NULL,
+    ledger_index INTEGER NOT NULL,
+    tx_index INTEGER NOT NULL DEFAULT 0,
+    date INTEGER,
+    transaction_type TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_ledger
+    ON transactions (account, ledger_index, tx_index);
+
+CREATE TABLE IF NOT EXISTS events (
+    tx_hash TEXT NOT NULL,
+    memo_index INTEGER NOT NULL,
+    account TEXT NOT NULL,
+    ledger_index INTEGER NOT NULL,
+    tx_index INTEGER NOT NULL DEFAULT 0,
+    date INTEGER,
+    user_id TEXT,
+    type TEXT,
+    purchase_id TEXT,
+    position_id TEXT,
+    market_ticker TEXT,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (tx_hash, memo_index)
+);
+-- Superseded by idx_events_user_order, which matches the history page order
+DROP INDEX IF EXISTS idx_events_user;
+CREATE INDEX IF NOT EXISTS idx_events_user_order
+    ON events (account, user_id, ledger_index DESC, tx_index DESC, memo_index);
+CREATE INDEX IF NOT EXISTS idx_events_type
+    ON events (account, type, ledger_index);
+CREATE INDEX IF NOT EXISTS idx_events_ledger
+    ON events (account, ledger_index, tx_index);
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    account TEXT PRIMARY KEY,
+    ledger_index INTEGER NOT NULL
+);
+"""
+
+# Created after _migrate(), so older databases get the columns first
+LINK_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_events_purchase
+    ON events (account, purchase_id);
+CREATE INDEX IF NOT EXISTS idx_events_position
+    ON events (account, position_id);
+CREATE INDEX IF NOT EXISTS idx_events_market
+    ON events (account, market_ticker);
+"""
+LINK_COLUMNS = ("purchase_id", "position_id", "market_ticker")
+
+
+def encode_cursor(*keys: int) -> str:
+    """Opaque page cursor for a position in ledger order."""
+    raw = ":".join(str(int(k)) for k in keys).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> Tuple[int, ...]:
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        keys = tuple(int(k) for k in raw.split(":"))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if len(keys) != size:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return keys
+
+
+def _links(data: Dict[str, Any]) -> List[Optional[str]]:
+    """purchase_id / position_id / market_ticker of a memo payload."""
+    return [str(data[key]) if data.get(key) is not None else None for key in LINK_COLUMNS]
+
+
+# --- INDEX ---
+class LedgerIndex:
+    """SQLite-backed index of Winback memo events for one or more accounts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.listeners: List[Any] = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.executescript(LINK_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def add_listener(self, listener: Any, schema: str = ""):
+        """
+        Register a derived view: create its tables from `schema`, fold in every
+        event indexed so far, then apply it to each later batch of new events.
+        """
+        with self._lock, self._conn:
+            if schema:
+                self._conn.executescript(schema)
+            for row in self._conn.execute("SELECT DISTINCT account FROM events").fetchall():
+                listener.apply(self._conn, row["account"])
+            self.listeners.append(listener)
+
+    def _migrate(self):
+        """Add the link columns to an existing events table and backfill them."""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(events)")}
+        missing = [c for c in LINK_COLUMNS if c not in columns]
+        if not missing:
+            return
+        with self._conn:
+            for column in missing:
+                self._conn.execute(f"ALTER TABLE events ADD COLUMN {column} TEXT")
+            rows = self._conn.execute("SELECT rowid, payload FROM events").fetchall()
+            for row in rows:
+                try:
+                    data = json.loads(row["payload"])
+                except ValueError:
+                    continue
+                if isinstance(data, dict):
+                    self._conn.execute(
+                        """UPDATE events SET purchase_id = ?, position_id = ?, market_ticker = ?
+                           WHERE rowid = ?""",
+                        (*_links(data), row["rowid"])
+                    )
+        print(f"🗂️ Backfilled {', '.join(missing)} for {len(rows)} indexed events")
+
+    # --- Writes ---
+    def checkpoint(self, account: str) -> int:
+        """Last ledger index fully indexed for `account` (0 if none)."""
+        row = self._conn.execute(
+            "SELECT ledger_index FROM checkpoints WHERE account = ?", (account,)
+        ).fetchone()
+        return row["ledger_index"] if row else 0
+
+    def ingest(self, account: str, items: List[Dict[str, Any]],
+               checkpoint: Optional[int] = None) -> int:
+        """
+        Store validated transactions and their memo events.
+        Re-ingesting a known transaction is a no-op.
+        Returns the number of new events.
+        """
+        new_events = 0
+        with self._lock, self._conn:
+            for item in items:
+                if item.get("validated") is False:
+                    continue
+                decoded = memo_decoder.decode(item, caller="index_sync")
+                if not decoded.hash:
+                    continue
+
+                cur = self._conn.execute(
+                    """INSERT OR IGNORE INTO transactions
+                       (tx_hash, account, ledger_index, tx_index, date, transaction_type, result)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (decoded.hash, account, decoded.ledger_index, decoded.tx_index,
+                     decoded.date, decoded.transaction_type, decoded.result)
+                )
+                if cur.rowcount == 0:
+                    continue
+
+                for memo_index, data in decoded.memos:
+                    user_id = data.get("user_id")
+                    self._conn.execute(
+                        """INSERT OR IGNORE INTO events
+                           (tx_hash, memo_index, account, ledger_index, tx_index, date, user_id, type,
+                            purchase_id, position_id, market_ticker, payload)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (decoded.hash, memo_index, account, decoded.ledger_index,
+                         decoded.tx_index, decoded.date,
+                         str(user_id) if user_id is not None else None,
+                         data.get("type"), *_links(data), json.dumps(data))
+                    )
+                    new_events += 1
+
+            # Derived views (e.g. analytics totals) update in the same transaction
+            if new_events:
+                for listener in self.listeners:
+                    listener.apply(self._conn, account)
+
+            if checkpoint is not None:
+                self._conn.execute(
+                    """INSERT INTO checkpoints (account, ledger_index) VALUES (?, ?)
+                       ON CONFLICT(account) DO UPDATE SET ledger_index = excluded.ledger_index
+                       WHERE excluded.ledger_index > checkpoints.ledger_index""",
+                    (account, checkpoint)
+                )
+        return new_events
+
+    async def sync(self, client, account: str) -> int:
+        """
+        Pull transactions validated after the checkpoint and index them.
+        Returns the number of new events.
+        """
+        last = self.checkpoint(account)
+        stream = AccountTxStream(
+            client,
+            account,
+            ledger_index_min=last + 1 if last else -1,
+            forward=True
+        )
+        new_events = 0
+
+        async for page in stream.pages():
+            new_events += self.ingest(account, page)
+
+        # Every page up to the pinned upper bound is indexed
+        if stream.ledger_index_max and stream.ledger_index_max != -1:
+            self.ingest(account, [], checkpoint=stream.ledger_index_max)
+
+        return new_events
+
+    # --- Reads ---
+    @staticmethod
+    def _row_to_event(row: sqlite3.Row, caller: str) -> Dict[str, Any]:
+        event = {
+            "hash": row["tx_hash"],
+            "memo_index": row["memo_index"],
+            "ledger_index": row["ledger_index"],
+            "tx_index": row["tx_index"],
+            "date": row["date"],
+            "user_id": row["user_id"],
+            "type": row["type"],
+            "data": memo_decoder.payload(row["tx_hash"], row["memo_index"], row["payload"], caller),
+        }
+        if "result" in row.keys():
+            event["result"] = row["result"]
+        return event
+
+    def user_events(self, account: str, user_id: Any, event_type: Optional[str] = None,
+                    caller: str = "index", limit: Optional[int] = None,
+                    after: Optional[Tuple[int, int, int]] = None) -> List[Dict[str, Any]]:
+        """
+        Events for a user, newest first (memos within a tx in memo order).
+        `after` is the (ledger_index, tx_index, memo_index) of the last event
+        of the previous page; `limit` caps the page (None = everything).
+        """
+        sql = """SELECT e.*, t.result FROM events e
+                 LEFT JOIN transactions t ON t.tx_hash = e.tx_hash
+                 WHERE e.account = ? AND e.user_id = ?"""
+        params: List[Any] = [account, str(user_id)]
+        if event_type:
+            sql += " AND e.type = ?"
+            params.append(event_type)
+        if after:
+            ledger, tx_index, memo_index = after
+            sql += """ AND e.ledger_index <= ? AND (e.ledger_index < ? OR e.tx_index < ?
+                       OR (e.tx_index = ? AND e.memo_index > ?))"""
+            params += [ledger, ledger, tx_index, tx_index, memo_index]
+        sql += " ORDER BY e.ledger_index DESC, e.tx_index DESC, e.memo_index ASC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._row_to_event(r, caller) for r in self._conn.execute(sql, params)]
+
+    def _linked(self, matches: str, params: List[Any], caller: str) -> List[Dict[str, Any]]:
+        # `matches` selects event rowids; each branch is its own indexed lookup
+        sql = f"""SELECT e.*, t.result FROM events e
+                  LEFT JOIN transactions t ON t.tx_hash = e.tx_hash
+                  WHERE e.rowid IN ({matches})
+                  ORDER BY e.ledger_index, e.tx_index, e.memo_index"""
+        return [self._row_to_event(r, caller) for r in self._conn.execute(sql, params)]
+
+    def position_events(self, account: str, position_id: str,
+                        caller: str = "index") -> List[Dict[str, Any]]:
+        """A position's events plus the purchase it was configured on, in ledger order."""
+        return self._linked(
+            """SELECT rowid FROM events WHERE account = ? AND position_id = ?
+               UNION
+               SELECT rowid FROM events WHERE account = ? AND purchase_id IN (
+                   SELECT purchase_id FROM events WHERE account = ? AND position_id = ?)""",
+            [account, position_id, account, account, position_id], caller
+        )
+
+    def purchase_events(self, account: str, purchase_id: str,
+                        caller: str = "index") -> List[Dict[str, Any]]:
+        """A purchase's events plus every position configured on it, in ledger order."""
+        return self._linked(
+            """SELECT rowid FROM events WHERE account = ? AND purchase_id = ?
+               UNION
+               SELECT rowid FROM events WHERE account = ? AND position_id IN (
+                   SELECT position_id FROM events WHERE account = ? AND purchase_id = ?)""",
+            [account, purchase_id, account, account, purchase_id], caller
+        )
+
+    def market_events(self, account: str, market_ticker: str,
+                      caller: str = "index") -> List[Dict[str, Any]]:
+        """Events of every position on a market and their purchases, in ledger order."""
+        return self._linked(
+            """SELECT rowid FROM events WHERE account = ? AND position_id IN (
+                   SELECT position_id FROM events WHERE account = ? AND market_ticker = ?)
+               UNION
+               SELECT rowid FROM events WHERE account = ? AND purchase_id IN (
+                   SELECT purchase_id FROM events WHERE account = ? AND market_ticker = ?)""",
+            [account, account, market_ticker, account, account, market_ticker], caller
+        )
+
+    def events(self, account: str, event_type: Optional[str] = None,
+               caller: str = "index") -> Iterator[Dict[str, Any]]:
+        """Iterate all events for an account in ledger order."""
+        sql = "SELECT * FROM events WHERE account = ?"
+        params: List[Any] = [account]
+        if event_type:
+            sql += " AND type = ?"
+            params.append(event_type)
+        sql += " ORDER BY ledger_index, tx_index, memo_index"
+        for row in self._conn.execute(sql, params):
+            yield self._row_to_event(row, caller)
+
+    def event_rows(self, account: str, event_type: Optional[str] = None,
+                   user_id: Optional[Any] = None, ledger_min: Optional[int] = None,
+                   ledger_max: Optional[int] = None, after: Optional[Tuple[int, int, int]] = None,
+                   limit: int = 500) -> List[sqlite3.Row]:
+        """
+        One page of raw event rows in ledger order (oldest first), for bulk reads.
+        `payload` is left as stored JSON text and the decode cache is not touched.
+        `after` is the (ledger_index, tx_index, memo_index) of the last row already read.
+        """
+        sql = """SELECT e.tx_hash, e.memo_index, e.ledger_index, e.tx_index, e.date, e.user_id,
+                        e.type, e.purchase_id, e.position_id, e.market_ticker, e.payload, t.result
+                 FROM events e
+                 LEFT JOIN transactions t ON t.tx_hash = e.tx_hash
+                 WHERE e.account = ?"""
+        params: List[Any] = [account]
+        if event_type:
+            sql += " AND e.type = ?"
+            params.append(event_type)
+        if user_id is not None:
+            sql += " AND e.user_id = ?"
+            params.append(str(user_id))
+        if ledger_min is not None:
+            sql += " AND e.ledger_index >= ?"
+            params.append(ledger_min)
+        if ledger_max is not None:
+            sql += " AND e.ledger_index <= ?"
+            params.append(ledger_max)
+        if after:
+            ledger, tx_index, memo_index = after
+            sql += """ AND e.ledger_index >= ? AND (e.ledger_index > ? OR e.tx_index > ?
+                       OR (e.tx_index = ? AND e.memo_index > ?))"""
+            params += [ledger, ledger, tx_index, tx_index, memo_index]
+        sql += " ORDER BY e.ledger_index, e.tx_index, e.memo_index LIMIT ?"
+        params.append(limit)
+        return self._conn.execute(sql, params).fetchall()
+
+    def events_since(self, account: str, after_rowid: int) -> List[sqlite3.Row]:
+        """
+        Raw event rows inserted after `after_rowid`, in insertion order.
+        For listeners: safe to call from `apply()` inside an ingest.
+        """
+        return self._conn.execute(
+            """SELECT rowid, tx_hash, memo_index, ledger_index, type, payload FROM events
+               WHERE account = ? AND rowid > ? ORDER BY rowid""",
+            (account, after_rowid)
+        ).fetchall()
+
+    def account_row(self, table: str, account: str) -> Optional[sqlite3.Row]:
+        """The row of a per-account table (e.g. a listener's totals), or None."""
+        return self._conn.execute(
+            f"SELECT * FROM {table} WHERE account = ?", (account,)
+        ).fetchone()
+
+    def transaction_count(self, account: str) -> int:
+        """Number of indexed transactions for an account."""
+        row = self._conn.execute(
+            "SELECT COUNT(*) AS n FROM transactions WHERE account = ?", (account,)
+        ).fetchone()
+        return row["n"]
+
+    def recent_transactions(self, account: str, limit: int = 20, caller: str = "index",
+                            after: Optional[Tuple[int, int, int]] = None) -> List[Dict[str, Any]]:
+        """
+        Newest transactions for an account, one entry per memo event (so every memo
+        of a batched transaction is listed) and one with empty data for a transaction
+        without memos (`memo_index` -1). `after` is the (ledger_index, tx_index,
+        memo_index) of the last entry of the previous page.
+        """
+        keyset = ""
+        params: List[Any] = [account]
+        if after:
+            keyset = """AND t.ledger_index <= ? AND (t.ledger_index < ? OR t.tx_index < ?
+                        OR (t.tx_index = ? AND COALESCE(e.memo_index, -1) > ?))"""
+            params += [after[0], after[0], after[1], after[1], after[2]]
+        rows = self._conn.execute(
+            f"""SELECT t.tx_hash, t.ledger_index, t.tx_index, t.date, t.transaction_type,
+                       t.result, COALESCE(e.memo_index, -1) AS memo_index, e.payload
+                FROM transactions t
+                LEFT JOIN events e ON e.tx_hash = t.tx_hash
+                WHERE t.account = ? {keyset}
+                ORDER BY t.ledger_index DESC, t.tx_index DESC, memo_index ASC
+                LIMIT ?""",
+            params + [limit]
+        ).fetchall()
+        return [{
+            "hash": row["tx_hash"],
+            "ledger_index": row["ledger_index"],
+            "tx_index": row["tx_index"],
+            "memo_index": row["memo_index"],
+            "date": row["date"],
+            "transaction_type": row["transaction_type"],
+            "result": row["result"],
+            "data": memo_decoder.payload(row["tx_hash"], row["memo_index"], row["payload"], caller)
+                    if row["payload"] is not None else {},
+        } for row in rows]
@@ -0,0 +1,200 @@
+"""
+Winback Ledger Stream
+=====================
+Background WebSocket subscription to the XRP Ledger.
+
+Instead of every poll of `/blockchain/feed`, `/blockchain/status` or
+`/user/{id}/history` turning into an `AccountTx` / `ServerInfo` round-trip,
+one long-lived connection subscribes to the `ledger` stream and to the
+`accounts` stream for the platform wallets. The stream keeps the validated
+ledger tip and the most recent transactions in memory, hands transactions to
+registered listeners (e.g. the ledger index), and fans events out to any
+number of SSE / WebSocket clients.
+
+After every (re)connect the `on_connect` hooks run (used to backfill the
+index for the time the stream was down); only then is the stream `live`.
+Dropped connections are retried with exponential backoff.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from xrpl.asyncio.clients import AsyncWebsocketClient
+from xrpl.models.requests import StreamParameter, Subscribe
+
+RECENT_TRANSACTIONS = 200
+SUBSCRIBER_QUEUE_SIZE = 100
+STALE_SECONDS = 30.0        # reconnect if no message arrives for this long
+BACKOFF_INITIAL_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+Event = Dict[str, Any]
+
+
+class LedgerStream:
+    """Subscribes to ledger closes and account transactions and fans them out."""
+
+    def __init__(self, url: str, recent_size: int = RECENT_TRANSACTIONS,
+                 client_factory: Callable[[str], Any] = AsyncWebsocketClient):
+        self.url = url
+        self.client_factory = client_factory
+        self.accounts: Set[str] = set()
+
+        # Called with each validated transaction message / ledgerClosed message
+        self.transaction_listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.ledger_listeners: List[Callable[[Dict[str, Any]], None]] = []
+        # Awaited after each (re)connect, before the stream counts as live
+        self.on_connect: List[Callable[[], Awaitable[None]]] = []
+
+        self.tip: Optional[Dict[str, Any]] = None
+        self.tip_at = 0.0
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=recent_size)
+        self.connected = False
+        self.live = False
+
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+
+        self.connects = 0
+        self.ledgers_seen = 0
+        self.transactions_seen = 0
+        self.events_dropped = 0
+        self.last_error: Optional[str] = None
+
+    # --- Subscriptions ---
+    async def watch(self, account: str):
+        """Add an account to the `accounts` subscription."""
+        if account in self.accounts:
+            return
+        self.accounts.add(account)
+        if self.connected:
+            await self._client.send(Subscribe(accounts=[account]))
+
+    def tip_age(self) -> Optional[float]:
+        """Seconds since the last ledger close was received (None if never)."""
+        return time.monotonic() - self.tip_at if self.tip else None
+
+    # --- Fan-out ---
+    def subscribe(self) -> asyncio.Queue:
+        """Register a client queue that receives every published event."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: str, data: Any):
+        """Send an event to all subscribers. Slow subscribers lose events."""
+        message = {"event": event, "data": data}
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.events_dropped += 1
+
+    # --- Message handling ---
+    def _handle(self, message: Dict[str, Any]):
+        kind = message.get("type")
+
+        if kind == "ledgerClosed":
+            self.tip = {
+                "ledger_index": message.get("ledger_index"),
+                "ledger_hash": message.get("ledger_hash"),
+                "ledger_time": message.get("ledger_time"),
+                "txn_count": message.get("txn_count"),
+                "validated_ledgers": message.get("validated_ledgers"),
+            }
+            self.tip_at = time.monotonic()
+            self.ledgers_seen += 1
+            for listener in self.ledger_listeners:
+                self._call(listener, message)
+            self.publish("ledger", self.tip)
+
+        elif kind == "transaction" and message.get("validated"):
+            self.recent.append(message)
+            self.transactions_seen += 1
+            for listener in self.transaction_listeners:
+                self._call(listener, message)
+
+    @staticmethod
+    def _call(listener: Callable[[Dict[str, Any]], None], message: Dict[str, Any]):
+        try:
+            listener(message)
+        except Exception as e:
+            print(f"⚠️ Ledger stream listener failed: {e}")
+
+    # --- Connection loop ---
+    async def _session(self):
+        async with self.client_factory(self.url) as client:
+            self._client = client
+            response = await client.request(Subscribe(
+                streams=[StreamParameter.LEDGER],
+                accounts=sorted(self.accounts) or None
+            ))
+            if not response.is_successful():
+                raise Exception(f"Subscribe failed: {response.result}")
+
+            self.connected = True
+            self.connects += 1
+            print(f"📡 Ledger stream connected ({len(self.accounts)} accounts)")
+
+            # Subscribed before backfilling, so nothing falls in between
+            for hook in self.on_connect:
+                await hook()
+            self.live = True
+
+            messages = client.__aiter__()
+            while True:
+                message = await asyncio.wait_for(messages.__anext__(), timeout=STALE_SECONDS)
+                self._handle(message)
+
+    async def _run(self):
+        backoff = BACKOFF_INITIAL_SECONDS
+        while True:
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except (Exception, StopAsyncIteration) as e:
+                self.last_error = str(e) or type(e).__name__
+                print(f"⚠️ Ledger stream disconnected: {self.last_error}")
+            finally:
+                if self.connected:
+                    backoff = BACKOFF_INITIAL_SECONDS
+                self.connected = False
+                self.live = False
+                self._client = None
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, BACKOFF_MAX_SECONDS)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "connected": self.connected,
+            "live": self.live,
+            "accounts": sorted(self.accounts),
+            "tip": self.tip,
+            "tip_age_seconds": round(self.tip_age(), 2) if self.tip else None,
+            "connects": self.connects,
+            "ledgers_seen": self.ledgers_seen,
+            "transactions_seen": self.transactions_seen,
+            "recent_transactions": len(self.recent),
+            "subscribers": len(self._subscribers),
+            "events_dropped": self.events_dropped,
+            "last_error": self.last_error,
+        }
@@ -11,24 +11,51 @@ Features:
 - Complete audit trail
 """
 
-import binascii
+import asyncio
+import csv
+import hmac
+import io
 import json
+import os
 import time
 import traceback
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Optional, Dict, Any
-from fastapi import FastAPI, HTTPException
+from typing import Optional, Dict, Any, List
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional # Added for the filter
 
 # --- XRPL ASYNC IMPORTS ---
-from xrpl.asyncio.clients import AsyncJsonRpcClient
 from xrpl.asyncio.wallet import generate_faucet_wallet
-from xrpl.asyncio.transaction import submit_and_wait
 from xrpl.models.transactions import AccountSet, Payment, Memo
-from xrpl.models.requests import AccountTx, AccountInfo
-from xrpl.utils import str_to_hex, ripple_time_to_datetime, xrp_to_drops, drops_to_xrp
+from xrpl.utils import str_to_hex, ripple_time_to_datetime, ripple_time_to_posix, xrp_to_drops
+
+from analytics import AnalyticsAggregator
+from balances import BalanceCache, affected_accounts
+from batching import MemoBatcher
+from jobs import InvalidCallbackURL, JobQueue, check_callback_url
+from idempotency import IdempotencyConflict, IdempotencyStore, fingerprint
+from keystore import Keystore
+from ledger_index import LedgerIndex, decode_cursor, encode_cursor
+from ledger_stream import LedgerStream
+from rpc_pool import PooledJsonRpcClient
+from settlement import SettlementEngine
+from shared_state import SharedState
+import memo_codec
+import metrics
+import tracing
+from memos import memo_decoder
+from profiler import ProfilerBusy, profiler
+from submitter import SubmissionEngine
+from tickets import TicketPool
+from validation_tracker import ValidationTracker
+from wallet_pool import WalletPool
+
+# Counted per request in traces (see tracing.py)
+ripple_time_to_datetime = tracing.timed("ripple_time_to_datetime")(ripple_time_to_datetime)
 
 app = FastAPI(
     title="Winback XRPL API",
@@ -43,17 +70,132 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """
+    Trace the request (ID in X-Trace-Id) and record its latency per route template
+    for /metrics (streams: until the headers are sent).
+    """
+    started = time.perf_counter()
+    status = 500
+    trace_id = tracing.new_trace_id(request.headers.get("x-trace-id"))
+    with tracing.trace(f"{request.method} {request.url.path}", trace_id) as current:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers["X-Trace-Id"] = trace_id
+            return response
+        finally:
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            current.name = f"{request.method} {route}"
+            current.root.attrs.update(path=request.url.path, status=status)
+            metrics.http_request_duration.observe(
+                time.perf_counter() - started, request.method, route, status
+            )
+
 # --- CONFIGURATION ---
 XRPL_URL = "https://s.altnet.rippletest.net:51234"
-client = AsyncJsonRpcClient(XRPL_URL)
+# Comma-separated rippled JSON-RPC endpoints; reads go to the healthiest, slow ones get hedged
+XRPL_URLS = [u.strip() for u in os.environ.get(
+    "XRPL_URLS", f"{XRPL_URL},https://testnet.xrpl-labs.com"
+).split(",") if u.strip()]
+XRPL_HEDGE_SECONDS = float(os.environ.get("WINBACK_XRPL_HEDGE_MS", "300")) / 1000
+client = PooledJsonRpcClient(XRPL_URLS, hedge_after=XRPL_HEDGE_SECONDS)
+
+# Local ledger index (decoded memo events)
+INDEX_DB_PATH = os.environ.get("WINBACK_INDEX_DB", "winback_index.db")
+INDEX_REFRESH_SECONDS = float(os.environ.get("WINBACK_INDEX_REFRESH_SECONDS", "2"))
+ledger_index = LedgerIndex(INDEX_DB_PATH)
+analytics = AnalyticsAggregator(ledger_index)
+_index_lock = asyncio.Lock()
+_index_synced_at = 0.0
+
+# Worker processes for `python main.py`; more than one shares wallet, sequence
+# and Ticket state through the index file (needs WINBACK_KEYSTORE_KEY)
+WORKERS = int(os.environ.get("WINBACK_WORKERS", "1"))
+shared_state = SharedState(INDEX_DB_PATH) if WORKERS > 1 else None
+
+# Durable queue for async-mode writes (same SQLite file as the index)
+JOB_WORKERS = int(os.environ.get("WINBACK_JOB_WORKERS", "8"))
+# With several workers, jobs running this long belonged to a worker that died
+JOB_STALE_SECONDS = 300.0
+job_queue = JobQueue(INDEX_DB_PATH)
+
+# Dedupe for ledger writes: Idempotency-Key header and natural keys (same SQLite file)
+idempotency = IdempotencyStore(INDEX_DB_PATH, shared=shared_state is not None)
+
+# Push updates over a WebSocket subscription instead of polling (0 disables)
+XRPL_WS_URL = os.environ.get("XRPL_WS_URL", "wss://s.altnet.rippletest.net:51233")
+LEDGER_STREAM_ENABLED = os.environ.get("WINBACK_LEDGER_STREAM", "1") != "0"
+STREAM_TIP_MAX_AGE_SECONDS = 10.0
+STREAM_HEARTBEAT_SECONDS = 15.0
+ledger_stream = LedgerStream(XRPL_WS_URL)
+# Reads of validated state are reused until the pushed ledger tip moves
+client.single_flight.ledger_tip = lambda: (
+    ledger_stream.tip["ledger_index"] if ledger_stream.live and ledger_stream.tip else None
+)
+
+# Balance lookups: cached per address, invalidated when a tx touches the account
+BALANCE_LOOKUP_CONCURRENCY = int(os.environ.get("WINBACK_BALANCE_CONCURRENCY", "8"))
+balances = BalanceCache(
+    client, BALANCE_LOOKUP_CONCURRENCY,
+    watched=lambda address: ledger_stream.live and address in ledger_stream.accounts
+)
 
 # Wallet storage
 COMPANY_WALLET = None
 ESCROW_WALLET = None
 USER_WALLETS: Dict[int, Any] = {}
 
+# Encrypted wallet seeds, so restarts reuse the same accounts (needs WINBACK_KEYSTORE_KEY)
+KEYSTORE_PATH = os.environ.get("WINBACK_KEYSTORE_DB", "winback_keystore.db")
+keystore = Keystore(KEYSTORE_PATH, os.environ.get("WINBACK_KEYSTORE_KEY"))
+_wallets_lock = asyncio.Lock()
+_provision_task: Optional[asyncio.Task] = None
+PROVISION_RETRY_SECONDS = 10.0
+# Company account the stream is subscribed to and the index was backfilled for;
+# only then may pushed ledger closes move the index checkpoint
+_stream_indexed: Optional[str] = None
+
+# Pre-funded wallets handed to new users (0 disables)
+WALLET_POOL_SIZE = int(os.environ.get("WINBACK_WALLET_POOL_SIZE", "5"))
+WALLET_POOL_LOW_WATER = int(os.environ.get("WINBACK_WALLET_POOL_LOW_WATER", "2"))
+wallet_pool = WalletPool(client, generate_faucet_wallet, WALLET_POOL_SIZE, WALLET_POOL_LOW_WATER)
+wallet_pool.listeners.append(lambda wallet: keystore.put(f"pool:{wallet.address}", wallet))
+if shared_state is not None:
+    # Every worker draws from the pool wallets in the keystore
+    wallet_pool.restock = lambda: list(keystore.load("pool:").values())
+
+# Pipelined submission for the company wallet
+COMPANY_SUBMITTER: Optional[SubmissionEngine] = None
+# Settles every transaction waiting on validation once per ledger close
+validation_tracker = ValidationTracker(client, live=lambda: ledger_stream.live)
+
+# Ticket lanes for the company wallet (0 disables)
+TICKET_POOL_SIZE = int(os.environ.get("WINBACK_TICKET_POOL_SIZE", "20"))
+TICKET_REFILL_THRESHOLD = int(os.environ.get("WINBACK_TICKET_REFILL_THRESHOLD", "5"))
+
+# Purchases arriving within this window share one AccountSet (0 disables)
+PURCHASE_COALESCE_SECONDS = float(os.environ.get("WINBACK_PURCHASE_COALESCE_MS", "50")) / 1000
+MAX_BATCH_PURCHASES = 500
+# Largest page for cursor-paginated reads (history, trail, feed)
+MAX_PAGE_SIZE = 500
+# Events read from the index per chunk of a streamed /export
+EXPORT_CHUNK_SIZE = 500
+
+# Bulk market settlement: concurrent cashback payments per run
+SETTLEMENT_CONCURRENCY = int(os.environ.get("WINBACK_SETTLEMENT_CONCURRENCY", "8"))
+
+# New memos are written as compact binary Winback_v2 ("v1" keeps JSON); both are always readable
+MEMO_FORMAT = os.environ.get("WINBACK_MEMO_FORMAT", "v2")
+
+# Token for the /debug endpoints (traces, profiler); unset disables them
+ADMIN_TOKEN = os.environ.get("WINBACK_ADMIN_TOKEN")
+
 # --- TRANSACTION TYPES ---
 class TransactionType:
     PURCHASE = "PURCHASE"
@@ -93,33 +235,135 @@ class SettlementRequest(BaseModel):
     cashback_amount: float
     roi: float
 
+class MarketSettlementRequest(BaseModel):
+    final_price: float  # final YES price in cents
+    result: Optional[str] = None  # "YES" / "NO" once the market has resolved
+    settlement_reason: str = "market_resolved"
+
 # --- WALLET MANAGEMENT ---
-async def initialize_wallets():
-    """Initialize company and escrow wallets on startup."""
+def shared_lock(name: str):
+    """A lock across worker processes when running several, else a no-op."""
+    return shared_state.lock(name) if shared_state is not None else nullcontext()
+
+def leading() -> bool:
+    """Whether this process runs the once-per-machine background loops."""
+    return shared_state is None or shared_state.is_leader
+
+def load_wallets():
+    """Restore wallets from the keystore (local only, no network calls)."""
     global COMPANY_WALLET, ESCROW_WALLET
     
-    if COMPANY_WALLET is None:
-        print("🔄 Funding Company Wallet on Testnet...")
-        COMPANY_WALLET = await generate_faucet_wallet(client)
-        print(f"✅ Company Wallet: {COMPANY_WALLET.address}")
+    stored = keystore.load()
+    COMPANY_WALLET = COMPANY_WALLET or stored.get("company")
+    ESCROW_WALLET = ESCROW_WALLET or stored.get("escrow")
+    for name, wallet in stored.items():
+        if name.startswith("user:"):
+            USER_WALLETS.setdefault(int(name[len("user:"):]), wallet)
+    wallet_pool.add([w for name, w in stored.items() if name.startswith("pool:")])
+    
+    if stored:
+        print(f"🔑 Loaded {len(stored)} wallets from keystore")
+
+async def initialize_wallets():
+    """Initialize company and escrow wallets, funding any that are missing."""
+    global COMPANY_WALLET, ESCROW_WALLET, COMPANY_SUBMITTER
+    
+    async with _wallets_lock, shared_lock("platform-wallets"):
+        # Another worker may have funded them while we waited for the lock
+        COMPANY_WALLET = COMPANY_WALLET or keystore.get("company")
+        ESCROW_WALLET = ESCROW_WALLET or keystore.get("escrow")
+        
+        if COMPANY_WALLET is None:
+            print("🔄 Funding Company Wallet on Testnet...")
+            COMPANY_WALLET = await generate_faucet_wallet(client)
+            keystore.put("company", COMPANY_WALLET)
+            print(f"✅ Company Wallet: {COMPANY_WALLET.address}")
+        await watch_company()
+        
+        if COMPANY_SUBMITTER is None or COMPANY_SUBMITTER.wallet is not COMPANY_WALLET:
+            COMPANY_SUBMITTER = SubmissionEngine(
+                client, COMPANY_WALLET, shared=shared_state, tracker=validation_tracker
+            )
+            if TICKET_POOL_SIZE > 0:
+                COMPANY_SUBMITTER.tickets = TicketPool(
+                    COMPANY_SUBMITTER, TICKET_POOL_SIZE, TICKET_REFILL_THRESHOLD, shared=shared_state
+                )
+                if leading():
+                    COMPANY_SUBMITTER.tickets.start()
+        
+        if ESCROW_WALLET is None:
+            print("🔄 Funding Escrow Wallet on Testnet...")
+            ESCROW_WALLET = await generate_faucet_wallet(client)
+            keystore.put("escrow", ESCROW_WALLET)
+            print(f"✅ Escrow Wallet: {ESCROW_WALLET.address}")
+
+async def watch_company():
+    """Subscribe to the company account, then backfill what validated before the subscription."""
+    global _stream_indexed
+    if _stream_indexed == COMPANY_WALLET.address:
+        return
+    await ledger_stream.watch(COMPANY_WALLET.address)
+    await refresh_index(force=True)
+    _stream_indexed = COMPANY_WALLET.address
+
+async def provision_wallets():
+    """Background startup task: fund missing platform wallets, then watch them."""
+    while True:
+        try:
+            await initialize_wallets()
+            break
+        except Exception as e:
+            print(f"⚠️ Wallet provisioning failed, retrying: {e}")
+            await asyncio.sleep(PROVISION_RETRY_SECONDS)
     
-    if ESCROW_WALLET is None:
-        print("🔄 Funding Escrow Wallet on Testnet...")
-        ESCROW_WALLET = await generate_faucet_wallet(client)
-        print(f"✅ Escrow Wallet: {ESCROW_WALLET.address}")
+    await ledger_stream.watch(ESCROW_WALLET.address)
 
 async def get_or_create_user_wallet(user_id: int):
     """Get existing user wallet or create new one."""
-    if user_id not in USER_WALLETS:
-        print(f"🔄 Creating wallet for user {user_id}...")
-        USER_WALLETS[user_id] = await generate_faucet_wallet(client)
-        print(f"✅ User {user_id} Wallet: {USER_WALLETS[user_id].address}")
+    if user_id not in USER_WALLETS and shared_state is not None:
+        # Another worker may have assigned one
+        stored = keystore.get(f"user:{user_id}")
+        if stored is not None:
+            USER_WALLETS.setdefault(user_id, stored)
+    
+    while user_id not in USER_WALLETS:
+        wallet = await wallet_pool.take()
+        if shared_state is None:
+            # A concurrent request may have assigned one while we waited
+            if USER_WALLETS.setdefault(user_id, wallet) is wallet:
+                if not keystore.rename(f"pool:{wallet.address}", f"user:{user_id}"):
+                    keystore.put(f"user:{user_id}", wallet)
+                print(f"✅ User {user_id} Wallet: {wallet.address}")
+            else:
+                wallet_pool.put_back(wallet)
+            break
+        
+        # Across workers the keystore decides: the rename fails if another worker
+        # took this pool wallet or assigned this user a wallet first
+        if keystore.rename(f"pool:{wallet.address}", f"user:{user_id}"):
+            USER_WALLETS.setdefault(user_id, wallet)
+            print(f"✅ User {user_id} Wallet: {wallet.address}")
+            break
+        stored = keystore.get(f"user:{user_id}")
+        if stored is not None:
+            if keystore.get(f"pool:{wallet.address}") is not None:
+                wallet_pool.put_back(wallet)
+            USER_WALLETS.setdefault(user_id, stored)
     
     return USER_WALLETS[user_id]
 
 # --- MEMO HELPERS ---
 def create_memo(payload: dict, memo_type: str = "Winback_v1") -> Memo:
     """Create XRPL memo from payload."""
+    if MEMO_FORMAT == "v2" and memo_type == memo_codec.MEMO_TYPE_V1:
+        data = memo_codec.encode(payload)
+        if data is not None:
+            return Memo(
+                memo_data=data.hex().upper(),
+                memo_type=str_to_hex(memo_codec.MEMO_TYPE_V2),
+                memo_format=str_to_hex(memo_codec.MEMO_FORMAT_V2)
+            )
+    
     return Memo(
         memo_data=str_to_hex(json.dumps(payload)),
         memo_type=str_to_hex(memo_type),
@@ -175,12 +419,157 @@ def create_settlement_memo(user_id: int, settlement: dict) -> Memo:
     }
     return create_memo(payload)
 
+# --- INDEX HELPERS ---
+async def refresh_index(force: bool = False):
+    """Pull new company-wallet transactions into the local index (throttled)."""
+    global _index_synced_at
+
+    if not COMPANY_WALLET:
+        return
+    # While subscribed, new transactions are pushed into the index as they validate
+    if not force and ledger_stream.live:
+        return
+    if not force and time.monotonic() - _index_synced_at < INDEX_REFRESH_SECONDS:
+        return
+
+    async with _index_lock, shared_lock("index-sync"):
+        # Another request (or worker) may have synced while we waited for the lock
+        if not force and time.monotonic() - _index_synced_at < INDEX_REFRESH_SECONDS:
+            return
+        with tracing.span("index.sync"):
+            await ledger_index.sync(client, COMPANY_WALLET.address)
+        _index_synced_at = time.monotonic()
+
+def parse_cursor(cursor: Optional[str], size: int) -> Optional[tuple]:
+    """Decode a page cursor from a query string, or 400."""
+    if not cursor:
+        return None
+    try:
+        return decode_cursor(cursor, size)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paged(rows: List[Dict[str, Any]], limit: Optional[int], *keys: str):
+    """Trim a limit+1 fetch to `limit` rows and the cursor for the next page (None on the last)."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*(rows[-1][k] for k in keys))
+
+def logged_event(lookup, key: str, event_type: str) -> Optional[Dict[str, Any]]:
+    """The indexed `event_type` event for a purchase/position ID, if it is already on ledger."""
+    for event in lookup(COMPANY_WALLET.address, key, caller="idempotency"):
+        if event["type"] == event_type:
+            return event
+    return None
+
+def index_submitted(response):
+    """Index a validated transaction returned by submit_and_wait."""
+    balances.invalidate_touched(response.result.get("meta", {}), response.result.get("ledger_index"))
+    try:
+        ledger_index.ingest(COMPANY_WALLET.address, [response.result])
+    except Exception as e:
+        print(f"⚠️ Index write failed: {e}")
+
+def on_stream_transaction(message: Dict[str, Any]):
+    """Index a pushed company-wallet transaction and forward it to feed subscribers."""
+    touched = affected_accounts(message.get("meta", {}))
+    for address in touched:
+        balances.invalidate(address, message.get("ledger_index"))
+    
+    if not COMPANY_WALLET or COMPANY_WALLET.address not in touched:
+        return
+    # Transaction messages follow their ledger's ledgerClosed message
+    tip = ledger_stream.tip or {}
+    if "date" not in message and tip.get("ledger_index") == message.get("ledger_index"):
+        message["date"] = tip.get("ledger_time")
+    
+    ledger_index.ingest(COMPANY_WALLET.address, [message])
+    decoded = memo_decoder.decode(message, caller="stream")
+    # One feed item per memo, so every purchase in a batched transaction shows up
+    for memo_index, memo_data in decoded.memos or [(-1, {})]:
+        ledger_stream.publish("transaction", feed_entry(
+            decoded.hash,
+            decoded.ledger_index,
+            decoded.date,
+            decoded.result == "tesSUCCESS",
+            memo_data,
+            memo_index
+        ))
+
+def on_stream_ledger(message: Dict[str, Any]):
+    """Advance the index checkpoint: every earlier ledger has been pushed to us."""
+    if not (COMPANY_WALLET and _stream_indexed == COMPANY_WALLET.address):
+        return  # company transactions aren't being pushed yet
+    if ledger_stream.live and message.get("ledger_index"):
+        ledger_index.ingest(COMPANY_WALLET.address, [], checkpoint=message["ledger_index"] - 1)
+
+ledger_stream.transaction_listeners.append(on_stream_transaction)
+ledger_stream.ledger_listeners.append(on_stream_ledger)
+# Pushed closes and transactions settle pending submissions without polling
+ledger_stream.transaction_listeners.append(validation_tracker.observe)
+ledger_stream.ledger_listeners.append(
+    lambda message: validation_tracker.ledger_closed(message.get("ledger_index") or 0)
+)
+# Catch up on whatever validated while the stream was disconnected
+ledger_stream.on_connect.append(lambda: refresh_index(force=True))
+
 # --- ROUTES ---
 
 @app.on_event("startup")
 async def startup():
-    """Initialize wallets on server start."""
-    await initialize_wallets()
+    """Load stored wallets and start background work; missing wallets are funded in the background."""
+    global _provision_task
+    
+    if not keystore.enabled:
+        if shared_state is not None:
+            # Workers would each fund their own platform and user wallets
+            raise RuntimeError("WINBACK_WORKERS > 1 needs WINBACK_KEYSTORE_KEY: workers share wallets through the keystore")
+        print("⚠️ WINBACK_KEYSTORE_KEY not set - wallets will not survive a restart")
+    load_wallets()
+    
+    job_queue.start(concurrency=JOB_WORKERS, requeue=shared_state is None)
+    if LEDGER_STREAM_ENABLED:
+        ledger_stream.start()
+    _provision_task = asyncio.create_task(provision_wallets())
+    if shared_state is None:
+        start_leader_work()
+    else:
+        shared_state.on_elected.append(start_leader_work)
+        shared_state.on_deposed.append(stop_leader_work)
+        shared_state.while_leading.append(lambda: job_queue.requeue(older_than=JOB_STALE_SECONDS))
+        shared_state.while_leading.append(settlement_engine.resume_all)
+        shared_state.start()
+
+def start_leader_work():
+    """Background loops that must run in one process only."""
+    wallet_pool.start()
+    if COMPANY_SUBMITTER and COMPANY_SUBMITTER.tickets:
+        COMPANY_SUBMITTER.tickets.start()
+    settlement_engine.resume_all()
+
+async def stop_leader_work():
+    await wallet_pool.stop()
+    if COMPANY_SUBMITTER and COMPANY_SUBMITTER.tickets:
+        await COMPANY_SUBMITTER.tickets.stop()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop background workers."""
+    if _provision_task is not None:
+        _provision_task.cancel()
+    if shared_state is not None:
+        await shared_state.stop()
+    await job_queue.stop()
+    await settlement_engine.stop()
+    await purchase_batcher.stop()
+    await settlement_batcher.stop()
+    await ledger_stream.stop()
+    await wallet_pool.stop()
+    await validation_tracker.stop()
+    await client.close()
+    if COMPANY_SUBMITTER and COMPANY_SUBMITTER.tickets:
+        await COMPANY_SUBMITTER.tickets.stop()
 
 @app.get("/")
 async def root():
@@ -191,150 +580,525 @@ async def root():
         "network": "testnet",
         "company_wallet": COMPANY_WALLET.address if COMPANY_WALLET else None,
         "escrow_wallet": ESCROW_WALLET.address if ESCROW_WALLET else None,
+        "wallets_ready": bool(COMPANY_SUBMITTER and ESCROW_WALLET),
         "explorer_base": "https://testnet.xrpl.org"
     }
 
-@app.post("/purchase/log")
-async def log_purchase(req: PurchaseRequest):
-    """
-    Log purchase to XRPL blockchain.
-    Called after user completes checkout.
-    """
-    try:
-        await initialize_wallets()
-        user_wallet = await get_or_create_user_wallet(req.user_id)
-        
-        # Create purchase memo
-        memo = create_purchase_memo(req.user_id, req.dict())
+# --- LEDGER WRITES ---
+async def submit_memo_group(memos: List[Memo]):
+    """Log a group of memos in one AccountSet on the company wallet."""
+    await initialize_wallets()
+    tx = AccountSet(
+        account=COMPANY_WALLET.address,
+        memos=memos
+    )
+    response = await COMPANY_SUBMITTER.submit_and_wait(tx)
+    index_submitted(response)
+    return response
+
+purchase_batcher = MemoBatcher(submit_memo_group, PURCHASE_COALESCE_SECONDS)
+
+async def _log_purchase(req: PurchaseRequest) -> Dict[str, Any]:
+    """Submit a purchase log and wait for validation."""
+    await initialize_wallets()
+    user_wallet = await get_or_create_user_wallet(req.user_id)
+    
+    # A retry of a purchase that already made it on ledger: report the original
+    logged = logged_event(ledger_index.purchase_events, req.purchase_id, TransactionType.PURCHASE)
+    if logged:
+        return {
+            "status": "success",
+            "tx_hash": logged["hash"],
+            "memo_index": logged["memo_index"],
+            "explorer_url": f"https://testnet.xrpl.org/transactions/{logged['hash']}",
+            "user_wallet": user_wallet.address,
+            "message": "Purchase already logged to XRP Ledger"
+        }
+    
+    # Create purchase memo
+    memo = create_purchase_memo(req.user_id, req.dict())
+    
+    # Log purchase on company wallet (may share a tx with concurrent purchases)
+    response, memo_index = await purchase_batcher.add(memo)
+    tx_hash = response.result.get("hash")
+    
+    return {
+        "status": "success",
+        "tx_hash": tx_hash,
+        "memo_index": memo_index,
+        "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash}",
+        "user_wallet": user_wallet.address,
+        "message": "Purchase logged to XRP Ledger"
+    }
+
+async def _configure_prediction(req: PredictionConfigRequest) -> Dict[str, Any]:
+    """Submit a prediction configuration and wait for validation."""
+    await initialize_wallets()
+    
+    logged = logged_event(ledger_index.position_events, req.position_id, TransactionType.PREDICTION_CONFIG)
+    if logged:
+        tx_hash = logged["hash"]
+    else:
+        # Create prediction memo
+        memo = create_prediction_memo(req.user_id, req.dict())
         
-        # Log purchase on company wallet
+        # Log to blockchain
         tx = AccountSet(
             account=COMPANY_WALLET.address,
             memos=[memo]
         )
         
-        response = await submit_and_wait(tx, client, COMPANY_WALLET)
+        response = await COMPANY_SUBMITTER.submit_and_wait(tx)
+        index_submitted(response)
         tx_hash = response.result.get("hash")
+    
+    return {
+        "status": "success",
+        "tx_hash": tx_hash,
+        "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash}",
+        "position_id": req.position_id,
+        "market_ticker": req.market_ticker,
+        "direction": req.prediction_direction,
+        "message": "Prediction configured on XRP Ledger"
+    }
+
+async def send_cashback(user_wallet, position_id: str, cashback_amount: float, roi: float):
+    """Pay a winning position's cashback to the user. Returns (response, XRP amount)."""
+    # Convert to XRP drops (1 XRP = 1,000,000 drops)
+    # For demo, we'll use a scaled amount (1 USD = 0.01 XRP)
+    xrp_amount = cashback_amount * 0.01
+    
+    payment_tx = Payment(
+        account=COMPANY_WALLET.address,
+        destination=user_wallet.address,
+        amount=xrp_to_drops(xrp_amount),
+        memos=[create_memo({
+            "type": TransactionType.CASHBACK_PAYMENT,
+            "position_id": position_id,
+            "amount_usd": cashback_amount,
+            "amount_xrp": xrp_amount,
+            "roi": roi
+        })]
+    )
+    
+    payment_response = await COMPANY_SUBMITTER.submit_and_wait(payment_tx)
+    index_submitted(payment_response)
+    return payment_response, xrp_amount
+
+async def _settle_position(req: SettlementRequest) -> Dict[str, Any]:
+    """Submit a settlement log (and cashback payment on a win)."""
+    await initialize_wallets()
+    user_wallet = await get_or_create_user_wallet(req.user_id)
+    
+    # A retry only sends the steps that aren't on ledger yet
+    on_ledger = settled_on_ledger(req.position_id)
+    
+    # Log settlement
+    if TransactionType.SETTLEMENT in on_ledger:
+        settlement_hash = on_ledger[TransactionType.SETTLEMENT]["hash"]
+    else:
+        memo = create_settlement_memo(req.user_id, req.dict())
         
-        return {
-            "status": "success",
-            "tx_hash": tx_hash,
-            "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash}",
-            "user_wallet": user_wallet.address,
-            "message": "Purchase logged to XRP Ledger"
-        }
+        tx = AccountSet(
+            account=COMPANY_WALLET.address,
+            memos=[memo]
+        )
+        
+        settlement_response = await COMPANY_SUBMITTER.submit_and_wait(tx)
+        index_submitted(settlement_response)
+        settlement_hash = settlement_response.result.get("hash")
+    
+    result = {
+        "status": "success",
+        "outcome": req.outcome,
+        "settlement_hash": settlement_hash,
+        "settlement_url": f"https://testnet.xrpl.org/transactions/{settlement_hash}",
+    }
+    
+    # If user won, send cashback payment
+    if req.outcome == "win" and req.cashback_amount > 0:
+        paid = on_ledger.get(TransactionType.CASHBACK_PAYMENT)
+        if paid:
+            payment_hash = paid["hash"]
+            xrp_amount = paid["data"].get("amount_xrp", req.cashback_amount * 0.01)
+        else:
+            payment_response, xrp_amount = await send_cashback(
+                user_wallet, req.position_id, req.cashback_amount, req.roi
+            )
+            payment_hash = payment_response.result.get("hash")
+        
+        result["payment_hash"] = payment_hash
+        result["payment_url"] = f"https://testnet.xrpl.org/transactions/{payment_hash}"
+        result["cashback_xrp"] = xrp_amount
+        result["message"] = f"Cashback of ${req.cashback_amount:.2f} sent!"
+    
+    elif req.outcome == "loss":
+        result["additional_charge"] = abs(req.cashback_amount)
+        result["message"] = f"Additional charge of ${abs(req.cashback_amount):.2f} applied"
+    
+    else:
+        result["message"] = "Position settled - breakeven"
+    
+    return result
+
+def retry_on_failure(kind: str, id_field: str, handler):
+    """
+    Wrap a job handler so a failed job forgets its natural key (`<kind>:<id>`).
+    The key was stored with the 202 acceptance and would otherwise replay it
+    forever; the handlers check the ledger first, so a retry can't double-write.
+    """
+    async def run(payload: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await handler(payload)
+        except Exception:
+            idempotency.forget([f"{kind}:{payload[id_field]}"])
+            raise
+    return run
+
+# Handlers for writes accepted in async mode (?mode=async)
+job_queue.handlers.update({
+    "purchase": retry_on_failure("purchase", "purchase_id",
+                                 lambda payload: _log_purchase(PurchaseRequest(**payload))),
+    "prediction": retry_on_failure("prediction", "position_id",
+                                   lambda payload: _configure_prediction(PredictionConfigRequest(**payload))),
+    "settlement": retry_on_failure("settlement", "position_id",
+                                   lambda payload: _settle_position(SettlementRequest(**payload))),
+})
+
+# --- BULK SETTLEMENT ---
+settlement_batcher = MemoBatcher(submit_memo_group, 0)
+
+def settled_on_ledger(position_id: str) -> Dict[str, Dict[str, Any]]:
+    """SETTLEMENT / CASHBACK_PAYMENT events already indexed for a position."""
+    return {
+        e["type"]: e for e in ledger_index.position_events(COMPANY_WALLET.address, position_id, caller="settlement")
+        if e["type"] in (TransactionType.SETTLEMENT, TransactionType.CASHBACK_PAYMENT)
+    }
+
+async def settle_batch(items: List[Dict[str, Any]]) -> List[Any]:
+    """Log SETTLEMENT memos for a chunk of run items, packed into shared transactions."""
+    await initialize_wallets()
+    outcomes: List[Any] = [None] * len(items)
+    to_log = []
+    for i, item in enumerate(items):
+        # A resumed run may already have logged this one before it stopped
+        logged = settled_on_ledger(item["position_id"]).get(TransactionType.SETTLEMENT)
+        if logged:
+            outcomes[i] = (logged["hash"], logged["memo_index"])
+        else:
+            to_log.append(i)
+    
+    memos = [create_settlement_memo(items[i]["user_id"], items[i]["settlement"]) for i in to_log]
+    for i, outcome in zip(to_log, await settlement_batcher.add_many(memos)):
+        outcomes[i] = outcome if isinstance(outcome, Exception) else (
+            outcome[0].result.get("hash"), outcome[1]
+        )
+    return outcomes
+
+async def pay_settled(item: Dict[str, Any]) -> str:
+    """Send the cashback for a logged winning settlement; returns the payment hash."""
+    await initialize_wallets()
+    paid = settled_on_ledger(item["position_id"]).get(TransactionType.CASHBACK_PAYMENT)
+    if paid:
+        return paid["hash"]
+    settlement = item["settlement"]
+    user_wallet = await get_or_create_user_wallet(item["user_id"])
+    response, _ = await send_cashback(
+        user_wallet, settlement["position_id"], settlement["cashback_amount"], settlement["roi"]
+    )
+    return response.result.get("hash")
+
+settlement_engine = SettlementEngine(INDEX_DB_PATH, settle_batch, pay_settled,
+                                     concurrency=SETTLEMENT_CONCURRENCY)
+settlement_engine.listeners.append(lambda progress: ledger_stream.publish("settlement", progress))
+settlement_engine.shared = shared_state
+
+def open_positions(market_ticker: str) -> List[Dict[str, Any]]:
+    """Configured, not yet settled positions on a market, from the index."""
+    purchases: Dict[str, Dict[str, Any]] = {}
+    configs: Dict[str, Dict[str, Any]] = {}
+    settled = set()
+    for event in ledger_index.market_events(COMPANY_WALLET.address, market_ticker, caller="settlement"):
+        data = event["data"]
+        if event["type"] == TransactionType.PURCHASE:
+            purchases[str(data.get("purchase_id"))] = data
+        elif event["type"] == TransactionType.PREDICTION_CONFIG and data.get("market_ticker") == market_ticker:
+            configs[str(data["position_id"])] = data
+        elif event["type"] == TransactionType.SETTLEMENT:
+            settled.add(str(data.get("position_id")))
+    
+    positions = []
+    for position_id, config in configs.items():
+        if position_id in settled:
+            continue
+        purchase = purchases.get(str(config.get("purchase_id")), {})
+        positions.append({
+            "position_id": position_id,
+            "user_id": config["user_id"],
+            "market_ticker": market_ticker,
+            "direction": config.get("direction"),
+            "entry_price": config.get("entry_price"),
+            "max_reward_pct": config.get("max_reward_pct"),
+            "max_loss_pct": config.get("max_loss_pct"),
+            "purchase_amount": purchase.get("amount"),
+        })
+    return positions
+
+async def require_public_callback(mode: Optional[str], callback_url: Optional[str]):
+    """400 unless an async job's callback_url is http(s) on a public address."""
+    if mode == "async" and callback_url:
+        try:
+            await check_callback_url(callback_url)
+        except InvalidCallbackURL as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+def accept_job(kind: str, req: BaseModel, callback_url: Optional[str]):
+    """Queue a validated write request. Returns 202 and a body with its job ID."""
+    job_id = job_queue.enqueue(kind, req.dict(), callback_url=callback_url)
+    return 202, {
+        "status": "accepted",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "message": "Transaction queued for submission"
+    }
+
+async def run_idempotent(keys: List[Optional[str]], payload: Any, call) -> JSONResponse:
+    """
+    Run a ledger write once per key: repeats get the stored response
+    (`Idempotent-Replayed: true`) and concurrent repeats join the call in flight.
+    """
+    try:
+        status_code, body, replayed = await idempotency.run(keys, fingerprint(payload), call)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return JSONResponse(status_code=status_code, content=body,
+                        headers={"Idempotent-Replayed": "true"} if replayed else None)
+
+@app.post("/purchase/log")
+async def log_purchase(req: PurchaseRequest, mode: Optional[str] = None,
+                       callback_url: Optional[str] = None,
+                       idempotency_key: Optional[str] = Header(None)):
+    """
+    Log purchase to XRPL blockchain.
+    Called after user completes checkout.
+    With ?mode=async, returns 202 and a job ID instead of waiting for validation.
+    Deduplicated by `purchase_id` and the optional Idempotency-Key header.
+    """
+    async def call():
+        if mode == "async":
+            return accept_job("purchase", req, callback_url)
+        return 200, await _log_purchase(req)
+    
+    await require_public_callback(mode, callback_url)
+    try:
+        return await run_idempotent([
+            f"purchase:key:{idempotency_key}" if idempotency_key else None,
+            f"purchase:{req.purchase_id}"
+        ], req.dict(), call)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Purchase Log Error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/prediction/configure")
-async def configure_prediction(req: PredictionConfigRequest):
+@app.post("/purchase/log/batch")
+async def log_purchase_batch(reqs: List[PurchaseRequest],
+                             idempotency_key: Optional[str] = Header(None)):
     """
-    Log prediction configuration to XRPL.
-    Called when user sets up their prediction for a purchase.
+    Log many purchases, packing as many memos per transaction as the ledger allows.
+    Each item gets back its tx hash and memo index.
+    Purchases whose `purchase_id` is already on ledger are not logged again.
     """
+    if not reqs:
+        raise HTTPException(status_code=400, detail="No purchases given")
+    if len(reqs) > MAX_BATCH_PURCHASES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_PURCHASES} purchases per batch")
+    
+    if idempotency_key:
+        async def call():
+            return 200, await _log_purchase_batch(reqs)
+        return await run_idempotent([f"purchase_batch:key:{idempotency_key}"],
+                                    [r.dict() for r in reqs], call)
+    return await _log_purchase_batch(reqs)
+
+async def _log_purchase_batch(reqs: List[PurchaseRequest]) -> Dict[str, Any]:
     try:
         await initialize_wallets()
         
-        # Create prediction memo
-        memo = create_prediction_memo(req.user_id, req.dict())
-        
-        # Log to blockchain
-        tx = AccountSet(
-            account=COMPANY_WALLET.address,
-            memos=[memo]
-        )
+        user_ids = list({req.user_id for req in reqs})
+        wallets = await asyncio.gather(*(get_or_create_user_wallet(u) for u in user_ids))
+        user_wallets = dict(zip(user_ids, wallets))
+        
+        # Purchases already on ledger (e.g. a retried batch) are reported, not logged again
+        outcomes: Dict[int, Any] = {}
+        to_log = []
+        for i, req in enumerate(reqs):
+            logged = logged_event(ledger_index.purchase_events, req.purchase_id, TransactionType.PURCHASE)
+            if logged:
+                outcomes[i] = (logged["hash"], logged["memo_index"])
+            else:
+                to_log.append(i)
         
-        response = await submit_and_wait(tx, client, COMPANY_WALLET)
-        tx_hash = response.result.get("hash")
+        memos = [create_purchase_memo(reqs[i].user_id, reqs[i].dict()) for i in to_log]
+        for i, outcome in zip(to_log, await purchase_batcher.add_many(memos) if memos else []):
+            outcomes[i] = outcome if isinstance(outcome, Exception) else (
+                outcome[0].result.get("hash"), outcome[1]
+            )
         
+        results = []
+        tx_hashes = set()
+        for i, req in enumerate(reqs):
+            outcome = outcomes[i]
+            if isinstance(outcome, Exception):
+                results.append({
+                    "purchase_id": req.purchase_id,
+                    "status": "error",
+                    "error": str(outcome)
+                })
+                continue
+            
+            tx_hash, memo_index = outcome
+            tx_hashes.add(tx_hash)
+            results.append({
+                "purchase_id": req.purchase_id,
+                "status": "success",
+                "tx_hash": tx_hash,
+                "memo_index": memo_index,
+                "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash}",
+                "user_wallet": user_wallets[req.user_id].address
+            })
+        
+        failed = sum(1 for r in results if r["status"] == "error")
         return {
-            "status": "success",
-            "tx_hash": tx_hash,
-            "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash}",
-            "position_id": req.position_id,
-            "market_ticker": req.market_ticker,
-            "direction": req.prediction_direction,
-            "message": "Prediction configured on XRP Ledger"
+            "status": "success" if not failed else ("partial" if failed < len(results) else "error"),
+            "purchases": len(reqs),
+            "transactions": len(tx_hashes),
+            "failed": failed,
+            "results": results
         }
         
+    except Exception as e:
+        print(f"❌ Purchase Batch Error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/prediction/configure")
+async def configure_prediction(req: PredictionConfigRequest, mode: Optional[str] = None,
+                               callback_url: Optional[str] = None,
+                               idempotency_key: Optional[str] = Header(None)):
+    """
+    Log prediction configuration to XRPL.
+    Called when user sets up their prediction for a purchase.
+    With ?mode=async, returns 202 and a job ID instead of waiting for validation.
+    Deduplicated by `position_id` and the optional Idempotency-Key header.
+    """
+    async def call():
+        if mode == "async":
+            return accept_job("prediction", req, callback_url)
+        return 200, await _configure_prediction(req)
+    
+    await require_public_callback(mode, callback_url)
+    try:
+        return await run_idempotent([
+            f"prediction:key:{idempotency_key}" if idempotency_key else None,
+            f"prediction:{req.position_id}"
+        ], req.dict(), call)
+        
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Prediction Config Error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/position/settle")
-async def settle_position(req: SettlementRequest):
+async def settle_position(req: SettlementRequest, mode: Optional[str] = None,
+                          callback_url: Optional[str] = None,
+                          idempotency_key: Optional[str] = Header(None)):
     """
     Settle position and process payment.
     - Logs settlement to blockchain
     - Pays cashback if user won
+    With ?mode=async, returns 202 and a job ID instead of waiting for validation.
+    Deduplicated by `position_id` and the optional Idempotency-Key header.
     """
+    async def call():
+        if mode == "async":
+            return accept_job("settlement", req, callback_url)
+        return 200, await _settle_position(req)
+    
+    await require_public_callback(mode, callback_url)
     try:
-        await initialize_wallets()
-        user_wallet = await get_or_create_user_wallet(req.user_id)
-        
-        # Log settlement
-        memo = create_settlement_memo(req.user_id, req.dict())
-        
-        tx = AccountSet(
-            account=COMPANY_WALLET.address,
-            memos=[memo]
-        )
-        
-        settlement_response = await submit_and_wait(tx, client, COMPANY_WALLET)
-        settlement_hash = settlement_response.result.get("hash")
-        
-        result = {
-            "status": "success",
-            "outcome": req.outcome,
-            "settlement_hash": settlement_hash,
-            "settlement_url": f"https://testnet.xrpl.org/transactions/{settlement_hash}",
-        }
-        
-        # If user won, send cashback payment
-        if req.outcome == "win" and req.cashback_amount > 0:
-            # Convert to XRP drops (1 XRP = 1,000,000 drops)
-            # For demo, we'll use a scaled amount (1 USD = 0.01 XRP)
-            xrp_amount = req.cashback_amount * 0.01
-            
-            payment_tx = Payment(
-                account=COMPANY_WALLET.address,
-                destination=user_wallet.address,
-                amount=xrp_to_drops(xrp_amount),
-                memos=[create_memo({
-                    "type": TransactionType.CASHBACK_PAYMENT,
-                    "position_id": req.position_id,
-                    "amount_usd": req.cashback_amount,
-                    "amount_xrp": xrp_amount,
-                    "roi": req.roi
-                })]
-            )
-            
-            payment_response = await submit_and_wait(payment_tx, client, COMPANY_WALLET)
-            payment_hash = payment_response.result.get("hash")
-            
-            result["payment_hash"] = payment_hash
-            result["payment_url"] = f"https://testnet.xrpl.org/transactions/{payment_hash}"
-            result["cashback_xrp"] = xrp_amount
-            result["message"] = f"Cashback of ${req.cashback_amount:.2f} sent!"
-        
-        elif req.outcome == "loss":
-            result["additional_charge"] = abs(req.cashback_amount)
-            result["message"] = f"Additional charge of ${abs(req.cashback_amount):.2f} applied"
-        
-        else:
-            result["message"] = "Position settled - breakeven"
-        
-        return result
+        return await run_idempotent([
+            f"settlement:key:{idempotency_key}" if idempotency_key else None,
+            f"settlement:{req.position_id}"
+        ], req.dict(), call)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Settlement Error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/market/{ticker}/settle")
+async def settle_market(ticker: str, req: MarketSettlementRequest):
+    """
+    Settle every open position on a resolved market from one final price.
+    Runs in the background; returns 202 with the run ID. Progress: GET /settlements/{run_id}.
+    """
+    if req.result is not None and req.result.upper() not in ("YES", "NO"):
+        raise HTTPException(status_code=400, detail="result must be 'YES' or 'NO'")
+    
+    await initialize_wallets()
+    
+    active = settlement_engine.active_run(ticker)
+    if active:
+        raise HTTPException(status_code=409, detail=f"Settlement run {active} is already running for {ticker}")
+    
+    await refresh_index()
+    positions = open_positions(ticker)
+    if not positions:
+        raise HTTPException(status_code=404, detail=f"No open positions on {ticker}")
+    
+    run_id = settlement_engine.create(ticker, req.final_price, positions,
+                                      req.result.upper() if req.result else None,
+                                      req.settlement_reason)
+    settlement_engine.start(run_id)
+    return JSONResponse(status_code=202, content={
+        "status": "accepted",
+        "run_id": run_id,
+        "positions": len(positions),
+        "status_url": f"/settlements/{run_id}",
+        "message": f"Settling {len(positions)} positions on {ticker}"
+    })
+
+@app.get("/settlements/{run_id}")
+async def get_settlement_run(run_id: str, items: bool = False):
+    """Progress of a bulk settlement run (with per-position state if ?items=true)."""
+    run = settlement_engine.get(run_id, with_items=items)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Settlement run not found")
+    return run
+
+@app.post("/settlements/{run_id}/resume")
+async def resume_settlement_run(run_id: str):
+    """Retry a run's failed positions (or continue an interrupted run)."""
+    if settlement_engine.get(run_id) is None:
+        raise HTTPException(status_code=404, detail="Settlement run not found")
+    settlement_engine.start(run_id)
+    return settlement_engine.get(run_id)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a write accepted in async mode (tx hash once validated)."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/user/{user_id}/wallet")
 async def get_user_wallet(user_id: int):
     """Get user's XRPL wallet info."""
@@ -342,16 +1106,13 @@ async def get_user_wallet(user_id: int):
         user_wallet = await get_or_create_user_wallet(user_id)
         
         # Get account balance
-        account_request = AccountInfo(account=user_wallet.address)
-        account_response = await client.request(account_request)
-        
-        balance_drops = account_response.result["account_data"]["Balance"]
-        balance_xrp = float(drops_to_xrp(balance_drops))
+        balance = await balances.get(user_wallet.address)
         
         return {
             "user_id": user_id,
             "wallet_address": user_wallet.address,
-            "balance_xrp": balance_xrp,
+            "balance_xrp": balance.xrp,
+            "ledger_index": balance.ledger_index,
             "explorer_url": f"https://testnet.xrpl.org/accounts/{user_wallet.address}"
         }
         
@@ -360,76 +1121,51 @@ async def get_user_wallet(user_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/user/{user_id}/history")
-async def get_user_history(user_id: int, tx_type: Optional[str] = None):
+async def get_user_history(user_id: int, tx_type: Optional[str] = None,
+                           limit: Optional[int] = None, cursor: Optional[str] = None):
     """
-    Get user's complete blockchain history.
-    Optionally filter by transaction type.
+    Get user's blockchain history, newest first.
+    Optionally filter by transaction type. Pass `limit` to page through it with
+    `cursor` = the previous response's `next_cursor` (without `limit`, everything is returned).
     """
+    after = parse_cursor(cursor, 3)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
     try:
         await initialize_wallets()
-        
-        request = AccountTx(
-            account=COMPANY_WALLET.address,
-            ledger_index_min=-1
-        )
-        
-        response = await client.request(request)
-        transactions = response.result.get("transactions", [])
+        await refresh_index()
         
         user_history = []
+        with tracing.span("index.user_events", user_id=user_id):
+            events, next_cursor = paged(ledger_index.user_events(
+                COMPANY_WALLET.address, user_id, tx_type, caller="history",
+                limit=limit + 1 if limit is not None else None, after=after
+            ), limit, "ledger_index", "tx_index", "memo_index")
+        
+        with tracing.span("history.format", events=len(events)):
+            for event in events:
+                memo_json = event["data"]
+                tx_hash = event["hash"]
+                
+                # Convert timestamp
+                timestamp = memo_json.get("timestamp", "Unknown")
+                if event["date"]:
+                    timestamp = ripple_time_to_datetime(event["date"]).strftime("%Y-%m-%d %H:%M:%S")
+                
+                user_history.append({
+                    "hash": tx_hash,
+                    "type": event["type"],
+                    "timestamp": timestamp,
+                    "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash}",
+                    "data": memo_json
+                })
         
-        for item in transactions:
-            tx_data = item.get("tx_json", item)
-            
-            if "Memos" not in tx_data:
-                continue
-            
-            for m in tx_data["Memos"]:
-                try:
-                    memo_content = m.get("Memo", m)
-                    memo_hex = memo_content.get("MemoData")
-                    
-                    if not memo_hex:
-                        continue
-                    
-                    memo_str = binascii.unhexlify(memo_hex).decode('utf-8')
-                    memo_json = json.loads(memo_str)
-                    
-                    # Filter by user
-                    if str(memo_json.get("user_id")) != str(user_id):
-                        continue
-                    
-                    # Filter by type if specified
-                    if tx_type and memo_json.get("type") != tx_type:
-                        continue
-                    
-                    # Get transaction hash
-                    tx_hash = item.get("hash") or tx_data.get("hash")
-                    
-                    # Convert timestamp
-                    raw_date = tx_data.get("date")
-                    timestamp = memo_json.get("timestamp", "Unknown")
-                    if raw_date:
-                        timestamp = ripple_time_to_datetime(raw_date).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    user_history.append({
-                        "hash": tx_hash,
-                        "type": memo_json.get("type"),
-                        "timestamp": timestamp,
-                        "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash}",
-                        "data": memo_json
-                    })
-                    
-                except Exception:
-                    continue
-        
-        # Sort by timestamp (newest first)
-        user_history.sort(key=lambda x: x["timestamp"], reverse=True)
-        
+        # Already newest first: the index returns events in ledger order
         return {
             "user_id": user_id,
             "total_transactions": len(user_history),
-            "history": user_history
+            "history": user_history,
+            "next_cursor": next_cursor
         }
         
     except Exception as e:
@@ -442,67 +1178,10 @@ async def get_platform_analytics():
     """Get platform-wide analytics from blockchain."""
     try:
         await initialize_wallets()
+        await refresh_index()
         
-        request = AccountTx(
-            account=COMPANY_WALLET.address,
-            ledger_index_min=-1
-        )
-        
-        response = await client.request(request)
-        transactions = response.result.get("transactions", [])
-        
-        stats = {
-            "total_purchases": 0,
-            "total_predictions": 0,
-            "total_settlements": 0,
-            "total_wins": 0,
-            "total_losses": 0,
-            "total_cashback_paid": 0.0,
-            "total_charges": 0.0,
-            "unique_users": set()
-        }
-        
-        for item in transactions:
-            tx_data = item.get("tx_json", item)
-            
-            if "Memos" not in tx_data:
-                continue
-            
-            for m in tx_data["Memos"]:
-                try:
-                    memo_content = m.get("Memo", m)
-                    memo_hex = memo_content.get("MemoData")
-                    
-                    if not memo_hex:
-                        continue
-                    
-                    memo_str = binascii.unhexlify(memo_hex).decode('utf-8')
-                    memo_json = json.loads(memo_str)
-                    
-                    tx_type = memo_json.get("type")
-                    user_id = memo_json.get("user_id")
-                    
-                    if user_id:
-                        stats["unique_users"].add(user_id)
-                    
-                    if tx_type == TransactionType.PURCHASE:
-                        stats["total_purchases"] += 1
-                    
-                    elif tx_type == TransactionType.PREDICTION_CONFIG:
-                        stats["total_predictions"] += 1
-                    
-                    elif tx_type == TransactionType.SETTLEMENT:
-                        stats["total_settlements"] += 1
-                        
-                        if memo_json.get("outcome") == "win":
-                            stats["total_wins"] += 1
-                            stats["total_cashback_paid"] += memo_json.get("cashback_amount", 0)
-                        elif memo_json.get("outcome") == "loss":
-                            stats["total_losses"] += 1
-                            stats["total_charges"] += abs(memo_json.get("cashback_amount", 0))
-                
-                except Exception:
-                    continue
+        # Totals are maintained incrementally as events are indexed
+        stats = analytics.snapshot(COMPANY_WALLET.address)
         
         # Calculate win rate
         win_rate = 0
@@ -519,7 +1198,8 @@ async def get_platform_analytics():
             "total_cashback_paid": round(stats["total_cashback_paid"], 2),
             "total_charges": round(stats["total_charges"], 2),
             "net_cashback": round(stats["total_cashback_paid"] - stats["total_charges"], 2),
-            "unique_users": len(stats["unique_users"]),
+            "unique_users": stats["unique_users"],
+            "checkpoint_ledger": stats["checkpoint_ledger"],
             "company_wallet": COMPANY_WALLET.address if COMPANY_WALLET else None
         }
         
@@ -529,6 +1209,251 @@ async def get_platform_analytics():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================================
+# POSITION LOOKUPS (served from the index only)
+# ============================================
+
+def lifecycle_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Format an indexed event for the lookup endpoints."""
+    tx_hash = event["hash"]
+    return {
+        "hash": tx_hash,
+        "memo_index": event["memo_index"],
+        "type": event["type"] or "UNKNOWN",
+        "ledger_index": event["ledger_index"],
+        "timestamp": ripple_time_to_datetime(event["date"]).isoformat() if event["date"] else None,
+        "validated": event.get("result") == "tesSUCCESS",
+        "data": event["data"],
+        "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash}"
+    }
+
+def position_lifecycle(position_id: Optional[str], events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Collapse a position's events into purchase -> prediction -> settlement -> cashback."""
+    stages = {"PURCHASE": "purchase", "PREDICTION_CONFIG": "prediction",
+              "SETTLEMENT": "settlement", "CASHBACK_PAYMENT": "cashback"}
+    position = {stage: None for stage in stages.values()}
+    for event in events:
+        stage = stages.get(event["type"])
+        if stage:
+            position[stage] = event  # latest event of each kind wins
+    
+    if position["settlement"]:
+        status = "settled"
+    elif position["prediction"]:
+        status = "configured"
+    else:
+        status = "unconfigured"
+    
+    return {"position_id": position_id, "status": status, **position, "events": events}
+
+def lookup_response(key: str, value: str, found: List[Dict[str, Any]], **extra) -> Dict[str, Any]:
+    if not found:
+        raise HTTPException(status_code=404, detail=f"No indexed events for {key} {value}")
+    return {
+        key: value,
+        **extra,
+        # Index freshness: everything up to this ledger is included
+        "checkpoint_ledger": ledger_index.checkpoint(COMPANY_WALLET.address)
+    }
+
+@app.get("/position/{position_id}")
+async def get_position(position_id: str):
+    """
+    A position's full lifecycle (purchase, prediction, settlement, cashback) from the index.
+    """
+    events = []
+    if COMPANY_WALLET:
+        events = [lifecycle_event(e) for e in
+                  ledger_index.position_events(COMPANY_WALLET.address, position_id, caller="lookup")]
+    return lookup_response("position_id", position_id, events,
+                           **position_lifecycle(position_id, events))
+
+@app.get("/purchase/{purchase_id}")
+async def get_purchase(purchase_id: str):
+    """
+    A purchase and every position configured on it, from the index.
+    """
+    events = []
+    if COMPANY_WALLET:
+        events = [lifecycle_event(e) for e in
+                  ledger_index.purchase_events(COMPANY_WALLET.address, purchase_id, caller="lookup")]
+    
+    purchase = None
+    by_position: Dict[str, List[Dict[str, Any]]] = {}
+    for event in events:
+        position_id = event["data"].get("position_id")
+        if position_id is None:
+            purchase = event if event["type"] == "PURCHASE" else purchase
+        else:
+            by_position.setdefault(str(position_id), []).append(event)
+    
+    return lookup_response("purchase_id", purchase_id, events,
+                           purchase=purchase,
+                           positions=[position_lifecycle(pid, ([purchase] if purchase else []) + evs)
+                                      for pid, evs in by_position.items()],
+                           events=events)
+
+@app.get("/market/{ticker}/positions")
+async def get_market_positions(ticker: str):
+    """
+    Every position on a market with its lifecycle, from the index.
+    """
+    events = []
+    if COMPANY_WALLET:
+        events = [lifecycle_event(e) for e in
+                  ledger_index.market_events(COMPANY_WALLET.address, ticker, caller="lookup")]
+    
+    # Purchases carry no position_id: attach them through the prediction that used them
+    position_of = {
+        str(e["data"]["purchase_id"]): str(e["data"]["position_id"])
+        for e in events
+        if e["type"] == "PREDICTION_CONFIG" and e["data"].get("purchase_id") and e["data"].get("position_id")
+    }
+    by_position: Dict[str, List[Dict[str, Any]]] = {}
+    for event in events:
+        position_id = event["data"].get("position_id")
+        if position_id is None:
+            position_id = position_of.get(str(event["data"].get("purchase_id")))
+        if position_id is not None:
+            by_position.setdefault(str(position_id), []).append(event)
+    
+    positions = [position_lifecycle(pid, evs) for pid, evs in by_position.items()]
+    return lookup_response("market_ticker", ticker, events,
+                           total=len(positions), positions=positions)
+
+
+# ============================================
+# AUDIT EXPORT
+# ============================================
+
+EXPORT_COLUMNS = ["cursor", "hash", "memo_index", "ledger_index", "tx_index", "timestamp", "type",
+                  "user_id", "purchase_id", "position_id", "market_ticker", "result", "data"]
+
+def export_record(row) -> Dict[str, Any]:
+    """Flat export record for an index row; `data` stays the stored JSON text."""
+    return {
+        "cursor": encode_cursor(row["ledger_index"], row["tx_index"], row["memo_index"]),
+        "hash": row["tx_hash"],
+        "memo_index": row["memo_index"],
+        "ledger_index": row["ledger_index"],
+        "tx_index": row["tx_index"],
+        "timestamp": ripple_time_to_datetime(row["date"]).isoformat() if row["date"] else None,
+        "type": row["type"],
+        "user_id": row["user_id"],
+        "purchase_id": row["purchase_id"],
+        "position_id": row["position_id"],
+        "market_ticker": row["market_ticker"],
+        "result": row["result"],
+        "data": row["payload"],
+    }
+
+def export_ndjson(records: List[Dict[str, Any]]) -> str:
+    lines = []
+    for record in records:
+        data = record.pop("data")
+        # The payload is already JSON: splice it in instead of parsing and re-dumping it
+        lines.append(json.dumps(record)[:-1] + f', "data": {data}}}\n')
+    return "".join(lines)
+
+def export_csv(records: List[Dict[str, Any]], header: bool) -> str:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS, lineterminator="\n")
+    if header:
+        writer.writeheader()
+    writer.writerows(records)
+    return out.getvalue()
+
+@app.get("/export")
+async def export_events(format: str = "ndjson", type: Optional[str] = None,
+                        user_id: Optional[int] = None, ledger_min: Optional[int] = None,
+                        ledger_max: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    Stream every indexed Winback event (oldest first) as NDJSON or CSV.
+    Filter by `type`, `user_id` and `ledger_min` / `ledger_max`. Every record
+    carries a `cursor`; after a disconnect, pass the last one received to resume.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    after = parse_cursor(cursor, 3)
+    
+    await initialize_wallets()
+    if not COMPANY_WALLET:
+        raise HTTPException(status_code=503, detail="Company wallet not ready")
+    await refresh_index()
+    
+    # Stop at the last fully indexed ledger so the export is a consistent snapshot
+    account = COMPANY_WALLET.address
+    indexed_to = ledger_index.checkpoint(account)
+    if indexed_to and (ledger_max is None or ledger_max > indexed_to):
+        ledger_max = indexed_to
+    
+    async def chunks():
+        position = after
+        header = format == "csv" and after is None
+        while True:
+            rows = ledger_index.event_rows(account, type, user_id, ledger_min, ledger_max,
+                                           after=position, limit=EXPORT_CHUNK_SIZE)
+            if not rows and not header:
+                return
+            records = [export_record(row) for row in rows]
+            # Each chunk waits for the client to take the previous one, so memory stays flat
+            yield export_ndjson(records) if format == "ndjson" else export_csv(records, header)
+            header = False
+            if len(rows) < EXPORT_CHUNK_SIZE:
+                return
+            last = rows[-1]
+            position = (last["ledger_index"], last["tx_index"], last["memo_index"])
+    
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(chunks(), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="winback-export.{format}"',
+        "X-Export-Ledger-Max": str(ledger_max) if ledger_max is not None else ""
+    })
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Route, XRPL and submission latencies in Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# --- DEBUG (admin) ---
+def require_admin(token: Optional[str]):
+    """403 unless the X-Admin-Token header matches WINBACK_ADMIN_TOKEN (404 if unset)."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Debug endpoints are disabled (set WINBACK_ADMIN_TOKEN)")
+    if not hmac.compare_digest((token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/debug/traces")
+async def list_traces(limit: int = 50, min_ms: float = 0, route: Optional[str] = None,
+                      x_admin_token: Optional[str] = Header(None)):
+    """Recent request traces, newest first (filter by minimum duration or route)."""
+    require_admin(x_admin_token)
+    traces = tracing.find(max(1, min(limit, 500)), min_ms / 1000, route)
+    return {"traces": [t.summary() for t in traces]}
+
+@app.get("/debug/traces/{trace_id}")
+async def get_trace(trace_id: str, x_admin_token: Optional[str] = Header(None)):
+    """One trace's spans and per-trace totals."""
+    require_admin(x_admin_token)
+    trace = tracing.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (only recent traces are kept)")
+    return trace.to_dict()
+
+@app.post("/debug/profile", response_class=PlainTextResponse)
+async def capture_profile(seconds: float = 10, interval_ms: float = 5, all_threads: bool = False,
+                          x_admin_token: Optional[str] = Header(None)):
+    """Sample the running server for `seconds`; returns collapsed stacks for a flamegraph."""
+    require_admin(x_admin_token)
+    try:
+        stacks = await profiler.run(seconds, interval_ms / 1000, all_threads)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(stacks)
+
+
 # ============================================
 # BLOCKCHAIN EXPLORER ENDPOINTS
 # ============================================
@@ -542,39 +1467,44 @@ async def get_blockchain_status():
     try:
         await initialize_wallets()
         
-        # Get server info
-        from xrpl.models.requests import ServerInfo
-        server_info = await client.request(ServerInfo())
+        # Ledger tip pushed by the subscription, or ServerInfo if it is stale
+        tip_age = ledger_stream.tip_age()
+        if tip_age is not None and tip_age < STREAM_TIP_MAX_AGE_SECONDS:
+            latest_ledger = ledger_stream.tip["ledger_index"]
+            ledger_age = max(0, int(time.time() - ripple_time_to_posix(ledger_stream.tip["ledger_time"])))
+            ledger_source = "stream"
+        else:
+            from xrpl.models.requests import ServerInfo
+            server_info = await client.request(ServerInfo())
+            validated_ledger = server_info.result.get("info", {}).get("validated_ledger", {})
+            latest_ledger = validated_ledger.get("seq", 0)
+            ledger_age = validated_ledger.get("age", 0)
+            ledger_source = "rpc"
         
         # Get transaction count from company wallet
         tx_count = 0
         if COMPANY_WALLET:
-            request = AccountTx(
-                account=COMPANY_WALLET.address,
-                ledger_index_min=-1,
-                limit=1
-            )
-            response = await client.request(request)
-            # The marker tells us there are more transactions
-            tx_count = len(response.result.get("transactions", []))
-            
-            # Get full count
-            full_request = AccountTx(
-                account=COMPANY_WALLET.address,
-                ledger_index_min=-1
-            )
-            full_response = await client.request(full_request)
-            tx_count = len(full_response.result.get("transactions", []))
-        
-        validated_ledger = server_info.result.get("info", {}).get("validated_ledger", {})
+            await refresh_index()
+            tx_count = ledger_index.transaction_count(COMPANY_WALLET.address)
         
         return {
             "connected": True,
             "network": "Testnet",
             "network_url": XRPL_URL,
-            "latest_ledger": validated_ledger.get("seq", 0),
-            "ledger_age_seconds": validated_ledger.get("age", 0),
+            "rpc_nodes": client.stats(),
+            "latest_ledger": latest_ledger,
+            "ledger_age_seconds": ledger_age,
+            "ledger_source": ledger_source,
             "our_transaction_count": tx_count,
+            "decode_cache": memo_decoder.stats(),
+            "submitter": COMPANY_SUBMITTER.stats() if COMPANY_SUBMITTER else None,
+            "validation_tracker": validation_tracker.stats(),
+            "purchase_batching": purchase_batcher.stats(),
+            "balance_cache": balances.stats(),
+            "wallet_pool": wallet_pool.stats(),
+            "idempotency": idempotency.stats(),
+            "ledger_stream": ledger_stream.stats(),
+            "workers": shared_state.stats() if shared_state else None,
             "company_wallet": COMPANY_WALLET.address if COMPANY_WALLET else None,
             "escrow_wallet": ESCROW_WALLET.address if ESCROW_WALLET else None,
             "explorer_base": "https://testnet.xrpl.org"
@@ -590,87 +1520,86 @@ async def get_blockchain_status():
 
 
 @app.get("/blockchain/wallets")
-async def get_all_wallets():
+async def get_all_wallets(offset: int = 0, limit: int = 10):
     """
     Get info on all platform wallets.
+    User wallets are paginated with offset/limit; only the requested page is looked up.
     """
     try:
         await initialize_wallets()
         
+        limit = max(0, min(limit, 100))
+        offset = max(0, offset)
+        user_page = list(USER_WALLETS.items())[offset:offset + limit]
+        
+        # Company, escrow and the page of users in one bounded fan-out
+        platform = [w for w in (COMPANY_WALLET, ESCROW_WALLET) if w]
+        addresses = [w.address for w in platform] + [w.address for _, w in user_page]
+        looked_up = dict(zip(addresses, await balances.get_many(addresses)))
+        
         wallets = []
         
         # Company wallet
         if COMPANY_WALLET:
-            try:
-                info = await client.request(AccountInfo(
-                    account=COMPANY_WALLET.address,
-                    ledger_index="validated"
-                ))
-                tx_request = AccountTx(
-                    account=COMPANY_WALLET.address,
-                    ledger_index_min=-1
-                )
-                tx_response = await client.request(tx_request)
+            balance = looked_up[COMPANY_WALLET.address]
+            if isinstance(balance, Exception):
+                print(f"Company wallet error: {balance}")
+            else:
+                await refresh_index()
                 
                 wallets.append({
                     "type": "company",
                     "label": "Company Treasury",
                     "icon": "🏢",
                     "address": COMPANY_WALLET.address,
-                    "balance_xrp": float(drops_to_xrp(info.result["account_data"]["Balance"])),
-                    "transaction_count": len(tx_response.result.get("transactions", [])),
+                    "balance_xrp": balance.xrp,
+                    "transaction_count": ledger_index.transaction_count(COMPANY_WALLET.address),
                     "purpose": "Main treasury & transaction logging",
                     "explorer_url": f"https://testnet.xrpl.org/accounts/{COMPANY_WALLET.address}"
                 })
-            except Exception as e:
-                print(f"Company wallet error: {e}")
         
         # Escrow wallet
         if ESCROW_WALLET:
-            try:
-                info = await client.request(AccountInfo(
-                    account=ESCROW_WALLET.address,
-                    ledger_index="validated"
-                ))
-                
+            balance = looked_up[ESCROW_WALLET.address]
+            if isinstance(balance, Exception):
+                print(f"Escrow wallet error: {balance}")
+            else:
                 wallets.append({
                     "type": "escrow",
                     "label": "Escrow Wallet",
                     "icon": "🔒",
                     "address": ESCROW_WALLET.address,
-                    "balance_xrp": float(drops_to_xrp(info.result["account_data"]["Balance"])),
+                    "balance_xrp": balance.xrp,
                     "transaction_count": 0,
                     "purpose": "Holds funds during prediction periods",
                     "explorer_url": f"https://testnet.xrpl.org/accounts/{ESCROW_WALLET.address}"
                 })
-            except Exception as e:
-                print(f"Escrow wallet error: {e}")
         
-        # User wallets
+        # User wallets (requested page only)
         user_wallet_list = []
-        total_user_balance = 0
-        for user_id, wallet in USER_WALLETS.items():
-            try:
-                info = await client.request(AccountInfo(
-                    account=wallet.address,
-                    ledger_index="validated"
-                ))
-                balance = float(drops_to_xrp(info.result["account_data"]["Balance"]))
-                total_user_balance += balance
-                user_wallet_list.append({
-                    "user_id": user_id,
-                    "address": wallet.address,
-                    "balance_xrp": balance
-                })
-            except:
-                pass
+        for user_id, wallet in user_page:
+            balance = looked_up[wallet.address]
+            if isinstance(balance, Exception):
+                continue
+            user_wallet_list.append({
+                "user_id": user_id,
+                "address": wallet.address,
+                "balance_xrp": balance.xrp
+            })
+        
+        # Total over every balance already known, without further lookups
+        known = [balances.cached(w.address) for w in USER_WALLETS.values()]
+        known = [b for b in known if b is not None]
         
         return {
             "platform_wallets": wallets,
             "user_wallets": {
                 "count": len(USER_WALLETS),
-                "total_balance_xrp": round(total_user_balance, 2),
-                "wallets": user_wallet_list[:10]  # Show first 10
+                "total_balance_xrp": round(sum(b.xrp for b in known), 2),
+                "balances_known": len(known),
+                "offset": offset,
+                "limit": limit,
+                "wallets": user_wallet_list
             }
         }
         
@@ -680,102 +1609,109 @@ async def get_all_wallets():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/blockchain/tickets")
+async def get_ticket_pool():
+    """
+    Ticket pool and submission engine state for monitoring.
+    """
+    if not COMPANY_SUBMITTER:
+        return {"enabled": False, "pool": None, "submitter": None}
+    
+    tickets = COMPANY_SUBMITTER.tickets
+    return {
+        "enabled": tickets is not None,
+        "pool": tickets.stats() if tickets else None,
+        "submitter": COMPANY_SUBMITTER.stats()
+    }
+
+
+def feed_entry(tx_hash: Optional[str], ledger_seq: Optional[int], date: Optional[int],
+               validated: bool, memo_data: Dict[str, Any], memo_index: int = -1) -> Dict[str, Any]:
+    """Format one memo of a company-wallet transaction for the live feed."""
+    tx_type = memo_data.get("type", "UNKNOWN")
+    
+    # Format transaction for feed
+    parsed_tx = {
+        "hash": tx_hash or "",
+        "memo_index": memo_index,
+        "type": tx_type,
+        "ledger_index": ledger_seq,
+        "timestamp": ripple_time_to_datetime(date).isoformat() if date else None,
+        "validated": validated,
+        "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash or ''}",
+        "data": memo_data
+    }
+    
+    # Add type-specific display info
+    if tx_type == "PURCHASE":
+        parsed_tx["icon"] = "🛒"
+        parsed_tx["title"] = "Purchase"
+        parsed_tx["description"] = f"{memo_data.get('item_name', 'Item')} • ${memo_data.get('purchase_amount', 0):.2f}"
+        parsed_tx["color"] = "blue"
+    elif tx_type == "PREDICTION_CONFIG":
+        parsed_tx["icon"] = "📊"
+        parsed_tx["title"] = "Prediction Configured"
+        parsed_tx["description"] = f"{memo_data.get('market_title', 'Market')[:40]}... • {memo_data.get('prediction_direction', '')} at {memo_data.get('entry_price', 0)}¢"
+        parsed_tx["color"] = "purple"
+    elif tx_type == "SETTLEMENT":
+        outcome = memo_data.get("outcome", "")
+        parsed_tx["icon"] = "✅" if outcome == "win" else "❌"
+        parsed_tx["title"] = f"Settlement - {'WIN' if outcome == 'win' else 'LOSS'}"
+        cashback = memo_data.get("cashback_amount", 0)
+        parsed_tx["description"] = f"{'+'if cashback >= 0 else ''}${cashback:.2f} cashback"
+        parsed_tx["color"] = "green" if outcome == "win" else "red"
+    elif tx_type == "CASHBACK_PAYMENT":
+        parsed_tx["icon"] = "💰"
+        parsed_tx["title"] = "Cashback Paid"
+        parsed_tx["description"] = f"XRP sent to user"
+        parsed_tx["color"] = "gold"
+    else:
+        parsed_tx["icon"] = "📝"
+        parsed_tx["title"] = "Transaction"
+        parsed_tx["description"] = tx_type
+        parsed_tx["color"] = "gray"
+    
+    return parsed_tx
+
+
+@app.get("/blockchain/wallet-pool")
+async def get_wallet_pool():
+    """
+    Pre-funded user wallet pool: current depth, target, low-water mark and fill rate.
+    """
+    return wallet_pool.stats()
+
+
 @app.get("/blockchain/feed")
-async def get_transaction_feed(limit: int = 20):
+async def get_transaction_feed(limit: int = 20, cursor: Optional[str] = None):
     """
-    Get recent transaction feed for live display.
+    Get recent transaction feed for live display, one item per memo.
+    Older pages: pass the previous response's `next_cursor` as `cursor`.
     """
+    after = parse_cursor(cursor, 3)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
     try:
         await initialize_wallets()
         
         if not COMPANY_WALLET:
-            return {"transactions": [], "total": 0}
+            return {"transactions": [], "total": 0, "next_cursor": None}
         
-        request = AccountTx(
-            account=COMPANY_WALLET.address,
-            ledger_index_min=-1,
-            limit=limit
-        )
-        response = await client.request(request)
+        # Served from the index, which the ledger subscription keeps current
+        await refresh_index()
         
-        transactions = []
-        transactions = []
-        for tx_data in response.result.get("transactions", []):
-            # Handle different XRPL server response formats
-            tx = tx_data.get("tx", {})
-            if not tx:
-                tx = tx_data.get("transaction", {})
-            if not tx:
-                tx = tx_data.get("tx_json", {})
-                
-            meta = tx_data.get("meta", {})
-            
-            # Parse memo
-            memo_data = {}
-            memos = tx.get("Memos", [])
-            if memos and len(memos) > 0:
-                try:
-                    memo_hex = memos[0].get("Memo", {}).get("MemoData", "")
-                    if memo_hex:
-                        memo_json = json.loads(binascii.unhexlify(memo_hex).decode())
-                        memo_data = memo_json
-                except:
-                    pass
-            
-            tx_type = memo_data.get("type", "UNKNOWN")
-            
-            # Get timestamp
-            timestamp = None
-            if "date" in tx:
-                timestamp = ripple_time_to_datetime(tx["date"]).isoformat()
-            elif "close_time_iso" in tx_data:
-                timestamp = tx_data["close_time_iso"]
-            
-            # Format transaction for feed
-            parsed_tx = {
-                "hash": tx.get("hash", "") or tx_data.get("hash", ""),
-                "type": tx_type,
-                "ledger_index": tx.get("ledger_index", 0) or tx_data.get("ledger_index", 0),
-                "timestamp": timestamp,
-                "validated": meta.get("TransactionResult") == "tesSUCCESS" or tx_data.get("validated", False),
-                "explorer_url": f"https://testnet.xrpl.org/transactions/{tx.get('hash', '') or tx_data.get('hash', '')}",
-                "data": memo_data
-            }
-            
-            # Add type-specific display info
-            if tx_type == "PURCHASE":
-                parsed_tx["icon"] = "🛒"
-                parsed_tx["title"] = "Purchase"
-                parsed_tx["description"] = f"{memo_data.get('item_name', 'Item')} • ${memo_data.get('purchase_amount', 0):.2f}"
-                parsed_tx["color"] = "blue"
-            elif tx_type == "PREDICTION_CONFIG":
-                parsed_tx["icon"] = "📊"
-                parsed_tx["title"] = "Prediction Configured"
-                parsed_tx["description"] = f"{memo_data.get('market_title', 'Market')[:40]}... • {memo_data.get('prediction_direction', '')} at {memo_data.get('entry_price', 0)}¢"
-                parsed_tx["color"] = "purple"
-            elif tx_type == "SETTLEMENT":
-                outcome = memo_data.get("outcome", "")
-                parsed_tx["icon"] = "✅" if outcome == "win" else "❌"
-                parsed_tx["title"] = f"Settlement - {'WIN' if outcome == 'win' else 'LOSS'}"
-                cashback = memo_data.get("cashback_amount", 0)
-                parsed_tx["description"] = f"{'+'if cashback >= 0 else ''}${cashback:.2f} cashback"
-                parsed_tx["color"] = "green" if outcome == "win" else "red"
-            elif tx_type == "CASHBACK_PAYMENT":
-                parsed_tx["icon"] = "💰"
-                parsed_tx["title"] = "Cashback Paid"
-                parsed_tx["description"] = f"XRP sent to user"
-                parsed_tx["color"] = "gold"
-            else:
-                parsed_tx["icon"] = "📝"
-                parsed_tx["title"] = "Transaction"
-                parsed_tx["description"] = tx_type
-                parsed_tx["color"] = "gray"
-            
-            transactions.append(parsed_tx)
+        txs, next_cursor = paged(ledger_index.recent_transactions(
+            COMPANY_WALLET.address, limit + 1, caller="feed", after=after
+        ), limit, "ledger_index", "tx_index", "memo_index")
+        transactions = [
+            feed_entry(tx["hash"], tx["ledger_index"], tx["date"],
+                       tx["result"] == "tesSUCCESS", tx["data"], tx["memo_index"])
+            for tx in txs
+        ]
         
         return {
             "transactions": transactions,
-            "total": len(transactions)
+            "total": len(transactions),
+            "next_cursor": next_cursor
         }
         
     except Exception as e:
@@ -784,6 +1720,53 @@ async def get_transaction_feed(limit: int = 20):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/blockchain/stream")
+async def stream_events():
+    """
+    Server-Sent Events: `ledger` on every validated ledger close and
+    `transaction` (formatted like /blockchain/feed) for each new company-wallet tx.
+    """
+    queue = ledger_stream.subscribe()
+    
+    async def events():
+        try:
+            if ledger_stream.tip:
+                yield f"event: ledger\ndata: {json.dumps(ledger_stream.tip)}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+        finally:
+            ledger_stream.unsubscribe(queue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@app.websocket("/blockchain/ws")
+async def websocket_events(websocket: WebSocket):
+    """
+    WebSocket version of /blockchain/stream. Each message is
+    {"event": "ledger" | "transaction", "data": {...}}.
+    """
+    await websocket.accept()
+    queue = ledger_stream.subscribe()
+    try:
+        if ledger_stream.tip:
+            await websocket.send_json({"event": "ledger", "data": ledger_stream.tip})
+        while True:
+            await websocket.send_json(await queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ledger_stream.unsubscribe(queue)
+
+
 @app.get("/blockchain/verify/{tx_hash}")
 async def verify_transaction(tx_hash: str):
     """
@@ -795,26 +1778,16 @@ async def verify_transaction(tx_hash: str):
         request = Tx(transaction=tx_hash)
         response = await client.request(request)
         
-        tx = response.result
-        
-        # Parse memo
-        memo_data = {}
-        memos = tx.get("Memos", [])
-        if memos and len(memos) > 0:
-            try:
-                memo_hex = memos[0].get("Memo", {}).get("MemoData", "")
-                if memo_hex:
-                    memo_json = json.loads(binascii.unhexlify(memo_hex).decode())
-                    memo_data = memo_json
-            except:
-                pass
+        decoded = memo_decoder.decode(response.result, caller="verify")
+        tx = decoded.tx
+        memo_data = decoded.memos[0][1] if decoded.memos else {}
         
         return {
             "verified": True,
             "hash": tx_hash,
-            "ledger_index": tx.get("ledger_index", 0),
-            "timestamp": ripple_time_to_datetime(tx.get("date", 0)).isoformat() if tx.get("date") else None,
-            "validated": tx.get("validated", False),
+            "ledger_index": decoded.ledger_index,
+            "timestamp": ripple_time_to_datetime(decoded.date).isoformat() if decoded.date else None,
+            "validated": decoded.validated,
             "transaction_type": tx.get("TransactionType", ""),
             "account": tx.get("Account", ""),
             "destination": tx.get("Destination", ""),
@@ -831,62 +1804,52 @@ async def verify_transaction(tx_hash: str):
 
 
 @app.get("/blockchain/user/{user_id}/trail")
-async def get_user_blockchain_trail(user_id: int):
+async def get_user_blockchain_trail(user_id: int, limit: Optional[int] = None,
+                                    cursor: Optional[str] = None):
     """
-    Get a user's complete blockchain trail.
+    Get a user's blockchain trail, newest first.
+    Pages like /user/{id}/history when `limit` / `cursor` are given.
     """
+    after = parse_cursor(cursor, 3)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
     try:
         await initialize_wallets()
         
         if not COMPANY_WALLET:
-            return {"user_id": user_id, "transactions": [], "total": 0}
+            return {"user_id": user_id, "transactions": [], "total": 0, "next_cursor": None}
         
-        # Get all transactions and filter by user_id in memo
-        request = AccountTx(
-            account=COMPANY_WALLET.address,
-            ledger_index_min=-1
-        )
-        response = await client.request(request)
+        await refresh_index()
         
         user_txs = []
-        for tx_data in response.result.get("transactions", []):
-            tx = tx_data.get("tx", {})
-            meta = tx_data.get("meta", {})
-            
-            # Parse memo
-            memos = tx.get("Memos", [])
-            if memos and len(memos) > 0:
-                try:
-                    memo_hex = memos[0].get("Memo", {}).get("MemoData", "")
-                    if memo_hex:
-                        memo_json = json.loads(binascii.unhexlify(memo_hex).decode())
-                        
-                        # Check if this transaction belongs to the user
-                        if memo_json.get("user_id") == user_id:
-                            user_txs.append({
-                                "hash": tx.get("hash", ""),
-                                "type": memo_json.get("type", "UNKNOWN"),
-                                "ledger_index": tx.get("ledger_index", 0),
-                                "timestamp": ripple_time_to_datetime(tx.get("date", 0)).isoformat() if tx.get("date") else None,
-                                "validated": meta.get("TransactionResult") == "tesSUCCESS",
-                                "data": memo_json,
-                                "explorer_url": f"https://testnet.xrpl.org/transactions/{tx.get('hash', '')}"
-                            })
-                except:
-                    pass
+        with tracing.span("index.user_events", user_id=user_id):
+            events, next_cursor = paged(ledger_index.user_events(
+                COMPANY_WALLET.address, user_id, caller="trail",
+                limit=limit + 1 if limit is not None else None, after=after
+            ), limit, "ledger_index", "tx_index", "memo_index")
+        
+        with tracing.span("trail.format", events=len(events)):
+            for event in events:
+                tx_hash = event["hash"]
+                user_txs.append({
+                    "hash": tx_hash,
+                    "type": event["type"] or "UNKNOWN",
+                    "ledger_index": event["ledger_index"],
+                    "timestamp": ripple_time_to_datetime(event["date"]).isoformat() if event["date"] else None,
+                    "validated": event.get("result") == "tesSUCCESS",
+                    "data": event["data"],
+                    "explorer_url": f"https://testnet.xrpl.org/transactions/{tx_hash}"
+                })
         
         # Get user wallet info if exists
         user_wallet_info = None
         if user_id in USER_WALLETS:
             wallet = USER_WALLETS[user_id]
             try:
-                info = await client.request(AccountInfo(
-                    account=wallet.address,
-                    ledger_index="validated"
-                ))
+                balance = await balances.get(wallet.address)
                 user_wallet_info = {
                     "address": wallet.address,
-                    "balance_xrp": float(drops_to_xrp(info.result["account_data"]["Balance"])),
+                    "balance_xrp": balance.xrp,
                     "explorer_url": f"https://testnet.xrpl.org/accounts/{wallet.address}"
                 }
             except:
@@ -900,7 +1863,8 @@ async def get_user_blockchain_trail(user_id: int):
             "user_id": user_id,
             "wallet": user_wallet_info,
             "transactions": user_txs,
-            "total": len(user_txs)
+            "total": len(user_txs),
+            "next_cursor": next_cursor
         }
         
     except Exception as e:
@@ -915,15 +1879,19 @@ async def legacy_log(user_id: int, amount: float, data: str):
     """Legacy logging endpoint."""
     return await log_purchase(PurchaseRequest(
         user_id=user_id,
-        purchase_id=f"legacy-{int(time.time())}",
+        purchase_id=f"legacy-{time.time_ns()}",
         item_name=data,
         item_icon="📦",
         purchase_amount=amount
-    ))
+    ), idempotency_key=None)
 
 if __name__ == "__main__":
     import os
     import uvicorn
 
     port = int(os.environ.get("PORT", 8000))  # fallback for local dev
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    if WORKERS > 1:
+        # Each worker process imports the app itself
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""
+Winback Memo Codec (Winback_v2)
+===============================
+Compact, schema-based binary encoding for Winback memo payloads.
+
+`Winback_v1` memos are JSON with long key names and ISO timestamps, stored
+as hex. `Winback_v2` memos drop the keys: each TransactionType has a fixed
+field schema and only the values are written.
+
+Layout of the MemoData bytes:
+    flags (1 byte: bit 0 = body is zlib-compressed)
+    body = type code (1 byte) + fields in schema order
+
+Field encodings:
+- uint:   unsigned LEB128 varint
+- str:    varint byte length + UTF-8
+- num:    varint v; even v -> zigzag(v >> 1) hundredths (exact cents),
+          v = 1 -> followed by an 8-byte little-endian double,
+          v = 3 -> followed by a zigzag varint integer (ints stay ints)
+- enum:   1 byte index into the field's choices (0xFF + str for other values)
+- time:   varint seconds + varint microseconds for a naive ISO-8601
+          timestamp (read as UTC); decoded back to the same string
+
+Payloads that don't match their schema exactly (missing or extra keys,
+unexpected value types, numbers that are not finite or beyond +/-1e15)
+return None from `encode`, and callers fall back to v1 JSON.
+"""
+
+import math
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MEMO_TYPE_V1 = "Winback_v1"
+MEMO_TYPE_V2 = "Winback_v2"
+MEMO_FORMAT_V2 = "bin"
+
+FLAG_ZLIB = 0x01
+ENUM_OTHER = 0xFF
+NUM_DOUBLE = 0x01
+NUM_INT = 0x03
+MAX_NUM = 10 ** 15
+
+_DOUBLE = struct.Struct("<d")
+
+# type code -> (TransactionType, [(key, kind, enum choices)])
+SCHEMAS: Dict[int, Tuple[str, List[Tuple[str, str, Tuple[str, ...]]]]] = {
+    1: ("PURCHASE", [
+        ("user_id", "uint", ()),
+        ("purchase_id", "str", ()),
+        ("item", "str", ()),
+        ("icon", "str", ()),
+        ("amount", "num", ()),
+        ("timestamp", "time", ()),
+        ("status", "enum", ("unconfigured", "configured", "settled")),
+    ]),
+    2: ("PREDICTION_CONFIG", [
+        ("user_id", "uint", ()),
+        ("position_id", "str", ()),
+        ("purchase_id", "str", ()),
+        ("market_ticker", "str", ()),
+        ("market_title", "str", ()),
+        ("direction", "enum", ("YES", "NO")),
+        ("entry_price", "num", ()),
+        ("max_reward_pct", "num", ()),
+        ("max_loss_pct", "num", ()),
+        ("time_limit_days", "uint", ()),
+        ("timestamp", "time", ()),
+    ]),
+    3: ("SETTLEMENT", [
+        ("user_id", "uint", ()),
+        ("position_id", "str", ()),
+        ("market_ticker", "str", ()),
+        ("outcome", "enum", ("win", "loss", "breakeven")),
+        ("entry_price", "num", ()),
+        ("final_price", "num", ()),
+        ("settlement_reason", "str", ()),
+        ("cashback_amount", "num", ()),
+        ("roi", "num", ()),
+        ("timestamp", "time", ()),
+    ]),
+    4: ("CASHBACK_PAYMENT", [
+        ("position_id", "str", ()),
+        ("amount_usd", "num", ()),
+        ("amount_xrp", "num", ()),
+        ("roi", "num", ()),
+    ]),
+}
+TYPE_CODES = {name: code for code, (name, _) in SCHEMAS.items()}
+
+
+class MemoCodecError(ValueError):
+    pass
+
+
+# --- Primitives ---
+def _put_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _put_str(out: bytearray, value: str):
+    raw = value.encode("utf-8")
+    _put_varint(out, len(raw))
+    out += raw
+
+
+def _get_str(data: bytes, pos: int) -> Tuple[str, int]:
+    length, pos = _get_varint(data, pos)
+    end = pos + length
+    return data[pos:end].decode("utf-8"), end
+
+
+def _put_num(out: bytearray, value: float):
+    if isinstance(value, int):
+        out.append(NUM_INT)
+        _put_varint(out, (value << 1) ^ (value >> 63))
+        return
+    cents = round(value * 100)
+    if abs(cents / 100 - value) < 1e-9:
+        zigzag = (cents << 1) ^ (cents >> 63)
+        _put_varint(out, zigzag << 1)
+    else:
+        out.append(NUM_DOUBLE)
+        out += _DOUBLE.pack(value)
+
+
+def _get_num(data: bytes, pos: int) -> Tuple[float, int]:
+    v, pos = _get_varint(data, pos)
+    if v == NUM_DOUBLE:
+        return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+    if v == NUM_INT:
+        zigzag, pos = _get_varint(data, pos)
+        return (zigzag >> 1) ^ -(zigzag & 1), pos
+    if v & 1:
+        raise MemoCodecError(f"Unknown number tag {v}")
+    zigzag = v >> 1
+    return ((zigzag >> 1) ^ -(zigzag & 1)) / 100, pos
+
+
+def _put_time(out: bytearray, value: str):
+    moment = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    _put_varint(out, int(moment.timestamp()))
+    _put_varint(out, moment.microsecond)
+
+
+def _get_time(data: bytes, pos: int) -> Tuple[str, int]:
+    seconds, pos = _get_varint(data, pos)
+    micros, pos = _get_varint(data, pos)
+    text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+    return (f"{text}.{micros:06d}" if micros else text), pos
+
+
+# --- Encode ---
+def _fits(value: Any, kind: str) -> bool:
+    if kind == "uint":
+        return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+    if kind == "num":
+        return (isinstance(value, (int, float)) and not isinstance(value, bool)
+                and math.isfinite(value) and abs(value) < MAX_NUM)
+    if kind == "time":
+        if not isinstance(value, str):
+            return False
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            return False
+        # Only round-trip exact strings: naive, seconds or microseconds precision
+        return (moment.tzinfo is None and moment.isoformat() == value
+                and moment.replace(tzinfo=timezone.utc).timestamp() >= 0)
+    return isinstance(value, str)
+
+
+def encode(payload: Dict[str, Any], compress: bool = True) -> Optional[bytes]:
+    """Encode a payload as Winback_v2 bytes, or None if it doesn't fit its schema."""
+    code = TYPE_CODES.get(payload.get("type"))
+    if code is None:
+        return None
+    fields = SCHEMAS[code][1]
+    if set(payload) != {"type"} | {key for key, _, _ in fields}:
+        return None
+
+    body = bytearray([code])
+    for key, kind, choices in fields:
+        value = payload[key]
+        if not _fits(value, kind):
+            return None
+        if kind == "uint":
+            _put_varint(body, value)
+        elif kind == "str":
+            _put_str(body, value)
+        elif kind == "num":
+            _put_num(body, value)
+        elif kind == "time":
+            _put_time(body, value)
+        elif value in choices:
+            body.append(choices.index(value))
+        else:
+            body.append(ENUM_OTHER)
+            _put_str(body, value)
+
+    if compress:
+        packed = zlib.compress(bytes(body), 9)
+        if len(packed) < len(body):
+            return bytes([FLAG_ZLIB]) + packed
+    return bytes([0]) + bytes(body)
+
+
+# --- Decode ---
+_READERS: Dict[str, Callable[[bytes, int], Tuple[Any, int]]] = {
+    "uint": _get_varint,
+    "str": _get_str,
+    "num": _get_num,
+    "time": _get_time,
+}
+
+
+def decode(data: bytes) -> Dict[str, Any]:
+    """Decode Winback_v2 bytes back into the v1-shaped payload dict."""
+    try:
+        if data[0] & FLAG_ZLIB:
+            data = zlib.decompress(data[1:])
+        else:
+            data = data[1:]
+
+        type_name, fields = SCHEMAS[data[0]]
+        payload: Dict[str, Any] = {"type": type_name}
+        pos = 1
+        for key, kind, choices in fields:
+            if kind == "enum":
+                index = data[pos]
+                pos += 1
+                if index == ENUM_OTHER:
+                    payload[key], pos = _get_str(data, pos)
+                else:
+                    payload[key] = choices[index]
+            else:
+                payload[key], pos = _READERS[kind](data, pos)
+    except (IndexError, KeyError, UnicodeDecodeError, struct.error, zlib.error) as e:
+        raise MemoCodecError(f"Malformed Winback_v2 memo: {e}") from e
+
+    if pos != len(data):
+        raise MemoCodecError("Trailing bytes in Winback_v2 memo")
+    return payload
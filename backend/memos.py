@@ -0,0 +1,208 @@
+"""
+Winback Memo Decoding
+=====================
+Single decoding layer for Winback memos attached to XRPL transactions.
+
+Handles every response envelope we see from rippled:
+- AccountTx entries (API v2 `tx_json`, API v1 `tx`, older `transaction`)
+- Tx results (fields at the top level or under `tx_json`)
+
+and both memo formats: `Winback_v1` JSON and `Winback_v2` compact binary
+(see memo_codec.py). Both decode to the same payload dict.
+
+Validated transactions never change, so decoded memo payloads are kept in a
+bounded LRU keyed by tx hash. Hit/miss counters are recorded per caller so
+the effect of the cache is visible per endpoint.
+
+Cached payloads are shared between callers and must be treated as read-only.
+"""
+
+import binascii
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Any, Dict, Optional, Tuple
+
+import memo_codec
+import tracing
+from metrics import memo_decode_failures
+
+MEMO_TYPE_PREFIX = "Winback_"
+DECODE_CACHE_SIZE = int(os.environ.get("WINBACK_DECODE_CACHE_SIZE", "10000"))
+
+DecodedTx = namedtuple("DecodedTx", [
+    "hash",
+    "ledger_index",
+    "tx_index",
+    "date",
+    "transaction_type",
+    "result",
+    "validated",
+    "tx",
+    "meta",
+    "memos",  # tuple of (memo_index, payload) pairs
+])
+
+
+# --- ENVELOPE HELPERS ---
+def unwrap(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize an AccountTx entry or Tx result into flat fields."""
+    tx = item.get("tx_json") or item.get("tx") or item.get("transaction") or item
+    meta = item.get("meta") or item.get("metaData") or {}
+    if not isinstance(meta, dict):
+        meta = {}
+    return {
+        "tx": tx,
+        "meta": meta,
+        "hash": item.get("hash") or tx.get("hash"),
+        "ledger_index": item.get("ledger_index") or tx.get("ledger_index") or 0,
+        "tx_index": meta.get("TransactionIndex", 0),
+        "date": tx.get("date") or item.get("date"),
+        "transaction_type": tx.get("TransactionType"),
+        "result": meta.get("TransactionResult"),
+        "validated": bool(item.get("validated", tx.get("validated", False))),
+    }
+
+
+def decode_memo(memo_content: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Decode one Winback memo (v1 or v2), or None if it is not a Winback memo."""
+    memo_hex = memo_content.get("MemoData")
+    if not memo_hex:
+        return None
+
+    memo_type_hex = memo_content.get("MemoType")
+    if memo_type_hex:
+        memo_type = binascii.unhexlify(memo_type_hex).decode("utf-8")
+        if not memo_type.startswith(MEMO_TYPE_PREFIX):
+            return None
+        if memo_type == memo_codec.MEMO_TYPE_V2:
+            return memo_codec.decode(binascii.unhexlify(memo_hex))
+
+    payload = json.loads(binascii.unhexlify(memo_hex).decode("utf-8"))
+    return payload if isinstance(payload, dict) else None
+
+
+def _memo_type(memo_content: Dict[str, Any]) -> str:
+    """MemoType as text for the failure counter, e.g. `Winback_v2`."""
+    try:
+        return binascii.unhexlify(memo_content.get("MemoType") or "").decode("utf-8")[:32] or "none"
+    except (ValueError, UnicodeDecodeError):
+        return "invalid"
+
+
+def _decode_memos(tx: Dict[str, Any]) -> Tuple[Tuple[int, Dict[str, Any]], ...]:
+    decoded = []
+    for i, m in enumerate(tx.get("Memos", [])):
+        memo = m.get("Memo", m)
+        try:
+            payload = decode_memo(memo)
+        except Exception as e:
+            memo_decode_failures.inc(_memo_type(memo), type(e).__name__)
+            continue
+        if payload is not None:
+            decoded.append((i, payload))
+    return tuple(decoded)
+
+
+# --- DECODER ---
+class _CacheEntry:
+    __slots__ = ("memos", "complete")
+
+    def __init__(self, memos: Dict[int, Dict[str, Any]], complete: bool):
+        self.memos = memos
+        self.complete = complete
+
+
+class MemoDecoder:
+    """Memo decoder with a bounded per-hash LRU of parsed payloads."""
+
+    def __init__(self, capacity: int = DECODE_CACHE_SIZE):
+        self.capacity = capacity
+        self._cache: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, caller: str, hit: bool):
+        counters = self._counters.setdefault(caller, {"hits": 0, "misses": 0})
+        counters["hits" if hit else "misses"] += 1
+
+    def _store(self, tx_hash: str, entry: _CacheEntry):
+        self._cache[tx_hash] = entry
+        self._cache.move_to_end(tx_hash)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    @tracing.timed("memo.decode")
+    def decode(self, item: Dict[str, Any], caller: str = "default") -> DecodedTx:
+        """Decode a transaction envelope and all of its Winback memos."""
+        env = unwrap(item)
+        tx_hash = env["hash"]
+        cacheable = tx_hash and env["validated"]
+
+        memos = None
+        if cacheable:
+            with self._lock:
+                entry = self._cache.get(tx_hash)
+                if entry is not None and entry.complete:
+                    self._cache.move_to_end(tx_hash)
+                    memos = tuple(sorted(entry.memos.items()))
+                self._count(caller, memos is not None)
+        else:
+            with self._lock:
+                self._count(caller, False)
+
+        if memos is None:
+            memos = _decode_memos(env["tx"])
+            if cacheable:
+                with self._lock:
+                    self._store(tx_hash, _CacheEntry(dict(memos), complete=True))
+
+        return DecodedTx(
+            hash=tx_hash,
+            ledger_index=env["ledger_index"],
+            tx_index=env["tx_index"],
+            date=env["date"],
+            transaction_type=env["transaction_type"],
+            result=env["result"],
+            validated=env["validated"],
+            tx=env["tx"],
+            meta=env["meta"],
+            memos=memos,
+        )
+
+    @tracing.timed("memo.payload")
+    def payload(self, tx_hash: str, memo_index: int, raw: str,
+                caller: str = "index") -> Dict[str, Any]:
+        """Parsed payload for an already-indexed memo, loading `raw` JSON on a miss."""
+        with self._lock:
+            entry = self._cache.get(tx_hash)
+            if entry is not None and memo_index in entry.memos:
+                self._cache.move_to_end(tx_hash)
+                self._count(caller, True)
+                return entry.memos[memo_index]
+            self._count(caller, False)
+
+        data = json.loads(raw)
+        with self._lock:
+            entry = self._cache.get(tx_hash)
+            if entry is None:
+                entry = _CacheEntry({}, complete=False)
+            entry.memos[memo_index] = data
+            self._store(tx_hash, entry)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache size and hit/miss counters per caller."""
+        with self._lock:
+            by_caller = {k: dict(v) for k, v in self._counters.items()}
+        return {
+            "size": len(self._cache),
+            "capacity": self.capacity,
+            "hits": sum(c["hits"] for c in by_caller.values()),
+            "misses": sum(c["misses"] for c in by_caller.values()),
+            "by_caller": by_caller,
+        }
+
+
+memo_decoder = MemoDecoder()
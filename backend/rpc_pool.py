@@ -0,0 +1,245 @@
+"""
+Winback XRPL Client Pool
+========================
+JSON-RPC client that spreads requests over several rippled endpoints.
+
+xrpl-py's `AsyncJsonRpcClient` talks to a single URL and opens a new HTTP
+connection for every request, so one slow or flaky node stalls every
+endpoint. This client is a drop-in replacement that:
+
+- keeps one shared keep-alive `httpx.AsyncClient` for all nodes
+- tracks latency (EWMA) and a decaying error rate per node and sends each
+  request to the healthiest node first
+- fails over to the next node on connection errors, bad responses and
+  node-level errors such as `tooBusy`
+- hedges idempotent reads (`account_tx`, `account_info`, `tx`): if the
+  first node hasn't answered within the hedge threshold, the same request
+  goes to the next node and whichever answers first wins
+"""
+
+import asyncio
+import time
+from json import JSONDecodeError
+from typing import Any, Dict, List, Optional
+
+import httpx
+from xrpl.asyncio.clients import AsyncJsonRpcClient
+from xrpl.asyncio.clients.client import REQUEST_TIMEOUT
+from xrpl.asyncio.clients.exceptions import XRPLRequestFailureException
+from xrpl.asyncio.clients.utils import json_to_response, request_to_json_rpc
+from xrpl.models.requests.request import Request, RequestMethod
+from xrpl.models.response import Response
+
+import tracing
+from metrics import xrpl_request_duration
+from singleflight import SingleFlight
+
+HEDGED_METHODS = {RequestMethod.ACCOUNT_TX, RequestMethod.ACCOUNT_INFO, RequestMethod.TX}
+NODE_ERRORS = {"tooBusy", "noNetwork", "noCurrent", "noClosed", "amendmentBlocked", "slowDown"}
+
+HEDGE_AFTER_SECONDS = 0.3
+LATENCY_ALPHA = 0.2
+ERROR_ALPHA = 0.3
+ERROR_HALF_LIFE_SECONDS = 30.0  # a failing node is retried as its error rate decays
+MAX_CONNECTIONS = 50
+
+
+class NodeError(Exception):
+    """A node failed to give a usable answer; another node may."""
+
+
+class NodeStats:
+    """Health of one rippled endpoint."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.hedge_wins = 0
+        self.in_flight = 0
+        self.last_error: Optional[str] = None
+        self._error_rate = 0.0
+        self._error_at = 0.0
+
+    def error_rate(self) -> float:
+        elapsed = time.monotonic() - self._error_at
+        return self._error_rate * 0.5 ** (elapsed / ERROR_HALF_LIFE_SECONDS)
+
+    def score(self) -> float:
+        """Lower is better: expected latency inflated by recent failures."""
+        return (self.latency or HEDGE_AFTER_SECONDS) * (1 + 10 * self.error_rate()) + 0.01 * self.in_flight
+
+    def record_latency(self, seconds: float):
+        self.latency = seconds if not self.latency else (
+            LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * self.latency
+        )
+
+    def record_result(self, ok: bool, error: Optional[str] = None):
+        rate = self.error_rate()
+        self._error_rate = ERROR_ALPHA * (0.0 if ok else 1.0) + (1 - ERROR_ALPHA) * rate
+        self._error_at = time.monotonic()
+        if not ok:
+            self.errors += 1
+            self.last_error = error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "latency_ms": round(self.latency * 1000, 1),
+            "error_rate": round(self.error_rate(), 3),
+            "requests": self.requests,
+            "errors": self.errors,
+            "hedge_wins": self.hedge_wins,
+            "in_flight": self.in_flight,
+            "last_error": self.last_error,
+        }
+
+
+class PooledJsonRpcClient(AsyncJsonRpcClient):
+    """AsyncJsonRpcClient over several nodes with failover and hedged reads."""
+
+    def __init__(self, urls: List[str], hedge_after: float = HEDGE_AFTER_SECONDS,
+                 max_connections: int = MAX_CONNECTIONS):
+        if not urls:
+            raise ValueError("At least one XRPL endpoint is required")
+        super().__init__(urls[0])
+        self.nodes = [NodeStats(url) for url in urls]
+        self.hedge_after = hedge_after
+        self.max_connections = max_connections
+        self._http: Optional[httpx.AsyncClient] = None
+        # Optional httpx transport in place of the network (e.g. bench/fake_xrpl.py)
+        self.transport: Optional[httpx.AsyncBaseTransport] = None
+        # Identical concurrent reads share one upstream call (see singleflight.py)
+        self.single_flight = SingleFlight()
+
+        self.hedges = 0
+        self.failovers = 0
+
+    def _http_client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(transport=self.transport, limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            ))
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def ranked_nodes(self) -> List[NodeStats]:
+        return sorted(self.nodes, key=lambda n: n.score())
+
+    # --- Transport ---
+    async def _post(self, node: NodeStats, request: Request, timeout: float) -> Response:
+        node.requests += 1
+        node.in_flight += 1
+        started = time.monotonic()
+        try:
+            with tracing.span("xrpl.post", node=node.url):
+                http_response = await self._http_client().post(
+                    node.url, json=request_to_json_rpc(request), timeout=timeout
+                )
+            try:
+                response = json_to_response(http_response.json())
+            except JSONDecodeError:
+                if http_response.status_code >= 500:
+                    raise NodeError(f"HTTP {http_response.status_code}")
+                raise XRPLRequestFailureException({
+                    "error": http_response.status_code,
+                    "error_message": http_response.text,
+                })
+            if response.result.get("error") in NODE_ERRORS:
+                raise NodeError(response.result["error"])
+        except asyncio.CancelledError:
+            # Lost a hedge race: still evidence of how slow this node is
+            node.record_latency(time.monotonic() - started)
+            raise
+        except (httpx.HTTPError, NodeError) as e:
+            node.record_latency(time.monotonic() - started)
+            node.record_result(False, str(e) or type(e).__name__)
+            raise NodeError(f"{node.url}: {e or type(e).__name__}") from e
+        finally:
+            node.in_flight -= 1
+
+        node.record_latency(time.monotonic() - started)
+        node.record_result(True)
+        return response
+
+    async def _request_impl(self, request: Request, *, timeout: float = REQUEST_TIMEOUT) -> Response:
+        started = time.perf_counter()
+        outcome = "exception"
+        try:
+            with tracing.span(f"xrpl.{request.method.value}"):
+                response = await self.single_flight.do(request, lambda: self._dispatch(request, timeout))
+            outcome = "success" if response.is_successful() else "error"
+            return response
+        finally:
+            xrpl_request_duration.observe(time.perf_counter() - started, request.method.value, outcome)
+
+    async def _dispatch(self, request: Request, timeout: float) -> Response:
+        nodes = self.ranked_nodes()
+        if request.method in HEDGED_METHODS and len(nodes) > 1:
+            return await self._hedged(request, nodes, timeout)
+
+        error: Optional[NodeError] = None
+        for i, node in enumerate(nodes):
+            if i:
+                self.failovers += 1
+            try:
+                return await self._post(node, request, timeout)
+            except NodeError as e:
+                error = e
+        raise error
+
+    async def _hedged(self, request: Request, nodes: List[NodeStats], timeout: float) -> Response:
+        """Race the best node against the next one if it's slower than `hedge_after`."""
+        tasks: Dict[asyncio.Task, NodeStats] = {}
+        remaining = list(nodes)
+        error: Optional[NodeError] = None
+
+        def launch():
+            node = remaining.pop(0)
+            tasks[asyncio.ensure_future(self._post(node, request, timeout))] = node
+
+        launch()
+        try:
+            while tasks:
+                wait = self.hedge_after if remaining else None
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slow answer: hedge to the next node, keep the first request running
+                    self.hedges += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    node = tasks.pop(task)
+                    try:
+                        response = task.result()
+                    except NodeError as e:
+                        error = e
+                        continue
+                    if node is not nodes[0]:
+                        node.hedge_wins += 1
+                    return response
+
+                # Every finished request failed: fail over right away
+                if remaining and not tasks:
+                    self.failovers += 1
+                    launch()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedge_after_ms": round(self.hedge_after * 1000),
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "coalescing": self.single_flight.stats(),
+            "nodes": [node.stats() for node in self.ranked_nodes()],
+        }
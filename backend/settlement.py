@@ -0,0 +1,383 @@
+"""
+Winback Bulk Settlement
+=======================
+Settles every open position on a market once it resolves.
+
+Settling through `/position/settle` costs one HTTP call and two serialized
+ledger round-trips (SETTLEMENT log, then CASHBACK_PAYMENT) per position.
+A settlement run instead:
+
+- computes every position's outcome from one final market price, with the
+  same PnL formula the frontend shows (price move vs. entry, clamped to the
+  position's max reward / max loss, applied to the purchase amount). When
+  the market's result is given, it decides the outcome and the position
+  gets the full max reward or max loss
+- logs the SETTLEMENT memos in chunks, packed into shared transactions
+- sends the cashback payments concurrently
+
+Runs and their items live in SQLite. Each item's stage (pending -> logged ->
+done, or failed) is recorded as soon as its transaction validates, so
+progress can be read at any time, and an interrupted or partly failed run
+picks up where it stopped. Runs that were running when the process stopped
+are resumed on start.
+
+When several worker processes share the database (`shared`, see
+shared_state.py), each run executes under a file lock named after it. A
+worker that finds a run already locked leaves it to the worker holding it.
+The lock is released when its holder exits, so a run abandoned by a
+crashed worker is picked up again by `resume_all`.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from shared_state import LockHeld
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settlement_runs (
+    id TEXT PRIMARY KEY,
+    market_ticker TEXT NOT NULL,
+    final_price REAL NOT NULL,
+    result TEXT,
+    settlement_reason TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_settlement_runs_market
+    ON settlement_runs (market_ticker, created_at);
+
+CREATE TABLE IF NOT EXISTS settlement_items (
+    run_id TEXT NOT NULL,
+    position_id TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    settlement TEXT NOT NULL,
+    status TEXT NOT NULL,
+    settlement_hash TEXT,
+    memo_index INTEGER,
+    payment_hash TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, position_id)
+);
+CREATE INDEX IF NOT EXISTS idx_settlement_items_status
+    ON settlement_items (run_id, status);
+"""
+
+# Run states
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"          # finished, but some items failed (resumable)
+
+# Item stages
+PENDING = "pending"        # nothing on ledger yet
+LOGGED = "logged"          # SETTLEMENT memo validated, payment outstanding
+DONE = "done"
+
+CHUNK_SIZE = 200
+PAYMENT_CONCURRENCY = 8
+
+# settle_batch(items) -> (tx_hash, memo_index) or Exception per item
+SettleBatch = Callable[[List[Dict[str, Any]]], Awaitable[List[Any]]]
+# pay(item) -> payment tx hash
+Pay = Callable[[Dict[str, Any]], Awaitable[str]]
+
+
+def compute_settlement(position: Dict[str, Any], final_price: float,
+                       result: Optional[str] = None,
+                       reason: str = "market_resolved") -> Dict[str, Any]:
+    """
+    Settlement fields for one position, given the market's final YES price (cents).
+    NO positions are priced at 100 - final_price, matching how their entry price was taken.
+    With a market `result`, the outcome follows it and pays the full reward or loss cap;
+    otherwise both come from the price move, capped the same way.
+    """
+    direction = str(position.get("direction", "YES")).upper()
+    entry = position.get("entry_price") or 0
+    price = final_price if direction == "YES" else 100 - final_price
+    amount = position.get("purchase_amount") or 0
+    max_loss = position.get("max_loss_pct") or 5
+    max_reward = position.get("max_reward_pct") or 20
+
+    if result:
+        # The price can disagree with the resolution; the cashback sign must not
+        outcome = "win" if result.upper() == direction else "loss"
+        pct = max_reward if outcome == "win" else -max_loss
+    else:
+        pct = 0.0
+        if entry:
+            pct = min(max((price - entry) / entry * 100, -max_loss), max_reward)
+        outcome = "win" if pct > 0 else "loss" if pct < 0 else "breakeven"
+    pnl = pct / 100 * amount
+
+    return {
+        "position_id": position["position_id"],
+        "market_ticker": position["market_ticker"],
+        "outcome": outcome,
+        "entry_price": entry,
+        "final_price": price,
+        "settlement_reason": reason,
+        "cashback_amount": round(pnl, 2),
+        "roi": round(pct, 2),
+    }
+
+
+def needs_payment(settlement: Dict[str, Any]) -> bool:
+    return settlement["outcome"] == "win" and settlement["cashback_amount"] > 0
+
+
+class SettlementEngine:
+    """Persistent, resumable bulk settlement runs."""
+
+    def __init__(self, path: str, settle_batch: SettleBatch, pay: Pay,
+                 chunk_size: int = CHUNK_SIZE, concurrency: int = PAYMENT_CONCURRENCY):
+        self.path = path
+        self.settle_batch = settle_batch
+        self.pay = pay
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        # Called with the run's progress after every chunk (e.g. to push it to clients)
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.shared = None  # optional SharedState (see shared_state.py)
+
+    # --- Runs ---
+    def create(self, market_ticker: str, final_price: float, positions: List[Dict[str, Any]],
+               result: Optional[str] = None, reason: str = "market_resolved") -> str:
+        """Persist a run settling `positions` (open positions on the market). Returns its ID."""
+        run_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO settlement_runs
+                   (id, market_ticker, final_price, result, settlement_reason, status, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (run_id, market_ticker, final_price, result, reason, RUNNING, now, now)
+            )
+            self._conn.executemany(
+                """INSERT INTO settlement_items
+                   (run_id, position_id, user_id, settlement, status, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [(run_id, p["position_id"], p["user_id"],
+                  json.dumps(compute_settlement(p, final_price, result, reason)), PENDING, now)
+                 for p in positions]
+            )
+        return run_id
+
+    def active_run(self, market_ticker: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT id FROM settlement_runs WHERE market_ticker = ? AND status = ?",
+            (market_ticker, RUNNING)
+        ).fetchone()
+        return row["id"] if row else None
+
+    def start(self, run_id: str):
+        """Run (or resume) a settlement run in the background."""
+        task = self._tasks.get(run_id)
+        if task is not None and not task.done():
+            return
+        with self._lock, self._conn:
+            # Failed items get another try: back to the stage they failed in
+            self._conn.execute(
+                """UPDATE settlement_items
+                   SET status = CASE WHEN settlement_hash IS NULL THEN ? ELSE ? END, error = NULL
+                   WHERE run_id = ? AND error IS NOT NULL""",
+                (PENDING, LOGGED, run_id)
+            )
+            self._conn.execute(
+                "UPDATE settlement_runs SET status = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (RUNNING, time.time(), run_id)
+            )
+        self._tasks[run_id] = asyncio.create_task(self._run(run_id))
+
+    def resume_all(self):
+        """Restart runs interrupted by a shutdown (or by a worker that died)."""
+        for row in self._conn.execute(
+            "SELECT id FROM settlement_runs WHERE status = ?", (RUNNING,)
+        ).fetchall():
+            task = self._tasks.get(row["id"])
+            if task is not None and not task.done():
+                continue
+            if self.shared is not None and self.shared.locked(f"settlement-{row['id']}"):
+                continue
+            print(f"🔁 Resuming settlement run {row['id']}")
+            self.start(row["id"])
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks = {}
+
+    # --- Execution ---
+    def _items(self, run_id: str, status: str, limit: int) -> List[Dict[str, Any]]:
+        rows = self._conn.execute(
+            """SELECT * FROM settlement_items WHERE run_id = ? AND status = ? AND error IS NULL
+               ORDER BY position_id LIMIT ?""",
+            (run_id, status, limit)
+        ).fetchall()
+        return [{**dict(row), "settlement": json.loads(row["settlement"])} for row in rows]
+
+    def _update(self, run_id: str, position_id: str, **fields: Any):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE settlement_items SET {columns} WHERE run_id = ? AND position_id = ?",
+                (*fields.values(), run_id, position_id)
+            )
+
+    async def _log_chunk(self, run_id: str, items: List[Dict[str, Any]]):
+        outcomes = await self.settle_batch(items)
+        for item, outcome in zip(items, outcomes):
+            if isinstance(outcome, Exception):
+                self._update(run_id, item["position_id"], error=str(outcome))
+                continue
+            tx_hash, memo_index = outcome
+            self._update(run_id, item["position_id"], settlement_hash=tx_hash, memo_index=memo_index,
+                         status=LOGGED if needs_payment(item["settlement"]) else DONE)
+
+    async def _pay_chunk(self, run_id: str, items: List[Dict[str, Any]]):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def pay(item: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    payment_hash = await self.pay(item)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._update(run_id, item["position_id"], error=str(e))
+                    return
+            self._update(run_id, item["position_id"], payment_hash=payment_hash, status=DONE)
+
+        await asyncio.gather(*(pay(item) for item in items))
+
+    async def _run(self, run_id: str):
+        if self.shared is None:
+            await self._execute(run_id)
+            return
+        try:
+            async with self.shared.lock(f"settlement-{run_id}", wait=False):
+                await self._execute(run_id)
+        except LockHeld:
+            print(f"⏭️ Settlement run {run_id} is already running in another worker")
+
+    async def _execute(self, run_id: str):
+        try:
+            # Stage 1: SETTLEMENT memos, a chunk at a time (packed into shared txs)
+            while True:
+                items = self._items(run_id, PENDING, self.chunk_size)
+                if not items:
+                    break
+                await self._log_chunk(run_id, items)
+                self._notify(run_id)
+
+            # Stage 2: cashback payments for winners, concurrently
+            while True:
+                items = self._items(run_id, LOGGED, self.chunk_size)
+                if not items:
+                    break
+                await self._pay_chunk(run_id, items)
+                self._notify(run_id)
+
+            counts = self._counts(run_id)
+            status, error = COMPLETED, None
+            if counts["failed"]:
+                status, error = FAILED, f"{counts['failed']} positions failed"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Settlement run {run_id} failed: {e}")
+            traceback.print_exc()
+            status, error = FAILED, str(e)
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE settlement_runs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), run_id)
+            )
+        self._notify(run_id)
+
+    def _notify(self, run_id: str):
+        progress = self.get(run_id)
+        for listener in self.listeners:
+            listener(progress)
+
+    # --- Progress ---
+    def _counts(self, run_id: str) -> Dict[str, int]:
+        counts = {PENDING: 0, LOGGED: 0, DONE: 0, "failed": 0}
+        for row in self._conn.execute(
+            """SELECT CASE WHEN error IS NOT NULL THEN 'failed' ELSE status END AS stage,
+                      COUNT(*) AS n
+               FROM settlement_items WHERE run_id = ? GROUP BY stage""",
+            (run_id,)
+        ):
+            counts[row["stage"]] = row["n"]
+        return counts
+
+    def get(self, run_id: str, with_items: bool = False) -> Optional[Dict[str, Any]]:
+        """Run status and progress (and every item's state if `with_items`)."""
+        row = self._conn.execute("SELECT * FROM settlement_runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        counts = self._counts(run_id)
+        totals = self._conn.execute(
+            """SELECT COUNT(DISTINCT settlement_hash) AS settlement_txs,
+                      COUNT(payment_hash) AS payments
+               FROM settlement_items WHERE run_id = ?""",
+            (run_id,)
+        ).fetchone()
+        total = sum(counts.values())
+        run = {
+            "run_id": row["id"],
+            "market_ticker": row["market_ticker"],
+            "final_price": row["final_price"],
+            "result": row["result"],
+            "settlement_reason": row["settlement_reason"],
+            "status": row["status"],
+            "error": row["error"],
+            "positions": total,
+            "pending": counts[PENDING],
+            "awaiting_payment": counts[LOGGED],
+            "done": counts[DONE],
+            "failed": counts["failed"],
+            "progress_percent": round(counts[DONE] / total * 100, 1) if total else 100.0,
+            "settlement_transactions": totals["settlement_txs"],
+            "payments_sent": totals["payments"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if with_items:
+            run["items"] = [{
+                "position_id": item["position_id"],
+                "user_id": item["user_id"],
+                "status": "failed" if item["error"] else item["status"],
+                "settlement": json.loads(item["settlement"]),
+                "settlement_hash": item["settlement_hash"],
+                "memo_index": item["memo_index"],
+                "payment_hash": item["payment_hash"],
+                "error": item["error"],
+            } for item in self._conn.execute(
+                "SELECT * FROM settlement_items WHERE run_id = ? ORDER BY position_id", (run_id,)
+            )]
+        return run
+
+    def stats(self) -> Dict[str, Any]:
+        by_status = {row["status"]: row["n"] for row in self._conn.execute(
+            "SELECT status, COUNT(*) AS n FROM settlement_runs GROUP BY status"
+        )}
+        return {"runs": by_status, "active": sorted(k for k, t in self._tasks.items() if not t.done())}
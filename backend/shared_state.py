@@ -0,0 +1,339 @@
+"""
+Winback Shared State
+====================
+Coordination between worker processes on one machine.
+
+With `WINBACK_WORKERS` > 1, `python main.py` starts that many uvicorn worker
+processes. Each one imports the app on its own, so anything kept in module
+globals would exist once per worker: every worker would fund its own company
+wallet, hand out the same sequence numbers and Tickets, and resume the same
+settlement runs. This module keeps the state that has to be unique per
+machine in SQLite (the index file), next to the job queue and the
+idempotency keys:
+
+- file locks (`fcntl.flock` on `<db>.locks/<name>.lock`), which the OS
+  releases if the holder crashes. They are held while funding the platform
+  wallets, while syncing the index, across sign+submit of
+  sequence-numbered transactions, and for the length of a settlement run
+- the next sequence number of each signing account
+- Ticket reservations: which of an account's Tickets are free and which
+  one each worker has reserved, so no two workers sign with the same Ticket
+- a leader lease: one worker at a time runs the background loops that must
+  not run twice (wallet pool and Ticket refills, resuming settlement runs,
+  re-queueing jobs of a worker that died). If the leader dies, another
+  worker takes over once the lease expires.
+
+Wallet assignments live in the keystore and index checkpoints in the ledger
+index. Both are SQLite files every worker opens already, so they only
+needed atomic writes.
+"""
+
+import asyncio
+import inspect
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS account_sequences (
+    account TEXT PRIMARY KEY,
+    next_sequence INTEGER,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ticket_reservations (
+    account TEXT NOT NULL,
+    ticket INTEGER NOT NULL,
+    owner TEXT,
+    reserved_at REAL,
+    PRIMARY KEY (account, ticket)
+);
+"""
+
+LEADER_LEASE = "leader"
+LEASE_SECONDS = 15.0
+LOCK_POLL_SECONDS = 0.01
+# A reserved Ticket still on the ledger after this long belonged to a worker that died
+STALE_RESERVATION_SECONDS = 300.0
+
+Hook = Callable[[], Any]
+
+
+class LockHeld(Exception):
+    """`lock(name, wait=False)` found the lock held by someone else."""
+
+
+class SharedState:
+    """Cross-process locks, sequences, Ticket reservations and leader lease."""
+
+    def __init__(self, path: str, lease_seconds: float = LEASE_SECONDS):
+        if fcntl is None:
+            raise RuntimeError("Running several workers needs fcntl file locks (Linux/macOS)")
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock_dir = f"{path}.locks"
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._local_locks: Dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        # Leader hooks: on winning the lease, on losing it, and every renewal while leading
+        self.on_elected: List[Hook] = []
+        self.on_deposed: List[Hook] = []
+        self.while_leading: List[Hook] = []
+        self.is_leader = False
+
+        self.elections = 0
+        self.lock_waits = 0
+
+    # --- File locks ---
+    def _lock_path(self, name: str) -> str:
+        return os.path.join(self.lock_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", name) + ".lock")
+
+    @asynccontextmanager
+    async def lock(self, name: str, wait: bool = True) -> AsyncIterator[None]:
+        """
+        Hold `name` across every worker. Waits for it, or raises LockHeld
+        right away if `wait` is False.
+        """
+        local = self._local_locks.setdefault(name, asyncio.Lock())
+        if not wait and local.locked():
+            raise LockHeld(name)
+        async with local:
+            fd = os.open(self._lock_path(name), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                waited = False
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if not wait:
+                            raise LockHeld(name)
+                        if not waited:
+                            waited = True
+                            self.lock_waits += 1
+                        await asyncio.sleep(LOCK_POLL_SECONDS)
+                yield
+            finally:
+                # Closing the descriptor releases the lock
+                os.close(fd)
+
+    def locked(self, name: str) -> bool:
+        """Whether some worker (this one included) holds `name` right now."""
+        local = self._local_locks.get(name)
+        if local is not None and local.locked():
+            return True
+        fd = os.open(self._lock_path(name), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+    # --- Sequences ---
+    def get_sequence(self, account: str) -> Optional[int]:
+        """The account's next sequence number, or None if it needs a re-sync."""
+        row = self._conn.execute(
+            "SELECT next_sequence FROM account_sequences WHERE account = ?", (account,)
+        ).fetchone()
+        return row["next_sequence"] if row else None
+
+    def set_sequence(self, account: str, sequence: Optional[int]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO account_sequences (account, next_sequence, updated_at)
+                   VALUES (?, ?, ?)""",
+                (account, sequence, time.time())
+            )
+
+    # --- Tickets ---
+    def reserve_ticket(self, account: str) -> Optional[int]:
+        """Reserve the lowest free Ticket for this worker, or None if there is none."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                """SELECT ticket FROM ticket_reservations
+                   WHERE account = ? AND owner IS NULL ORDER BY ticket LIMIT 1""",
+                (account,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                """UPDATE ticket_reservations SET owner = ?, reserved_at = ?
+                   WHERE account = ? AND ticket = ?""",
+                (self.owner, time.time(), account, row["ticket"])
+            )
+            return row["ticket"]
+
+    def release_ticket(self, account: str, ticket: int, consumed: bool):
+        with self._lock, self._conn:
+            if consumed:
+                self._conn.execute(
+                    "DELETE FROM ticket_reservations WHERE account = ? AND ticket = ?",
+                    (account, ticket)
+                )
+            else:
+                self._conn.execute(
+                    """UPDATE ticket_reservations SET owner = NULL, reserved_at = NULL
+                       WHERE account = ? AND ticket = ?""",
+                    (account, ticket)
+                )
+
+    def add_tickets(self, account: str, tickets: Iterable[int]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO ticket_reservations (account, ticket) VALUES (?, ?)",
+                [(account, t) for t in tickets]
+            )
+
+    def reconcile_tickets(self, account: str, owned: Iterable[int]):
+        """
+        Match the reservations to the Tickets the account owns on the ledger:
+        new ones become free, free ones no longer on the ledger are dropped,
+        and reservations left behind by a dead worker are released.
+        """
+        owned = set(owned)
+        stale = time.time() - STALE_RESERVATION_SECONDS
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT ticket, owner, reserved_at FROM ticket_reservations WHERE account = ?",
+                (account,)
+            ).fetchall()
+            known = {row["ticket"] for row in rows}
+            for row in rows:
+                abandoned = row["owner"] is not None and row["reserved_at"] < stale
+                if row["ticket"] not in owned and (row["owner"] is None or abandoned):
+                    self._conn.execute(
+                        "DELETE FROM ticket_reservations WHERE account = ? AND ticket = ?",
+                        (account, row["ticket"])
+                    )
+                elif abandoned:
+                    self._conn.execute(
+                        """UPDATE ticket_reservations SET owner = NULL, reserved_at = NULL
+                           WHERE account = ? AND ticket = ?""",
+                        (account, row["ticket"])
+                    )
+            self._conn.executemany(
+                "INSERT INTO ticket_reservations (account, ticket) VALUES (?, ?)",
+                [(account, t) for t in sorted(owned - known)]
+            )
+
+    def ticket_counts(self, account: str) -> Dict[str, int]:
+        row = self._conn.execute(
+            """SELECT COUNT(*) - COUNT(owner) AS free, COUNT(owner) AS in_use
+               FROM ticket_reservations WHERE account = ?""",
+            (account,)
+        ).fetchone()
+        return {"free": row["free"], "in_use": row["in_use"]}
+
+    # --- Leadership ---
+    def _renew_lease(self) -> bool:
+        """Take or extend the leader lease. Returns whether this worker holds it."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT owner, expires_at FROM leases WHERE name = ?", (LEADER_LEASE,)
+            ).fetchone()
+            if row is not None and row["owner"] != self.owner and row["expires_at"] > now:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                (LEADER_LEASE, self.owner, now + self.lease_seconds)
+            )
+            return True
+
+    def leader(self) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT owner FROM leases WHERE name = ? AND expires_at > ?",
+            (LEADER_LEASE, time.time())
+        ).fetchone()
+        return row["owner"] if row else None
+
+    @staticmethod
+    async def _call(hooks: List[Hook]):
+        for hook in hooks:
+            try:
+                result = hook()
+                if inspect.isawaitable(result):
+                    await result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Leader hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                leading = self._renew_lease()
+            except sqlite3.Error as e:
+                print(f"⚠️ Leader lease renewal failed: {e}")
+                leading = False
+
+            if leading and not self.is_leader:
+                self.is_leader = True
+                self.elections += 1
+                print(f"👑 Worker {self.owner} is the leader")
+                await self._call(self.on_elected)
+            elif not leading and self.is_leader:
+                self.is_leader = False
+                print(f"⚠️ Worker {self.owner} lost the leader lease")
+                await self._call(self.on_deposed)
+
+            if self.is_leader:
+                await self._call(self.while_leading)
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            self.is_leader = False
+            await self._call(self.on_deposed)
+            # Let another worker take over now instead of when the lease runs out
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "DELETE FROM leases WHERE name = ? AND owner = ?", (LEADER_LEASE, self.owner)
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker": self.owner,
+            "leader": self.leader(),
+            "is_leader": self.is_leader,
+            "elections_won": self.elections,
+            "lock_waits": self.lock_waits,
+        }
@@ -0,0 +1,125 @@
+"""
+Winback Request Coalescing
+==========================
+Single-flight layer for read-only XRPL requests.
+
+When many dashboards load at once, every request sends the same
+`AccountTx` / `AccountInfo` / `ServerInfo` query. Identical requests that
+are in flight at the same time now share one upstream call and its
+response.
+
+Optionally, successful answers about validated state are also kept until
+the next validated ledger closes: `ledger_tip` returns the latest validated
+ledger index (e.g. from the ledger subscription) and a cached response is
+reused only while the tip is unchanged. Without a known tip nothing is
+cached beyond the in-flight window.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from xrpl.models.requests.request import Request, RequestMethod
+from xrpl.models.response import Response
+
+# Reads that are safe to share between callers
+COALESCED_METHODS = {
+    RequestMethod.ACCOUNT_TX,
+    RequestMethod.ACCOUNT_INFO,
+    RequestMethod.ACCOUNT_OBJECTS,
+    RequestMethod.TX,
+    RequestMethod.LEDGER,
+    RequestMethod.SERVER_INFO,
+}
+MAX_CACHE_SECONDS = 10.0
+
+
+def request_key(request: Request) -> str:
+    fields = request.to_dict()
+    fields.pop("id", None)
+    return json.dumps(fields, sort_keys=True, default=str)
+
+
+def _validated_only(request: Request) -> bool:
+    """Whether the answer can only change when a new ledger is validated."""
+    fields = request.to_dict()
+    method = request.method
+    if method == RequestMethod.ACCOUNT_TX:
+        # account_tx only ever returns validated transactions
+        return fields.get("ledger_index") in (None, "validated")
+    if method in (RequestMethod.TX, RequestMethod.SERVER_INFO):
+        return True
+    return fields.get("ledger_index") == "validated"
+
+
+def _settled(request: Request, response: Response) -> bool:
+    """Whether a response is worth keeping until the next ledger."""
+    if not response.is_successful():
+        return False
+    # A pending tx may validate before our tip moves; keep polling it upstream
+    if request.method == RequestMethod.TX:
+        return bool(response.result.get("validated"))
+    return True
+
+
+class SingleFlight:
+    """Shares identical in-flight reads and caches them per validated ledger."""
+
+    def __init__(self, ledger_tip: Callable[[], Optional[int]] = lambda: None):
+        self.ledger_tip = ledger_tip
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._cache: Dict[str, Tuple[float, Response]] = {}
+        self._cache_tip: Optional[int] = None
+
+        self.calls = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    async def do(self, request: Request, call: Callable[[], Awaitable[Response]]) -> Response:
+        """Run `call` for `request`, unless an identical request can share its answer."""
+        self.calls += 1
+        if request.method not in COALESCED_METHODS:
+            self.upstream_calls += 1
+            return await call()
+
+        key = request_key(request)
+        tip = self.ledger_tip()
+        cacheable = tip is not None and _validated_only(request)
+
+        if cacheable:
+            if tip != self._cache_tip:
+                self._cache.clear()
+                self._cache_tip = tip
+            cached = self._cache.get(key)
+            if cached and time.monotonic() - cached[0] < MAX_CACHE_SECONDS:
+                self.cache_hits += 1
+                return cached[1]
+
+        if key in self._in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        self.upstream_calls += 1
+        future = asyncio.ensure_future(call())
+        self._in_flight[key] = future
+        try:
+            response = await asyncio.shield(future)
+        finally:
+            self._in_flight.pop(key, None)
+
+        if cacheable and self._cache_tip == tip and _settled(request, response):
+            self._cache[key] = (time.monotonic(), response)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "calls_saved": self.coalesced + self.cache_hits,
+            "cached_entries": len(self._cache),
+            "cache_ledger": self._cache_tip,
+        }
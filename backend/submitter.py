@@ -0,0 +1,297 @@
+"""
+Winback Submission Engine
+=========================
+Pipelined transaction submission for a single signing wallet.
+
+`submit_and_wait` from xrpl-py autofills Sequence, Fee and LastLedgerSequence
+with three RPC round-trips per transaction and then blocks until validation,
+so concurrent callers either queue behind ledger closes or race for the same
+sequence number. This engine instead:
+
+- hands out sequence numbers from a local counter (synced from AccountInfo)
+- caches the network fee and the validated ledger used for LastLedgerSequence
+- signs and submits back-to-back under one lock, then waits for validation
+  outside the lock so many transactions can be in flight at once
+- waits on a shared ValidationTracker (see validation_tracker.py), which
+  settles every pending transaction once per ledger close, instead of
+  polling `Tx` per transaction
+- re-syncs the counter and retries on tefPAST_SEQ / terPRE_SEQ
+- when a TicketPool is attached, draws Tickets first so transactions are
+  independent of each other, falling back to sequence numbers when empty
+- when several worker processes sign for the same wallet (`shared`, see
+  shared_state.py), keeps the counter in SQLite and takes a file lock
+  instead of the in-process lock
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from xrpl.asyncio.ledger import get_fee, get_latest_validated_ledger_sequence
+from xrpl.asyncio.transaction import autofill, sign, submit
+from xrpl.asyncio.transaction.reliable_submission import XRPLReliableSubmissionException
+from xrpl.models.requests import AccountInfo
+from xrpl.models.response import Response
+from xrpl.models.transactions.transaction import Transaction
+
+import tracing
+from metrics import submit_phase_duration
+from validation_tracker import TransactionExpired, ValidationTracker
+
+LEDGER_OFFSET = 20          # LastLedgerSequence = validated ledger + offset
+FEE_TTL_SECONDS = 10.0
+LEDGER_TTL_SECONDS = 3.0
+MAX_SUBMIT_ATTEMPTS = 3
+
+RESYNC_RESULTS = {"tefPAST_SEQ", "terPRE_SEQ"}
+FEE_RESULTS = {"telINSUF_FEE_P", "telCAN_NOT_QUEUE_FEE"}
+TICKET_GONE_RESULTS = {"tefNO_TICKET", "terPRE_TICKET"}
+
+
+class PendingTx:
+    """A submitted transaction awaiting validation."""
+
+    def __init__(self, tx: Transaction, tx_hash: str, engine_result: str):
+        self.tx = tx
+        self.hash = tx_hash
+        self.engine_result = engine_result
+        self.sequence = tx.sequence
+        self.ticket: Optional[int] = None
+        self.last_ledger_sequence = tx.last_ledger_sequence
+        self.submitted_at = time.monotonic()
+
+
+class SubmissionEngine:
+    """Local sequence allocation and pipelined submission for one wallet."""
+
+    def __init__(self, client, wallet, ledger_offset: int = LEDGER_OFFSET, shared=None,
+                 tracker: Optional[ValidationTracker] = None):
+        self.client = client
+        self.wallet = wallet
+        self.ledger_offset = ledger_offset
+        self.tickets = None  # optional TicketPool (see tickets.py)
+        self.shared = shared  # optional SharedState (see shared_state.py)
+        self.tracker = tracker or ValidationTracker(client)
+
+        self._lock = asyncio.Lock()
+        self._next_sequence: Optional[int] = None
+        # Set by invalidate_sequence(); applied by the next holder of the sequence lock
+        self._resync_needed = False
+        self._fee: Optional[str] = None
+        self._fee_at = 0.0
+        self._validated_ledger = 0
+        self._ledger_at = 0.0
+
+        self.submitted = 0
+        self.validated = 0
+        self.failed = 0
+        self.resyncs = 0
+        self.in_flight = 0
+
+    # --- Cached network state ---
+    async def _sync_sequence(self):
+        self._resync_needed = False
+        response = await self.client.request(AccountInfo(
+            account=self.wallet.address,
+            ledger_index="current"
+        ))
+        if not response.is_successful():
+            raise XRPLReliableSubmissionException(f"AccountInfo failed: {response.result}")
+        self._next_sequence = response.result["account_data"]["Sequence"]
+        self.resyncs += 1
+        if self.shared is not None:
+            self.shared.set_sequence(self.wallet.address, self._next_sequence)
+
+    async def _current_fee(self) -> str:
+        if self._fee is None or time.monotonic() - self._fee_at > FEE_TTL_SECONDS:
+            self._fee = await get_fee(self.client)
+            self._fee_at = time.monotonic()
+        return self._fee
+
+    async def _last_ledger_sequence(self) -> int:
+        if time.monotonic() - self._ledger_at > LEDGER_TTL_SECONDS:
+            self._validated_ledger = await get_latest_validated_ledger_sequence(self.client)
+            self._ledger_at = time.monotonic()
+        return self._validated_ledger + self.ledger_offset
+
+    def invalidate_sequence(self):
+        """
+        Force a sequence re-sync before the next allocation. Safe to call
+        without the sequence lock: a submission holding it may still be
+        waiting on its own transaction and will advance the counter first.
+        """
+        self._resync_needed = True
+
+    def _clear_sequence(self):
+        """Drop the counter. Only while holding the sequence lock."""
+        self._next_sequence = None
+        if self.shared is not None:
+            self.shared.set_sequence(self.wallet.address, None)
+
+    def _sequence_lock(self):
+        """Held across sign+submit; spans every worker when the counter is shared."""
+        if self.shared is not None:
+            return self.shared.lock(f"sequence-{self.wallet.address}")
+        return self._lock
+
+    # --- Submission ---
+    async def _prepare(self, tx: Transaction, **fields: Any) -> Transaction:
+        """Fill Sequence/Fee/LastLedgerSequence from local state and sign."""
+        with submit_phase_duration.time("autofill"), tracing.span("submit.autofill"):
+            tx_json = tx.to_dict()
+            tx_json.update(fields)
+            tx_json.setdefault("fee", await self._current_fee())
+            tx_json["last_ledger_sequence"] = await self._last_ledger_sequence()
+            # Only NetworkID is left to autofill, which xrpl-py caches on the client
+            filled = await autofill(Transaction.from_dict(tx_json), self.client)
+        with submit_phase_duration.time("sign"), tracing.span("submit.sign"):
+            return sign(filled, self.wallet)
+
+    async def _send(self, signed: Transaction) -> Response:
+        with submit_phase_duration.time("submit"), tracing.span("submit.submit"):
+            return await submit(signed, self.client)
+
+    async def submit(self, tx: Transaction, use_ticket: bool = True) -> PendingTx:
+        """Sign and submit without waiting for validation."""
+        if use_ticket and self.tickets is not None:
+            pending = await self._submit_with_ticket(tx)
+            if pending is not None:
+                return pending
+        return await self._submit_with_sequence(tx)
+
+    async def _submit_with_sequence(self, tx: Transaction) -> PendingTx:
+        async with self._sequence_lock():
+            if self.shared is not None:
+                # Other workers may have used sequence numbers since we last held the lock
+                self._next_sequence = self.shared.get_sequence(self.wallet.address)
+            for attempt in range(MAX_SUBMIT_ATTEMPTS):
+                if self._resync_needed:
+                    self._clear_sequence()
+                if self._next_sequence is None:
+                    await self._sync_sequence()
+
+                signed = await self._prepare(tx, sequence=self._next_sequence)
+                try:
+                    response = await self._send(signed)
+                except Exception:
+                    # Unknown whether the sequence was consumed
+                    self._clear_sequence()
+                    raise
+
+                result = response.result.get("engine_result", "")
+                if result in RESYNC_RESULTS:
+                    print(f"⚠️ {result} at sequence {signed.sequence}, re-syncing")
+                    self._clear_sequence()
+                    continue
+                if result.startswith("tel"):
+                    # Rejected by the local server without consuming the sequence
+                    if result in FEE_RESULTS:
+                        self._fee = None
+                    continue
+                if result.startswith("tem") or result.startswith("tef"):
+                    self.failed += 1
+                    message = response.result.get("engine_result_message", "")
+                    raise XRPLReliableSubmissionException(f"{result}: {message}")
+
+                # tes / tec / ter (queued) consume or hold the sequence;
+                # a TicketCreate also reserves the next ticket_count sequences
+                self._next_sequence += 1 + (getattr(signed, "ticket_count", None) or 0)
+                if self.shared is not None:
+                    self.shared.set_sequence(self.wallet.address, self._next_sequence)
+                self.submitted += 1
+                self.in_flight += 1
+                return PendingTx(signed, signed.get_hash(), result)
+
+        self.failed += 1
+        raise XRPLReliableSubmissionException(
+            f"Submission failed after {MAX_SUBMIT_ATTEMPTS} attempts: {result}"
+        )
+
+    async def _submit_with_ticket(self, tx: Transaction) -> Optional[PendingTx]:
+        """Submit on a Ticket lane. Returns None if the pool has no free Ticket."""
+        for attempt in range(MAX_SUBMIT_ATTEMPTS):
+            ticket = self.tickets.try_acquire()
+            if ticket is None:
+                return None
+
+            try:
+                signed = await self._prepare(tx, sequence=0, ticket_sequence=ticket)
+                response = await self._send(signed)
+            except Exception:
+                # The Ticket may or may not have been used; the next refill reconciles it
+                self.tickets.release(ticket, consumed=True)
+                raise
+
+            result = response.result.get("engine_result", "")
+            if result in TICKET_GONE_RESULTS:
+                self.tickets.release(ticket, consumed=True)
+                continue
+            if result.startswith("tel"):
+                if result in FEE_RESULTS:
+                    self._fee = None
+                self.tickets.release(ticket, consumed=False)
+                continue
+            if result.startswith("tem") or result.startswith("tef"):
+                self.tickets.release(ticket, consumed=False)
+                self.failed += 1
+                message = response.result.get("engine_result_message", "")
+                raise XRPLReliableSubmissionException(f"{result}: {message}")
+
+            self.submitted += 1
+            self.in_flight += 1
+            pending = PendingTx(signed, signed.get_hash(), result)
+            pending.ticket = ticket
+            return pending
+        return None
+
+    async def wait(self, pending: PendingTx) -> Response:
+        """Wait until the transaction validates or its LastLedgerSequence passes."""
+        consumed = True
+        started = time.perf_counter()
+        with tracing.span("submit.validation_wait", hash=pending.hash):
+            try:
+                try:
+                    # LastLedgerSequence was set from the validated ledger at signing
+                    response = await self.tracker.wait(
+                        pending.hash, pending.last_ledger_sequence,
+                        first_ledger=pending.last_ledger_sequence - self.ledger_offset + 1
+                    )
+                except TransactionExpired as e:
+                    consumed = False
+                    # The sequence was never consumed; later ones are stuck behind it
+                    if pending.ticket is None:
+                        self.invalidate_sequence()
+                    self.failed += 1
+                    raise XRPLReliableSubmissionException(
+                        f"The latest validated ledger sequence {e.latest} is greater than "
+                        f"LastLedgerSequence {pending.last_ledger_sequence} in the "
+                        f"transaction. Prelim result: {pending.engine_result}"
+                    )
+
+                code = response.result["meta"]["TransactionResult"]
+                if code != "tesSUCCESS":
+                    self.failed += 1
+                    raise XRPLReliableSubmissionException(f"Transaction failed: {code}")
+                self.validated += 1
+                return response
+            finally:
+                submit_phase_duration.observe(time.perf_counter() - started, "validation_wait")
+                self.in_flight -= 1
+                if pending.ticket is not None:
+                    self.tickets.release(pending.ticket, consumed=consumed)
+
+    async def submit_and_wait(self, tx: Transaction, use_ticket: bool = True) -> Response:
+        """Drop-in replacement for xrpl-py's submit_and_wait for this wallet."""
+        return await self.wait(await self.submit(tx, use_ticket=use_ticket))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "account": self.wallet.address,
+            "next_sequence": self._next_sequence,
+            "cached_fee_drops": self._fee,
+            "submitted": self.submitted,
+            "validated": self.validated,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "sequence_resyncs": self.resyncs,
+        }
@@ -0,0 +1,52 @@
+import binascii
+import json
+
+from analytics import AnalyticsAggregator
+from ledger_index import LedgerIndex
+
+ACCOUNT = "rCompany"
+
+
+# Payloads are cached by tx hash process-wide, so every test uses its own hashes
+def item(tx_hash, ledger_index, payload):
+    data = binascii.hexlify(json.dumps(payload).encode()).decode()
+    return {
+        "hash": tx_hash,
+        "ledger_index": ledger_index,
+        "validated": True,
+        "tx_json": {"TransactionType": "AccountSet", "Memos": [{"Memo": {"MemoData": data}}]},
+        "meta": {"TransactionIndex": 0, "TransactionResult": "tesSUCCESS"},
+    }
+
+
+def test_totals_catch_up_then_follow_new_events(tmp_path):
+    index = LedgerIndex(str(tmp_path / "index.db"))
+    index.ingest(ACCOUNT, [
+        item("AN1", 10, {"type": "PURCHASE", "user_id": 1}),
+        item("AN2", 11, {"type": "SETTLEMENT", "user_id": 1, "outcome": "win",
+                         "cashback_amount": 4.0}),
+    ])
+    analytics = AnalyticsAggregator(index)
+    totals = analytics.snapshot(ACCOUNT)
+    assert totals["total_purchases"] == 1
+    assert totals["total_cashback_paid"] == 4.0
+    assert totals["checkpoint_ledger"] == 11
+
+    index.ingest(ACCOUNT, [
+        item("AN3", 12, {"type": "SETTLEMENT", "user_id": 2, "outcome": "loss",
+                         "cashback_amount": -1.5}),
+    ])
+    totals = analytics.snapshot(ACCOUNT)
+    assert totals["total_settlements"] == 2
+    assert totals["total_losses"] == 1
+    assert totals["total_charges"] == 1.5
+    assert totals["unique_users"] == 2
+    assert totals["checkpoint_ledger"] == 12
+    index.close()
+
+
+def test_unknown_account_is_all_zero(tmp_path):
+    index = LedgerIndex(str(tmp_path / "index.db"))
+    totals = AnalyticsAggregator(index).snapshot("rNobody")
+    assert totals["total_purchases"] == 0 and totals["checkpoint_ledger"] == 0
+    index.close()
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from xrpl.models.transactions import Memo
+
+from batching import MAX_MEMOS_BYTES, MemoBatcher, memos_size, pack_memos
+
+
+def memo(size):
+    return Memo(memo_data="AB" * size)
+
+
+def test_memos_size_counts_the_serialized_field():
+    assert memos_size([memo(10)]) > 10
+    assert memos_size([memo(10), memo(10)]) > memos_size([memo(10)])
+
+
+def test_small_memos_share_one_group():
+    assert pack_memos([memo(50)] * 5) == [[0, 1, 2, 3, 4]]
+
+
+def test_groups_stay_under_the_limit():
+    memos = [memo(300)] * 7
+    groups = pack_memos(memos)
+    assert len(groups) > 1
+    assert sorted(i for g in groups for i in g) == list(range(7))
+    for group in groups:
+        assert memos_size([memos[i] for i in group]) <= MAX_MEMOS_BYTES
+
+
+def test_oversized_memo_is_rejected():
+    with pytest.raises(ValueError):
+        pack_memos([memo(50), memo(MAX_MEMOS_BYTES)])
+
+
+def test_batcher_coalesces_and_stop_waits_for_submits():
+    submitted = []
+
+    async def submit_group(memos):
+        await asyncio.sleep(0)
+        submitted.append(len(memos))
+        return {"hash": f"TX{len(submitted)}"}
+
+    async def run():
+        batcher = MemoBatcher(submit_group, window_seconds=10)
+        adds = [asyncio.ensure_future(batcher.add(memo(20))) for _ in range(3)]
+        await asyncio.sleep(0)
+        await batcher.stop()
+        assert batcher.stats()["in_flight"] == 0
+        return await asyncio.gather(*adds)
+
+    results = asyncio.run(run())
+    assert submitted == [3]
+    assert [memo_index for _, memo_index in results] == [0, 1, 2]
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyConflict, IdempotencyStore, fingerprint
+
+
+@pytest.fixture
+def store(tmp_path):
+    return IdempotencyStore(str(tmp_path / "keys.db"))
+
+
+def counting_call(calls, result=(200, {"ok": True})):
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return result
+    return call
+
+
+def test_completed_key_is_replayed(store):
+    calls = []
+    body = {"purchase_id": "p1"}
+    first = asyncio.run(store.run(["purchase:p1"], fingerprint(body), counting_call(calls)))
+    again = asyncio.run(store.run(["purchase:p1"], fingerprint(body), counting_call(calls)))
+    assert first == (200, {"ok": True}, False)
+    assert again == (200, {"ok": True}, True)
+    assert len(calls) == 1
+
+
+def test_completed_key_survives_a_restart(tmp_path):
+    path = str(tmp_path / "keys.db")
+    asyncio.run(IdempotencyStore(path).run(["k"], "f", counting_call([])))
+    calls = []
+    assert asyncio.run(IdempotencyStore(path).run(["k"], "f", counting_call(calls)))[2]
+    assert not calls
+
+
+def test_different_body_conflicts(store):
+    asyncio.run(store.run(["purchase:p1"], fingerprint({"amount": 1}), counting_call([])))
+    with pytest.raises(IdempotencyConflict):
+        asyncio.run(store.run(["purchase:p1"], fingerprint({"amount": 2}), counting_call([])))
+    assert store.stats()["conflicts"] == 1
+
+
+def test_any_matching_key_replays(store):
+    asyncio.run(store.run(["header:abc", "purchase:p1"], "f", counting_call([])))
+    calls = []
+    assert asyncio.run(store.run(["header:other", "purchase:p1"], "f", counting_call(calls)))[2]
+    assert not calls
+
+
+def test_failed_call_is_not_remembered(store):
+    async def fail():
+        raise RuntimeError("submit failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.run(["settlement:pos1"], "f", fail))
+    calls = []
+    assert asyncio.run(store.run(["settlement:pos1"], "f", counting_call(calls)))[2] is False
+    assert len(calls) == 1
+
+
+def test_concurrent_repeats_join_the_call_in_flight(store):
+    calls = []
+
+    async def run():
+        return await asyncio.gather(*(store.run(["k"], "f", counting_call(calls)) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(replayed for _, _, replayed in results) == [False, True, True]
+
+
+def test_forget_releases_an_async_acceptance(store):
+    # ?mode=async stores the 202; a failed job forgets the natural key only
+    accepted = (202, {"status": "accepted", "job_id": "j1"})
+    asyncio.run(store.run(["purchase:key:abc", "purchase:p1"], "f", counting_call([], accepted)))
+    assert store.forget(["purchase:p1"]) == 1
+
+    calls = []
+    retried = asyncio.run(store.run(["purchase:p1"], "f", counting_call(calls)))
+    assert retried == (200, {"ok": True}, False) and len(calls) == 1
+    assert asyncio.run(store.run(["purchase:key:abc"], "f", counting_call([])))[1] == accepted[1]
+
+
+def test_forget_leaves_keys_in_flight(store):
+    async def run():
+        started = asyncio.Event()
+
+        async def call():
+            started.set()
+            await asyncio.sleep(0.01)
+            return 200, {}
+
+        task = asyncio.ensure_future(store.run(["k"], "f", call))
+        await started.wait()
+        forgotten = store.forget(["k"])
+        await task
+        return forgotten
+
+    assert asyncio.run(run()) == 0
@@ -0,0 +1,102 @@
+import binascii
+import json
+
+import pytest
+
+from ledger_index import LedgerIndex
+
+ACCOUNT = "rCompany"
+
+
+def memo(payload):
+    return {"Memo": {
+        "MemoType": binascii.hexlify(b"Winback_v1").decode(),
+        "MemoData": binascii.hexlify(json.dumps(payload).encode()).decode(),
+    }}
+
+
+# Payloads are cached by tx hash process-wide, so every test uses its own hashes
+def item(tx_hash, ledger_index, *payloads, tx_index=0, validated=True):
+    return {
+        "hash": tx_hash,
+        "ledger_index": ledger_index,
+        "validated": validated,
+        "tx_json": {"TransactionType": "AccountSet", "date": 800000000 + ledger_index,
+                    "Memos": [memo(p) for p in payloads]},
+        "meta": {"TransactionIndex": tx_index, "TransactionResult": "tesSUCCESS"},
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LedgerIndex(str(tmp_path / "index.db"))
+    yield index
+    index.close()
+
+
+def test_ingest_stores_one_event_per_memo(index):
+    new = index.ingest(ACCOUNT, [item("MEMOS", 10,
+                                      {"type": "PURCHASE", "user_id": 1, "purchase_id": "p1"},
+                                      {"type": "PURCHASE", "user_id": 2, "purchase_id": "p2"})])
+    assert new == 2
+    assert index.transaction_count(ACCOUNT) == 1
+    assert [e["data"]["purchase_id"] for e in index.user_events(ACCOUNT, 2)] == ["p2"]
+
+
+def test_reingest_is_a_no_op(index):
+    batch = [item("REINGEST", 10, {"type": "PURCHASE", "user_id": 1})]
+    assert index.ingest(ACCOUNT, batch) == 1
+    assert index.ingest(ACCOUNT, batch) == 0
+    assert len(index.user_events(ACCOUNT, 1)) == 1
+
+
+def test_unvalidated_transactions_are_skipped(index):
+    assert index.ingest(ACCOUNT, [item("UNVALIDATED", 10, {"type": "PURCHASE", "user_id": 1},
+                                       validated=False)]) == 0
+    assert index.transaction_count(ACCOUNT) == 0
+
+
+def test_checkpoint_only_moves_forward(index):
+    assert index.checkpoint(ACCOUNT) == 0
+    index.ingest(ACCOUNT, [], checkpoint=20)
+    index.ingest(ACCOUNT, [], checkpoint=15)
+    assert index.checkpoint(ACCOUNT) == 20
+    index.ingest(ACCOUNT, [], checkpoint=25)
+    assert index.checkpoint(ACCOUNT) == 25
+    assert index.checkpoint("rOther") == 0
+
+
+def test_listeners_see_each_new_batch(index):
+    applied = []
+
+    class Listener:
+        def apply(self, conn, account):
+            applied.append(account)
+
+    index.listeners.append(Listener())
+    batch = [item("LISTENED", 10, {"type": "PURCHASE", "user_id": 1})]
+    index.ingest(ACCOUNT, batch)
+    index.ingest(ACCOUNT, batch)  # nothing new
+    assert applied == [ACCOUNT]
+
+
+def test_lifecycle_links(index):
+    index.ingest(ACCOUNT, [
+        item("A", 10, {"type": "PURCHASE", "user_id": 1, "purchase_id": "p1"}),
+        item("B", 11, {"type": "PREDICTION_CONFIG", "user_id": 1, "purchase_id": "p1",
+                       "position_id": "pos1", "market_ticker": "M"}),
+        item("C", 12, {"type": "SETTLEMENT", "user_id": 1, "position_id": "pos1"}),
+    ])
+    assert [e["hash"] for e in index.position_events(ACCOUNT, "pos1")] == ["A", "B", "C"]
+    assert [e["hash"] for e in index.market_events(ACCOUNT, "M")] == ["A", "B", "C"]
+
+
+def test_feed_lists_every_memo(index):
+    index.ingest(ACCOUNT, [
+        item("FEED1", 10, {"type": "PURCHASE", "user_id": 1, "purchase_id": "p1"},
+             {"type": "PURCHASE", "user_id": 2, "purchase_id": "p2"}),
+        item("FEED2", 11, {"type": "PURCHASE", "user_id": 3, "purchase_id": "p3"}),
+    ])
+    feed = index.recent_transactions(ACCOUNT)
+    assert [(e["hash"], e["memo_index"]) for e in feed] == [("FEED2", 0), ("FEED1", 0), ("FEED1", 1)]
+    assert [e["data"]["purchase_id"] for e in feed] == ["p3", "p1", "p2"]
@@ -0,0 +1,55 @@
+import pytest
+
+import memo_codec
+from memo_codec import MemoCodecError, decode, encode
+
+PURCHASE = {
+    "type": "PURCHASE", "user_id": 101, "purchase_id": "pur_8f3a2c91",
+    "item": "Wireless Headphones", "icon": "🎧", "amount": 249.99,
+    "timestamp": "2026-02-07T17:40:12.345678", "status": "unconfigured",
+}
+SETTLEMENT = {
+    "type": "SETTLEMENT", "user_id": 7, "position_id": "pos_1", "market_ticker": "XRP-1.40",
+    "outcome": "win", "entry_price": 60, "final_price": 66.5,
+    "settlement_reason": "market_closed", "cashback_amount": -1.25, "roi": 10.123456789,
+    "timestamp": "2026-02-07T17:40:12",
+}
+
+
+@pytest.mark.parametrize("compress", [True, False])
+@pytest.mark.parametrize("payload", [PURCHASE, SETTLEMENT])
+def test_round_trip(payload, compress):
+    assert decode(encode(payload, compress=compress)) == payload
+
+
+def test_integers_stay_integers():
+    data = decode(encode(SETTLEMENT))
+    assert data["entry_price"] == 60 and isinstance(data["entry_price"], int)
+    assert isinstance(data["final_price"], float)
+
+
+def test_enum_values_outside_the_choices():
+    payload = dict(PURCHASE, status="refunded")
+    assert decode(encode(payload)) == payload
+
+
+@pytest.mark.parametrize("amount", [float("inf"), float("-inf"), float("nan"),
+                                    1e300, memo_codec.MAX_NUM, -10 ** 20])
+def test_unencodable_numbers_fall_back_to_v1(amount):
+    assert encode(dict(PURCHASE, amount=amount)) is None
+
+
+def test_payloads_off_schema_fall_back_to_v1():
+    assert encode(dict(PURCHASE, extra=1)) is None
+    assert encode({k: v for k, v in PURCHASE.items() if k != "icon"}) is None
+    assert encode(dict(PURCHASE, user_id=-1)) is None
+    assert encode(dict(PURCHASE, timestamp="2026-02-07T17:40:12+00:00")) is None
+    assert encode({"type": "UNKNOWN"}) is None
+
+
+def test_malformed_bytes_raise():
+    data = encode(PURCHASE, compress=False)
+    with pytest.raises(MemoCodecError):
+        decode(data[:-3])
+    with pytest.raises(MemoCodecError):
+        decode(data + b"\x00")
@@ -0,0 +1,82 @@
+import binascii
+import json
+
+import pytest
+
+from ledger_index import LedgerIndex, decode_cursor, encode_cursor
+
+ACCOUNT = "rCompany"
+
+
+# Payloads are cached by tx hash process-wide, so every test uses its own hashes
+def item(tx_hash, ledger_index, tx_index, *payloads):
+    return {
+        "hash": tx_hash,
+        "ledger_index": ledger_index,
+        "validated": True,
+        "tx_json": {"TransactionType": "AccountSet", "Memos": [
+            {"Memo": {"MemoData": binascii.hexlify(json.dumps(p).encode()).decode()}}
+            for p in payloads
+        ]},
+        "meta": {"TransactionIndex": tx_index, "TransactionResult": "tesSUCCESS"},
+    }
+
+
+def purchase(n):
+    return {"type": "PURCHASE", "user_id": 1, "purchase_id": f"p{n}"}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LedgerIndex(str(tmp_path / "index.db"))
+    # Two transactions in one ledger, and one transaction carrying three memos
+    index.ingest(ACCOUNT, [
+        item("PAGE1", 10, 0, purchase(1)),
+        item("PAGE2", 11, 0, purchase(2), purchase(3), purchase(4)),
+        item("PAGE3", 11, 4, purchase(5)),
+        item("PAGE4", 12, 0, purchase(6)),
+    ])
+    yield index
+    index.close()
+
+
+def walk(fetch, limit, keys):
+    """Follow cursors the way the API does: fetch limit + 1, cut, encode the last row."""
+    pages, after = [], None
+    while True:
+        rows = fetch(limit + 1, after)
+        pages.append(rows[:limit])
+        if len(rows) <= limit:
+            return pages
+        cursor = encode_cursor(*(rows[limit - 1][k] for k in keys))
+        after = decode_cursor(cursor, len(keys))
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(12, 4, 0), 3) == (12, 4, 0)
+    assert decode_cursor(encode_cursor(0, 0), 2) == (0, 0)
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", encode_cursor(1, 2), "MTphOjM"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 3)
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 6, 10])
+def test_user_event_pages_cover_everything_once(index, limit):
+    pages = walk(lambda n, after: index.user_events(ACCOUNT, 1, limit=n, after=after),
+                 limit, ("ledger_index", "tx_index", "memo_index"))
+    ids = [e["data"]["purchase_id"] for page in pages for e in page]
+    assert ids == ["p6", "p5", "p2", "p3", "p4", "p1"]
+    assert all(len(page) == limit for page in pages[:-1])
+    assert pages[-1] or len(pages) == 1
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4])
+def test_feed_pages_split_inside_a_batched_transaction(index, limit):
+    pages = walk(lambda n, after: index.recent_transactions(ACCOUNT, n, after=after),
+                 limit, ("ledger_index", "tx_index", "memo_index"))
+    entries = [(e["hash"], e["memo_index"]) for page in pages for e in page]
+    assert entries == [("PAGE4", 0), ("PAGE3", 0), ("PAGE2", 0), ("PAGE2", 1),
+                       ("PAGE2", 2), ("PAGE1", 0)]
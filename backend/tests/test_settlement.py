@@ -0,0 +1,42 @@
+from settlement import compute_settlement, needs_payment
+
+POSITION = {
+    "position_id": "pos-1",
+    "market_ticker": "XRP-1.40",
+    "direction": "YES",
+    "entry_price": 60,
+    "purchase_amount": 100.0,
+    "max_reward_pct": 20,
+    "max_loss_pct": 5,
+}
+
+
+def test_price_move_without_result():
+    settlement = compute_settlement(POSITION, 66)
+    assert settlement["outcome"] == "win"
+    assert settlement["roi"] == 10
+    assert settlement["cashback_amount"] == 10.0
+
+
+def test_result_win_with_price_below_entry():
+    # Resolved YES, but the last traded price is under the entry price
+    settlement = compute_settlement(POSITION, 40, result="YES")
+    assert settlement["outcome"] == "win"
+    assert settlement["roi"] == 20
+    assert settlement["cashback_amount"] == 20.0
+    assert needs_payment(settlement)
+
+
+def test_result_loss_with_price_above_entry():
+    settlement = compute_settlement(POSITION, 90, result="NO")
+    assert settlement["outcome"] == "loss"
+    assert settlement["roi"] == -5
+    assert settlement["cashback_amount"] == -5.0
+    assert not needs_payment(settlement)
+
+
+def test_no_position_follows_result():
+    position = dict(POSITION, direction="NO")
+    settlement = compute_settlement(position, 90, result="no")
+    assert settlement["outcome"] == "win"
+    assert settlement["cashback_amount"] == 20.0
@@ -0,0 +1,173 @@
+"""
+Winback Ticket Pool
+===================
+Pre-provisioned XRPL Tickets for the company wallet.
+
+With plain sequence numbers a stuck transaction blocks every later one from
+the same account. A Ticket reserves a sequence number in advance, and
+transactions using different Tickets succeed or fail independently.
+
+The pool creates Tickets in bulk with `TicketCreate`, hands them out to the
+submission engine, and refills in the background once the number of free
+Tickets drops below the refill threshold. On every refill pass the free set
+is reconciled against the account's Ticket objects on the ledger.
+
+When several worker processes sign for the wallet, the free/in-use sets
+live in SQLite instead (`shared`, see shared_state.py) and only the leader
+worker runs the refill loop.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+from xrpl.models.requests import AccountObjects
+from xrpl.models.requests.account_objects import AccountObjectType
+from xrpl.models.transactions import TicketCreate
+
+MAX_TICKETS_PER_ACCOUNT = 250
+REFILL_CHECK_SECONDS = 5.0
+
+
+class TicketPool:
+    """Free/in-use bookkeeping and background refill of Tickets for one wallet."""
+
+    def __init__(self, engine, depth: int = 20, refill_threshold: int = 5, shared=None):
+        self.engine = engine
+        self.depth = min(depth, MAX_TICKETS_PER_ACCOUNT)
+        self.refill_threshold = refill_threshold
+        self.shared = shared  # optional SharedState (see shared_state.py)
+
+        self._free: List[int] = []
+        self._in_use: Set[int] = set()
+        self._refill_needed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.refills = 0
+        self.tickets_created = 0
+        self.tickets_consumed = 0
+        self.last_error: Optional[str] = None
+
+    # --- Allocation ---
+    def _counts(self) -> Dict[str, int]:
+        if self.shared is not None:
+            return self.shared.ticket_counts(self.engine.wallet.address)
+        return {"free": len(self._free), "in_use": len(self._in_use)}
+
+    def try_acquire(self) -> Optional[int]:
+        """Take a free Ticket, or None if the pool is empty."""
+        if self.shared is not None:
+            return self.shared.reserve_ticket(self.engine.wallet.address)
+        if len(self._free) <= self.refill_threshold:
+            self._refill_needed.set()
+        if not self._free:
+            return None
+        ticket = self._free.pop(0)
+        self._in_use.add(ticket)
+        return ticket
+
+    def release(self, ticket: int, consumed: bool):
+        """Return a Ticket after its transaction finished (or never made it in)."""
+        self._in_use.discard(ticket)
+        if consumed:
+            self.tickets_consumed += 1
+        if self.shared is not None:
+            self.shared.release_ticket(self.engine.wallet.address, ticket, consumed)
+        elif not consumed and ticket not in self._free:
+            self._free.append(ticket)
+
+    # --- Ledger sync ---
+    async def _ledger_tickets(self) -> List[int]:
+        """All Ticket sequences the account currently owns."""
+        tickets = []
+        marker = None
+        while True:
+            response = await self.engine.client.request(AccountObjects(
+                account=self.engine.wallet.address,
+                type=AccountObjectType.TICKET,
+                ledger_index="validated",
+                marker=marker
+            ))
+            if not response.is_successful():
+                raise Exception(f"AccountObjects failed: {response.result}")
+            tickets.extend(
+                obj["TicketSequence"] for obj in response.result.get("account_objects", [])
+            )
+            marker = response.result.get("marker")
+            if not marker:
+                return sorted(tickets)
+
+    async def refill(self):
+        """Reconcile with the ledger and create Tickets up to the target depth."""
+        owned = await self._ledger_tickets()
+        if self.shared is not None:
+            self.shared.reconcile_tickets(self.engine.wallet.address, owned)
+        else:
+            self._free = [t for t in owned if t not in self._in_use]
+
+        counts = self._counts()
+        missing = self.depth - counts["free"] - counts["in_use"]
+        missing = min(missing, MAX_TICKETS_PER_ACCOUNT - len(owned))
+        if missing <= 0:
+            return
+
+        print(f"🎟️ Creating {missing} tickets for {self.engine.wallet.address}...")
+        response = await self.engine.submit_and_wait(
+            TicketCreate(account=self.engine.wallet.address, ticket_count=missing),
+            use_ticket=False
+        )
+        # Tickets take the sequence numbers right after the TicketCreate's own
+        sequence = response.result.get("tx_json", response.result)["Sequence"]
+        created = list(range(sequence + 1, sequence + 1 + missing))
+        if self.shared is not None:
+            self.shared.add_tickets(self.engine.wallet.address, created)
+        else:
+            self._free.extend(t for t in created if t not in self._free)
+        self.tickets_created += missing
+        self.refills += 1
+        print(f"✅ Ticket pool depth: {self._counts()['free']}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refill()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Ticket refill failed: {e}")
+
+            # Rate-limit refills, then sleep until the pool runs low again
+            await asyncio.sleep(REFILL_CHECK_SECONDS)
+            while self._counts()["free"] > self.refill_threshold:
+                self._refill_needed.clear()
+                if self.shared is None:
+                    await self._refill_needed.wait()
+                    continue
+                # Other workers draw Tickets too without waking us, so check periodically
+                try:
+                    await asyncio.wait_for(self._refill_needed.wait(), REFILL_CHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "account": self.engine.wallet.address,
+            **self._counts(),
+            "target_depth": self.depth,
+            "refill_threshold": self.refill_threshold,
+            "refills": self.refills,
+            "tickets_created": self.tickets_created,
+            "tickets_consumed": self.tickets_consumed,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,229 @@
+"""
+Winback Request Tracing
+=======================
+Lightweight spans for following one request through the handler, the XRPL
+client and memo decoding.
+
+Each HTTP request gets a trace (its ID comes from an incoming `X-Trace-Id`
+header or is generated, and is returned in the `X-Trace-Id` response
+header). Code on the request's path opens spans with
+
+    with tracing.span("index.user_events", user_id=user_id):
+        ...
+
+The current span lives in a contextvar, so it follows the request into
+awaited coroutines and tasks started from it. Hot paths that run thousands
+of times per request (memo decoding, timestamp conversion) don't open spans.
+They add to per-trace totals with `tracing.accumulate(name, seconds)` or the
+`@tracing.timed(name)` decorator instead.
+
+Finished traces are kept in a bounded in-memory buffer for `/debug/traces`.
+A request slower than the slow threshold also prints a one-line breakdown.
+"""
+
+import functools
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+TRACE_BUFFER_SIZE = int(os.environ.get("WINBACK_TRACE_BUFFER", "500"))
+SLOW_TRACE_SECONDS = float(os.environ.get("WINBACK_TRACE_SLOW_MS", "2000")) / 1000
+MAX_SPANS_PER_TRACE = 2000
+
+_TRACE_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "duration", "attrs", "error")
+
+    def __init__(self, name: str, parent_id: Optional[int], attrs: Dict[str, Any]):
+        self.name = name
+        self.span_id = 0
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attrs = attrs
+        self.error: Optional[str] = None
+
+
+class Trace:
+    """All spans recorded for one request."""
+
+    def __init__(self, trace_id: str, name: str):
+        self.trace_id = trace_id
+        self.name = name
+        self.started_at = time.time()
+        self.root = Span(name, None, {})
+        self.spans: List[Span] = [self.root]
+        self.totals: Dict[str, List[float]] = {}  # name -> [count, seconds]
+        self.dropped = 0
+
+    @property
+    def duration(self) -> float:
+        if self.root.duration is not None:
+            return self.root.duration
+        return time.perf_counter() - self.root.start
+
+    def add(self, span: Span) -> bool:
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped += 1
+            return False
+        span.span_id = len(self.spans)
+        self.spans.append(span)
+        return True
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "spans": len(self.spans),
+            "error": self.root.error,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        origin = self.root.start
+        return dict(self.summary(), **{
+            "span_tree": [{
+                "id": s.span_id,
+                "parent": s.parent_id,
+                "name": s.name,
+                "start_ms": round((s.start - origin) * 1000, 3),
+                "duration_ms": round(s.duration * 1000, 3) if s.duration is not None else None,
+                "attrs": s.attrs,
+                "error": s.error,
+            } for s in self.spans],
+            "totals": {name: {"count": int(c), "ms": round(t * 1000, 3)}
+                       for name, (c, t) in sorted(self.totals.items())},
+            "dropped_spans": self.dropped,
+        })
+
+    def breakdown(self, top: int = 5) -> str:
+        """Slowest spans and totals, e.g. for a log line."""
+        parts = sorted(
+            [(s.duration or 0, s.name) for s in self.spans[1:]]
+            + [(t, f"{name} x{int(c)}") for name, (c, t) in self.totals.items()],
+            reverse=True
+        )[:top]
+        return ", ".join(f"{name} {seconds * 1000:.0f}ms" for seconds, name in parts)
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("winback_trace", default=None)
+_span: ContextVar[Optional[Span]] = ContextVar("winback_span", default=None)
+
+_lock = threading.Lock()
+recent: Deque[Trace] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def new_trace_id(requested: Optional[str] = None) -> str:
+    """The caller's trace ID if it looks sane, otherwise a fresh one."""
+    if requested and _TRACE_ID.match(requested):
+        return requested
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def trace(name: str, trace_id: Optional[str] = None) -> Iterator[Trace]:
+    """Start a trace for one request and make it current."""
+    current = Trace(trace_id or new_trace_id(), name)
+    trace_token = _trace.set(current)
+    span_token = _span.set(current.root)
+    try:
+        yield current
+    except BaseException as e:
+        current.root.error = type(e).__name__
+        raise
+    finally:
+        current.root.duration = time.perf_counter() - current.root.start
+        _span.reset(span_token)
+        _trace.reset(trace_token)
+        with _lock:
+            recent.append(current)
+        if current.duration >= SLOW_TRACE_SECONDS:
+            print(f"🐢 Slow request {current.name}: {current.duration * 1000:.0f}ms "
+                  f"trace={current.trace_id} ({current.breakdown()})")
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """Time a block as a child of the current span (no-op outside a trace)."""
+    current = _trace.get()
+    if current is None:
+        yield None
+        return
+    parent = _span.get()
+    child = Span(name, parent.span_id if parent is not None else None, attrs)
+    if not current.add(child):
+        yield None
+        return
+    token = _span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.duration = time.perf_counter() - child.start
+        _span.reset(token)
+
+
+def active() -> bool:
+    return _trace.get() is not None
+
+
+def accumulate(name: str, seconds: float, count: int = 1):
+    """Add to a per-trace total instead of opening a span (for hot loops)."""
+    current = _trace.get()
+    if current is None:
+        return
+    totals = current.totals.get(name)
+    if totals is None:
+        current.totals[name] = [count, seconds]
+    else:
+        totals[0] += count
+        totals[1] += seconds
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorator: add each call's time to the current trace's `name` total."""
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _trace.get() is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                accumulate(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def get(trace_id: str) -> Optional[Trace]:
+    with _lock:
+        for t in reversed(recent):
+            if t.trace_id == trace_id:
+                return t
+    return None
+
+
+def find(limit: int = 50, min_seconds: float = 0.0, name: Optional[str] = None) -> List[Trace]:
+    """Most recent finished traces, newest first."""
+    with _lock:
+        traces = list(recent)
+    matches = [t for t in reversed(traces)
+               if t.duration >= min_seconds and (name is None or name in t.name)]
+    return matches[:limit]
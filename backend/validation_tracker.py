@@ -0,0 +1,328 @@
+"""
+Winback Validation Tracker
+==========================
+One watcher for every submitted transaction that is waiting on validation.
+
+`SubmissionEngine.wait` used to poll `Tx` once a second for each of its
+transactions, and on every miss it also asked for the latest validated
+ledger. With 500 transactions in flight, that was 500 polling loops and
+about 1000 RPCs a second. The tracker keeps one table of pending hashes
+and follows the validated ledger instead:
+
+- Each new validated ledger index comes from the ledger subscription
+  while it is live (`ledger_closed`). Otherwise the tracker polls
+  `Ledger("validated")`, and only while something is pending. It learns
+  the close interval from the indexes it sees, polls shortly before the
+  next expected close, and retries every `poll_interval` until it has
+  closed. Until it has seen two closes it polls every `poll_interval`.
+- Each ledger closed since the last pass is fetched once with its
+  transactions (`transactions` and `expand`), and every pending hash
+  found in it is resolved. When polling, the request that reports the
+  latest ledger is that fetch, so one RPC per pass is the usual cost.
+- Validated transactions pushed by the subscription (`observe`) resolve
+  their waiter without any lookup.
+- A transaction that is in none of those ledgers once the validated
+  ledger reaches its LastLedgerSequence gets one last `Tx` lookup. If
+  that doesn't find it validated either, it expires.
+
+So the cost no longer depends on how many transactions are pending. If a
+ledger can't be fetched, each transaction whose window covers it gets one
+`Tx` lookup for that pass instead.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from xrpl.models.requests import Ledger, Tx
+from xrpl.models.response import Response, ResponseStatus
+
+# Poll delay until the close interval is known, and when a close is late
+POLL_INTERVAL_SECONDS = 0.25
+CLOSE_INTERVAL_WEIGHT = 0.2  # moving average of the observed close interval
+# While the subscription is live closes are pushed; poll only if it goes quiet
+STREAM_FALLBACK_SECONDS = 10.0
+LEDGER_CACHE_SIZE = 64
+MAX_LEDGERS_PER_PASS = 20
+
+
+class TransactionExpired(Exception):
+    """The validated ledger passed the transaction's LastLedgerSequence without it."""
+
+    def __init__(self, tx_hash: str, latest: int, last_ledger_sequence: int):
+        super().__init__(f"{tx_hash} expired at ledger {latest}")
+        self.tx_hash = tx_hash
+        self.latest = latest
+        self.last_ledger_sequence = last_ledger_sequence
+
+
+class _Pending:
+    __slots__ = ("hash", "last_ledger_sequence", "next_ledger", "future")
+
+    def __init__(self, tx_hash: str, last_ledger_sequence: int, first_ledger: int,
+                 future: asyncio.Future):
+        self.hash = tx_hash
+        self.last_ledger_sequence = last_ledger_sequence
+        self.next_ledger = first_ledger  # first ledger not yet checked for this hash
+        self.future = future
+
+
+def _entry_hash(entry: Dict[str, Any]) -> Optional[str]:
+    # API v2 nests the transaction under tx_json, v1 streams under transaction
+    return (entry.get("hash") or (entry.get("tx_json") or {}).get("hash")
+            or (entry.get("transaction") or {}).get("hash"))
+
+
+def _validated_response(entry: Dict[str, Any], ledger_index: int,
+                        close_time: Optional[int]) -> Response:
+    """A `Tx`-shaped response for a transaction taken from a ledger's list."""
+    result = dict(entry)
+    if "meta" not in result and "metaData" in result:
+        result["meta"] = result.pop("metaData")
+    result.setdefault("ledger_index", ledger_index)
+    if close_time is not None and "date" not in (result.get("tx_json") or result):
+        result["date"] = close_time
+    result["validated"] = True
+    return Response(status=ResponseStatus.SUCCESS, result=result)
+
+
+class ValidationTracker:
+    """Resolves the validation of every pending transaction once per ledger close."""
+
+    def __init__(self, client, poll_interval: float = POLL_INTERVAL_SECONDS,
+                 live: Callable[[], bool] = lambda: False):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.live = live  # whether ledger closes are being pushed (ledger_closed)
+
+        self._pending: Dict[str, _Pending] = {}
+        # ledger index -> (close time, hash -> transaction)
+        self._ledgers: "OrderedDict[int, Tuple[Optional[int], Dict[str, Any]]]" = OrderedDict()
+        self._pushed_ledger = 0
+        self._closed_at = 0.0  # monotonic time the validated ledger last advanced
+        self._close_interval: Optional[float] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.tracked = 0
+        self.resolved = 0
+        self.pushed = 0
+        self.expired = 0
+        self.passes = 0
+        self.ledgers_fetched = 0
+        self.tx_lookups = 0
+        self.last_ledger = 0
+        self.last_error: Optional[str] = None
+
+    # --- Waiters ---
+    async def wait(self, tx_hash: str, last_ledger_sequence: int, first_ledger: int) -> Response:
+        """
+        Wait until `tx_hash` is in a validated ledger (any result code) and return
+        it as a `Tx` response. `first_ledger` is the earliest ledger it can be in.
+        Raises TransactionExpired once LastLedgerSequence has passed without it.
+        """
+        pending = self._pending.get(tx_hash)
+        if pending is None:
+            pending = _Pending(tx_hash, last_ledger_sequence, first_ledger,
+                               asyncio.get_running_loop().create_future())
+            idle = not self._pending
+            self._pending[tx_hash] = pending
+            self.tracked += 1
+            self.start()
+            if idle:
+                self._wakeup.set()
+        try:
+            return await asyncio.shield(pending.future)
+        finally:
+            if pending.future.done() and self._pending.get(tx_hash) is pending:
+                del self._pending[tx_hash]
+
+    def _resolve(self, pending: _Pending, response: Response):
+        if not pending.future.done():
+            pending.future.set_result(response)
+            self.resolved += 1
+        self._pending.pop(pending.hash, None)
+
+    def _expire(self, pending: _Pending, latest: int):
+        if not pending.future.done():
+            pending.future.set_exception(
+                TransactionExpired(pending.hash, latest, pending.last_ledger_sequence)
+            )
+            pending.future.exception()  # the waiter may have been cancelled
+            self.expired += 1
+        self._pending.pop(pending.hash, None)
+
+    # --- Pushed updates ---
+    def ledger_closed(self, ledger_index: int):
+        """A validated ledger close from the subscription."""
+        if ledger_index > self._pushed_ledger:
+            self._pushed_ledger = ledger_index
+            if self._wakeup is not None and self._pending:
+                self._wakeup.set()
+
+    def observe(self, message: Dict[str, Any]):
+        """A validated transaction from the subscription."""
+        pending = self._pending.get(_entry_hash(message) or "")
+        if pending is not None and message.get("validated"):
+            self.pushed += 1
+            self._resolve(pending, _validated_response(message, message.get("ledger_index", 0), None))
+
+    # --- Ledger passes ---
+    async def _fetch(self, ledger_index: Union[int, str]) -> Optional[int]:
+        """Fetch a validated ledger's transactions into the cache. Returns its index."""
+        response = await self.client.request(Ledger(
+            ledger_index=ledger_index, transactions=True, expand=True
+        ))
+        if not response.is_successful() or not response.result.get("validated"):
+            return None
+        ledger = response.result.get("ledger", {})
+        index = int(response.result.get("ledger_index") or ledger["ledger_index"])
+        self.ledgers_fetched += 1
+        self._ledgers[index] = (ledger.get("close_time"), {
+            _entry_hash(tx): tx for tx in ledger.get("transactions", []) if isinstance(tx, dict)
+        })
+        while len(self._ledgers) > LEDGER_CACHE_SIZE:
+            self._ledgers.popitem(last=False)
+        return index
+
+    async def _latest(self) -> int:
+        if self.live() and self._pushed_ledger:
+            return self._pushed_ledger
+        latest = await self._fetch("validated")
+        if latest is None:
+            raise Exception("Validated ledger unavailable")
+        return latest
+
+    async def _ledger(self, ledger_index: int) -> Optional[Tuple[Optional[int], Dict[str, Any]]]:
+        """(close time, hash -> transaction) for a validated ledger, or None if unavailable."""
+        if ledger_index not in self._ledgers and await self._fetch(ledger_index) is None:
+            return None
+        return self._ledgers[ledger_index]
+
+    async def _lookup(self, pending: _Pending) -> bool:
+        """Fallback `Tx` lookup for one hash. Returns whether it resolved."""
+        self.tx_lookups += 1
+        response = await self.client.request(Tx(transaction=pending.hash))
+        if response.is_successful() and response.result.get("validated"):
+            self._resolve(pending, response)
+            return True
+        return False
+
+    async def _pass(self):
+        latest = await self._latest()
+        self.passes += 1
+        if latest > self.last_ledger:
+            self._advanced(latest)
+
+        waiting = [p for p in self._pending.values() if not p.future.done()]
+        if not waiting:
+            return
+        start = min(p.next_ledger for p in waiting)
+        end = min(latest, start + MAX_LEDGERS_PER_PASS - 1)
+
+        for ledger_index in range(start, end + 1):
+            covered = [p for p in waiting if p.next_ledger <= ledger_index and not p.future.done()]
+            if not covered:
+                continue
+            ledger = await self._ledger(ledger_index)
+            if ledger is None:
+                # Can't see this ledger: ask about each affected hash directly
+                for pending in covered:
+                    if not await self._lookup(pending):
+                        pending.next_ledger = latest + 1
+                continue
+            close_time, transactions = ledger
+            for pending in covered:
+                tx = transactions.get(pending.hash)
+                if tx is not None:
+                    self._resolve(pending, _validated_response(tx, ledger_index, close_time))
+                else:
+                    pending.next_ledger = ledger_index + 1
+
+        for pending in waiting:
+            if pending.future.done() or latest < pending.last_ledger_sequence:
+                continue
+            if pending.next_ledger <= pending.last_ledger_sequence:
+                continue  # not every ledger in its window has been checked yet
+            # Last look in case it validated in a ledger we saw before it was tracked
+            if not await self._lookup(pending):
+                self._expire(pending, latest)
+
+    def _advanced(self, latest: int):
+        now = time.monotonic()
+        if not self.last_ledger:
+            # First sighting: the ledger closed some time before this poll
+            self.last_ledger = latest
+            return
+        if self._closed_at:
+            interval = (now - self._closed_at) / (latest - self.last_ledger)
+            if self._close_interval is None:
+                self._close_interval = interval
+            else:
+                self._close_interval += CLOSE_INTERVAL_WEIGHT * (interval - self._close_interval)
+        self._closed_at = now
+        self.last_ledger = latest
+
+    def _poll_delay(self) -> float:
+        """Seconds until the next poll: shortly before the next expected ledger close."""
+        if self._close_interval is None:
+            return self.poll_interval
+        # Closes are only seen when a poll finds them, so aim one poll_interval early and
+        # retry every poll_interval: each close is then seen within poll_interval, instead
+        # of the schedule drifting later with every close
+        expected = self._closed_at + self._close_interval
+        return max(self.poll_interval, expected - self.poll_interval - time.monotonic())
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # Nothing new can validate before the next close: wait for a pushed
+            # close, or for when the next one is expected
+            self._wakeup.clear()
+            timeout = STREAM_FALLBACK_SECONDS if self.live() else self._poll_delay()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            if not self._pending:
+                continue
+
+            try:
+                await self._pass()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Validation tracker pass failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "tracked": self.tracked,
+            "resolved": self.resolved,
+            "resolved_from_stream": self.pushed,
+            "expired": self.expired,
+            "passes": self.passes,
+            "ledgers_fetched": self.ledgers_fetched,
+            "tx_lookups": self.tx_lookups,
+            "last_validated_ledger": self.last_ledger,
+            "close_interval_ms": (round(self._close_interval * 1000)
+                                  if self._close_interval is not None else None),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,163 @@
+"""
+Winback Wallet Pool
+===================
+Pre-funded user wallets, so new users don't wait on the testnet faucet.
+
+Creating a wallet with `generate_faucet_wallet` takes several seconds (the
+faucet funds the account and we wait for it to show up on a validated
+ledger), and a burst of sign-ups would hit the faucet all at once. The pool
+keeps a stock of already funded and activated wallets: when the stock drops
+to the low-water mark a background task tops it back up to the target depth,
+a few faucet calls at a time. New users take a wallet from the pool
+instantly and only fall back to the faucet inline when the pool is empty.
+
+When several worker processes share one stock (`restock`, e.g. the pool
+wallets in the keystore), a worker re-reads it whenever its own copy runs
+dry, and only one worker runs the top-up loop. That loop counts the shared
+stock, not its own copy.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+FAUCET_CONCURRENCY = 2
+FILL_RATE_WINDOW_SECONDS = 300.0
+RETRY_SECONDS = 10.0
+
+
+class WalletPool:
+    """Background-replenished stock of funded wallets."""
+
+    def __init__(self, client, faucet: Callable[[Any], Awaitable[Any]],
+                 depth: int = 5, low_water: int = 2,
+                 concurrency: int = FAUCET_CONCURRENCY):
+        self.client = client
+        self.faucet = faucet
+        self.depth = depth
+        self.low_water = low_water
+        self.concurrency = concurrency
+
+        self._wallets: List[Any] = []
+        self._low = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._funded_at: Deque[float] = deque()
+        # Called with each newly funded wallet (e.g. to persist it)
+        self.listeners: List[Callable[[Any], None]] = []
+        # Reads the stock shared with other processes; None keeps it in memory only
+        self.restock: Optional[Callable[[], List[Any]]] = None
+
+        self.wallets_created = 0
+        self.served_from_pool = 0
+        self.served_inline = 0
+        self.faucet_failures = 0
+        self.faucet_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    # --- Allocation ---
+    async def take(self):
+        """A funded wallet: from the pool if possible, else straight from the faucet."""
+        if not self._wallets and self.restock is not None:
+            self._wallets = self.restock()
+        if len(self._wallets) - 1 <= self.low_water:
+            self._low.set()
+        if self._wallets:
+            self.served_from_pool += 1
+            return self._wallets.pop(0)
+        self.served_inline += 1
+        return await self._create()
+
+    def put_back(self, wallet):
+        """Return a wallet that was taken but not assigned."""
+        self._wallets.insert(0, wallet)
+
+    def add(self, wallets: List[Any]):
+        """Stock the pool with wallets funded earlier (e.g. loaded from the keystore)."""
+        self._wallets.extend(wallets)
+
+    async def _create(self):
+        started = time.monotonic()
+        try:
+            wallet = await self.faucet(self.client)
+        except Exception:
+            self.faucet_failures += 1
+            raise
+        self.faucet_seconds += time.monotonic() - started
+        self.wallets_created += 1
+        self._funded_at.append(time.monotonic())
+        for listener in self.listeners:
+            listener(wallet)
+        return wallet
+
+    # --- Replenishment ---
+    async def fill(self):
+        """Fund wallets until the pool is back at its target depth."""
+        if self.restock is not None:
+            self._wallets = self.restock()
+        while len(self._wallets) < self.depth:
+            batch = min(self.concurrency, self.depth - len(self._wallets))
+            results = await asyncio.gather(
+                *(self._create() for _ in range(batch)), return_exceptions=True
+            )
+            errors = [r for r in results if isinstance(r, Exception)]
+            self._wallets.extend(r for r in results if not isinstance(r, Exception))
+            if errors:
+                raise errors[0]
+
+    async def _run(self):
+        while True:
+            try:
+                await self.fill()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Wallet pool refill failed: {e}")
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+
+            # Sleep until a take() brings the pool down to the low-water mark
+            while len(self._wallets) > min(self.low_water, self.depth - 1):
+                self._low.clear()
+                if self.restock is None:
+                    await self._low.wait()
+                    continue
+                # Other processes take wallets without waking us, so re-count periodically
+                try:
+                    await asyncio.wait_for(self._low.wait(), RETRY_SECONDS)
+                except asyncio.TimeoutError:
+                    self._wallets = self.restock()
+
+    def start(self):
+        if self._task is None and self.depth > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def fill_rate(self) -> float:
+        """Wallets funded per minute over the recent window."""
+        cutoff = time.monotonic() - FILL_RATE_WINDOW_SECONDS
+        while self._funded_at and self._funded_at[0] < cutoff:
+            self._funded_at.popleft()
+        return len(self._funded_at) * 60.0 / FILL_RATE_WINDOW_SECONDS
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": len(self._wallets),
+            "target_depth": self.depth,
+            "low_water": self.low_water,
+            "fill_rate_per_minute": round(self.fill_rate(), 2),
+            "wallets_created": self.wallets_created,
+            "served_from_pool": self.served_from_pool,
+            "served_inline": self.served_inline,
+            "faucet_failures": self.faucet_failures,
+            "avg_faucet_seconds": round(self.faucet_seconds / self.wallets_created, 2)
+                                  if self.wallets_created else None,
+            "last_error": self.last_error,
+        }